@@ -9,11 +9,21 @@ using browser via selenium.
 """
 import typing
 import os
+import codecs
 from pathlib import Path
 import sys
 import re
 import subprocess
+import asyncio
+import threading
+import time
+import concurrent.futures
 from paths import Url,UrlCompatible
+from .fetchScheduler import FetchScheduler,hostOf,normalizeUrl
+from .politeness import PolitenessLimiter
+from .domainRegistry import DomainRegistry
+from .seleniumPool import SeleniumSessionPool
+from .singleFlight import SingleFlight
 lastSeleniumPort:int=4000
 hasJavascriptTricksRE:typing.Pattern=None
 
@@ -25,11 +35,114 @@ WebFetchCallback=typing.Union[
     typing.Callable[[Url,str],None]]
 
 
+# a queued item is (fn,urlOrHtml,returnSeleniumObject,stream)
+WebFetchItem=typing.Tuple[
+    WebFetchCallback,typing.Union[UrlCompatible,str],bool,typing.Optional[str]]
+
+STREAM_CHUNKS='chunks' # callback gets fn(url,iterator of bytes chunks)
+STREAM_FILE='file' # callback gets fn(url,readable file-like object)
+
+
 hasJavascriptTricksRE=re.compile(
     r"""(innerhtml\s*=)|(document[.]write\s*\()|(<script[^>]*src="[^"]+"[^>]*>)""", # noqa: E501 # pylint: disable=line-too-long
     re.IGNORECASE)
 
 
+class JavascriptTrickDetector:
+    """
+    Looks for javascript tricks in a page as it streams in,
+    so we can stop as soon as we know.
+
+    USAGE:
+        detector=JavascriptTrickDetector()
+        for chunk in chunks:
+            if detector.feed(chunk) is not None:
+                break
+        if detector.found:
+            ...
+    """
+
+    # how much of the previous chunk to re-scan in case a match
+    # straddles the boundary (the script tag is carried over whole,
+    # from its "<", however long it is)
+    OVERLAP:int=64
+    # but an unclosed "<" is only carried this far (so a stray one,
+    # like "a < b" in a script, does not make us re-scan everything)
+    MAX_TAG:int=64*1024
+
+    def __init__(self,classifyLimit:typing.Optional[int]=None):
+        """
+        :param classifyLimit: if set, stop looking (and call it clean)
+            once the </head> and at least this many bytes
+            have gone by without a match
+        """
+        self.classifyLimit:typing.Optional[int]=classifyLimit
+        self.found:bool=False
+        self.done:bool=False
+        self._tail:str=''
+        self._seen:int=0
+        self._headDone:bool=False
+
+    def feed(self,
+        chunk:str,
+        size:typing.Optional[int]=None
+        )->typing.Optional[bool]:
+        """
+        scan the next chunk of the page
+
+        :param size: how many bytes the chunk was before it was decoded
+            (for classifyLimit - if None, len(chunk))
+        :return: True if tricks were found, False if we are sure there
+            are none, or None if we can't tell yet
+        """
+        if self.done:
+            return self.found
+        text=self._tail+chunk
+        if hasJavascriptTricksRE.search(text) is not None:
+            self.found=True
+            self.done=True
+            return True
+        self._seen+=len(chunk) if size is None else size
+        if self.classifyLimit is not None:
+            if not self._headDone:
+                self._headDone=text.lower().find('</head')>=0
+            if self._headDone and self._seen>=self.classifyLimit:
+                self.done=True
+                return False
+        self._tail=text[self._tailStart(text):]
+        return None
+
+    def _tailStart(self,text:str)->int:
+        """
+        where the part of the text that could still be the start of
+        a match begins
+        """
+        # (whitespace can go on for a while in "document.write  (")
+        start=len(text.rstrip())-self.OVERLAP
+        # the first "<" after the last ">" starts a tag still coming in
+        tag=text.find('<',text.rfind('>')+1)
+        if tag>=0:
+            start=min(start,max(tag,len(text)-self.MAX_TAG))
+        return max(start,0)
+
+    def close(self)->bool:
+        """
+        the page is over
+
+        :return: whether tricks were found
+        """
+        self.done=True
+        return self.found
+
+
+def _looksLikeUrl(urlOrHtml:typing.Union[UrlCompatible,str])->bool:
+    """
+    determine whether we were handed a url or the html itsself
+    """
+    urlDenotationPos=str(urlOrHtml).find('://')
+    return 3<=urlDenotationPos<=7
+
+
 class WebFetch:
     """
     Fetches a web resource.
@@ -45,7 +158,15 @@ class WebFetch:
         remoteIp:typing.Optional[str]=None,
         port:typing.Optional[int]=None,
         startSeleniumNow:bool=False,
-        noSelenium:bool=False):
+        noSelenium:bool=False,
+        maxConcurrency:int=8,
+        threadWorkers:typing.Optional[int]=None,
+        politeness:typing.Optional[PolitenessLimiter]=None,
+        trickyDomainsFile:typing.Optional[str]=None,
+        maxSeleniumSessions:int=4,
+        maxPagesPerSeleniumSession:int=50,
+        jsDetectLimitKB:typing.Optional[float]=None,
+        seleniumSessionFactory:typing.Optional[typing.Callable[[str],typing.Any]]=None): # noqa: E501 # pylint: disable=line-too-long
         """
         If remoteIp is unspecified, will automatically create a local selenium
         server and attach to it
@@ -54,6 +175,25 @@ class WebFetch:
             be using selenium
         :param noSelenium: will force the simple html even if javascript tricks
             are detected
+        :param maxConcurrency: how many fetches runAll()/runAllAsync() may
+            have in flight at once (1 means strictly one after another)
+        :param threadWorkers: if set, runAll() dispatches the queue on a
+            thread pool of this many workers instead of using asyncio
+            (for callers that cannot have an event loop)
+        :param politeness: per-host rate limits and robots.txt rules
+            for the scheduler to obey (if None, hosts are not limited)
+        :param trickyDomainsFile: a sqlite file to remember which domains
+            need selenium across runs and processes (if None, only
+            remembered for the life of this object)
+        :param maxSeleniumSessions: how many warm browser sessions to keep
+        :param maxPagesPerSeleniumSession: replace a browser session after
+            this many pages (to keep browser memory in check)
+        :param jsDetectLimitKB: if set, decide a page has no javascript
+            tricks once its </head> and this many KB have come in,
+            without waiting for the rest of it
+        :param seleniumSessionFactory: called as fn(domain) to start a
+            new browser session (if None, starts a Selenium RC session
+            on the local or remote selenium server)
         """
         if port is None:
             port=self.lastSeleniumPort
@@ -65,14 +205,26 @@ class WebFetch:
             startSeleniumNow=False
         self.seleniumVersion:str='1.0.1'
         self.p:str=None
-        self.queue:typing.List[typing.Tuple[WebFetchCallback,Url,bool]]=[]
+        self.queue:FetchScheduler[WebFetchItem]=FetchScheduler()
         self.browser:str=browser
         self.remoteIp:typing.Optional[str]=remoteIp
         self.port:typing.Optional[int]=port
         self.noSelenium:bool=noSelenium
         self.debug:int=1 # 0=none 1=error 2=warning 3=info
+        self.maxConcurrency:int=maxConcurrency
+        self.threadWorkers:typing.Optional[int]=threadWorkers
+        self.politeness:typing.Optional[PolitenessLimiter]=politeness
+        self._lock=threading.RLock() # guards queue and trickyPages
+        self._callbackLock=threading.RLock() # one callback at a time
         self.failoverOnGeneratedPages:bool=True
-        self.trickyPages:typing.List[str]=[] # Keep track of pages that employ javascript tricks like document.write(html) # noqa: E501 # pylint: disable=line-too-long
+        self.jsDetectLimitKB:typing.Optional[float]=jsDetectLimitKB
+        if seleniumSessionFactory is None:
+            seleniumSessionFactory=self._startSeleniumSession
+        self.seleniumPool:SeleniumSessionPool=SeleniumSessionPool(
+            seleniumSessionFactory,maxSeleniumSessions,
+            maxPagesPerSession=maxPagesPerSeleniumSession)
+        self.trickyPages:DomainRegistry=DomainRegistry(trickyDomainsFile) # Keep track of pages that employ javascript tricks like document.write(html) # noqa: E501 # pylint: disable=line-too-long
+        self.inFlight:SingleFlight=SingleFlight() # so the same url found by many pages at once is only fetched once # noqa: E501 # pylint: disable=line-too-long
         if startSeleniumNow:
             self._start()
 
@@ -86,20 +238,47 @@ class WebFetch:
             directory=Path(f'selenium-remote-control-{self.seleniumVersion}')
             jar=directory/ f'selenium-server-{self.seleniumVersion}selenium-server.jar' # noqa: E501 # pylint: disable=line-too-long
             pythonDir=directory/f'selenium-python-client-driver-{self.seleniumVersion}' # noqa: E501 # pylint: disable=line-too-long
-            sys.path.append(pythonDir)
+            sys.path.append(str(pythonDir))
             self.p=subprocess.Popen(('java','-jar',jar,'-port ',str(self.port))) # noqa: E501 # pylint: disable=line-too-long
 
+    def _startSeleniumSession(self,domain:str)->typing.Any:
+        """
+        start a new selenium session
+        (the seleniumPool calls this when it needs another one)
+        """
+        self._start(False)
+        # (the Selenium RC client driver that _start() put on the path)
+        from selenium import selenium # type: ignore
+        sel=selenium(self.remoteIp,self.port,'*'+self.browser,domain)
+        sel.start()
+        return sel
+
     def enqueue(self,fn:WebFetchCallback,
         urlOrHtml:typing.Union[UrlCompatible,str],
-        returnSeleniumObject:bool=False
+        returnSeleniumObject:bool=False,
+        priority:int=0,
+        stream:typing.Optional[str]=None
         )->None:
         """
         if returnSeleniumObject
             calls fn(selenium.selenium) passing a Selenium RC object
+        else if stream=STREAM_CHUNKS
+            calls fn(url,chunks) passing an iterator of bytes
+        else if stream=STREAM_FILE
+            calls fn(url,f) passing a readable file-like object
         else
             calls fn(url,html)
+
+        :param priority: higher priority items are fetched first
+            (hosts of equal priority take turns)
+        :param stream: use to get the raw body without ever holding
+            the whole thing in memory (never goes to selenium).
+            NOTE: streamed callbacks are called on a worker thread and
+            are not serialized with the other callbacks.
         """
-        self.queue.append((fn,urlOrHtml,returnSeleniumObject))
+        with self._lock:
+            self.queue.push((fn,urlOrHtml,returnSeleniumObject,stream),
+                priority,hostOf(urlOrHtml))
 
     def fetchNow(self,urlOrHtml:typing.Union[UrlCompatible,str],
         returnSeleniumObject:bool=False,
@@ -117,92 +296,450 @@ class WebFetch:
             data[0]=html
             mime[0]='text/html'
         self.enqueue(onDone,urlOrHtml)
-        self.runAll() # blocks until everything is processed
-        self.failoverOnGeneratedPages=oldFailover
+        try:
+            self.runAll() # blocks until everything is processed
+        finally:
+            self.failoverOnGeneratedPages=oldFailover
         return (data[0],mime[0])
 
-    def runNext(self)->None:
+    def fetchToFile(self,
+        url:UrlCompatible,
+        path:typing.Union[str,Path],
+        chunkSize:int=1024*1024,
+        segments:int=1
+        )->typing.Tuple[Path,typing.Optional[str]]:
         """
-        run the next fetch in the queue
+        Download a url straight to disk, never holding
+        more than one chunk in memory
+
+        Resumes with Range requests if the connection drops, and
+        optionally splits large files into parallel segments.
+
+        returns (path,mimetype)
         """
-        retval=None
-        if self.queue:
-            if self.debug>=3:
-                print('runNext - queue empty')
-            return retval
-        fn,url,returnSeleniumObject=self.queue.pop(0)
+        from .rangedDownload import downloadResumable
+        return downloadResumable(str(url),path,chunkSize,segments)
+
+    def _nextItem(self)->typing.Optional[WebFetchItem]:
+        """
+        pull the next item off of the queue
+
+        Returns None if the queue is empty, or if politeness says
+        every host with something waiting needs to be left alone for now.
+        (An item returned from here holds a politeness slot for its host
+        until _fetchQueuedItem() is done with it.)
+        """
+        with self._lock:
+            if self.politeness is None:
+                return self.queue.pop()
+            item=self.queue.pop(self.politeness.isReady)
+            if item is not None:
+                self.politeness.acquire(hostOf(item[1]))
+            return item
+
+    def _pollTime(self)->float:
+        """
+        how long to wait before trying _nextItem() again
+        when it came back empty-handed
+        """
+        if self.politeness is None:
+            return 0.0
+        with self._lock:
+            wait=self.politeness.nextReadyIn(list(self.queue.hosts()))
+        return min(max(wait,0.01),1.0)
+
+    def _waitForHost(self,host:str)->None:
+        """
+        block until politeness lets a request to this host go out
+        (like an item from _nextItem(), this holds the host's slot
+        until _fetchQueuedItem() is done with it)
+        """
+        if self.politeness is None:
+            return
+        while True:
+            with self._lock:
+                if self.politeness.acquire(host):
+                    return
+                wait=self.politeness.nextReadyIn([host])
+            if wait==float('inf'):
+                wait=0.01 # waiting on one of our own requests to finish
+            time.sleep(min(max(wait,0.01),1.0))
+
+    def _fetchQueuedItem(self,
+        item:WebFetchItem
+        )->typing.Tuple[typing.Any,typing.Any]:
+        """
+        _fetchItem() for something that came from _nextItem()
+
+        Checks robots.txt and frees up the host's politeness slot
+        when done.  If robots.txt says no, returns (None,None)
+        and the callback will not be called.
+        """
+        if self.politeness is None:
+            return self._fetchItem(*item)
+        try:
+            url=item[1]
+            if _looksLikeUrl(url) and not self.politeness.allowed(str(url)):
+                if self.debug>=2:
+                    print('robots.txt does not allow',url)
+                return None,None
+            return self._fetchItem(*item)
+        finally:
+            self.politeness.release(hostOf(item[1]))
+
+    def _fetchItem(self,
+        _fn:WebFetchCallback,
+        url:typing.Union[UrlCompatible,str],
+        returnSeleniumObject:bool,
+        stream:typing.Optional[str]=None
+        )->typing.Tuple[typing.Any,typing.Any]:
+        """
+        The blocking half of running a queued item.
+        Does all the network work, but does not call the callback.
+
+        :return: (html,seleniumObject) where html is the page if the
+            fast way worked, otherwise seleniumObject is an open
+            selenium session that _deliverItem() will hand off and then
+            check back in to the seleniumPool.
+            (For streamed items, html is the still-open response.)
+        """
+        url=str(url)
         urlCut=url.split('/')
         domain='/'.join(urlCut[0:3])
         page='/'.join(urlCut[3:])
         html=None
-        urlDenotationPos=url.find('://')
-        if urlDenotationPos<3 or urlDenotationPos>7:
+        if not _looksLikeUrl(url):
             if self.debug>=3:
                 print('accepting html, not url')
             # they gave us data, not a url
-            html=url
-            if not returnSeleniumObject:
-                # TODO: Somehow turn this into a selenium.selenium object
-                #  call fn
-                retval=''
-            else:
-                retval=fn('',html)
-        elif (not returnSeleniumObject) and domain not in self.trickyPages:
+            # TODO: Somehow turn this into a selenium.selenium object
+            return url,None
+        if stream is not None:
+            from .connectionPool import urlopen
+            return urlopen(url),None
+        with self._lock:
+            isTricky=domain in self.trickyPages
+        if (not returnSeleniumObject) and not isTricky:
             # Lets see if we can get away with the fast way
             if self.debug>=3:
                 print('attempting urllib fetch of',url)
-            import urllib.request
-            import urllib.parse
-            import urllib.error
-            f=urllib.request.urlopen(url)
-            if f is not None:
-                html=f.read().decode('utf-8','ignore')
-                f.close()
-
-                if self.noSelenium:
-                    retval=fn(url,html)
-                else:
-                    if (not self.failoverOnGeneratedPages) \
-                        or hasJavascriptTricksRE.search(html) is None:
-                        #
-                        retval=fn(url,html)
-                    else:
-                        # There were JavaScript tricks employed.
-                        # Must use Selenium to decode page.
-                        if self.debug>=2:
-                            print('There were JavaScript tricks employed on this page.') # noqa: E501 # pylint: disable=line-too-long
-                            print('You must use Selenium to decode it.')
-                        self.trickyPages.append(domain)
-                        html=False
-            else:
+            detect=(not self.noSelenium) and self.failoverOnGeneratedPages
+            html,hasTricks=self.inFlight.do((normalizeUrl(url),detect),
+                self._fetchStatic,url,detect)
+            if not hasTricks and html is None:
                 if self.debug>=3:
                     print('fringe case')
-        if html is None:
-            # Fetch page with Selenium
-            self._start(False)
-            sel=selenium(self.remoteIp,self.port,'*'+self.browser,domain)
-            sel.start()
+            elif not hasTricks:
+                return html,None
+            else:
+                # There were JavaScript tricks employed.
+                # Must use Selenium to decode page.
+                if self.debug>=2:
+                    print('There were JavaScript tricks employed on this page.') # noqa: E501 # pylint: disable=line-too-long
+                    print('You must use Selenium to decode it.')
+                with self._lock:
+                    if domain not in self.trickyPages:
+                        self.trickyPages.append(domain)
+        # Fetch page with Selenium
+        sel=self.seleniumPool.checkout(domain)
+        try:
             sel.open(page)
             sel.wait_for_page_to_load(10000)
+        except Exception:
+            self.seleniumPool.checkin(sel,healthy=False)
+            raise
+        return None,sel
+
+    def _fetchStatic(self,
+        url:str,
+        detect:bool=True,
+        chunkSize:int=16*1024
+        )->typing.Tuple[typing.Optional[str],bool]:
+        """
+        fetch a url the fast way (no browser)
+
+        :param detect: look for javascript tricks as the page comes in,
+            and give up on the download as soon as any are found
+
+        :return: (html,hasTricks) where html is None if we gave up
+        """
+        from .connectionPool import urlopen,iterChunks
+        f=urlopen(url)
+        if f is None:
+            return None,False
+        detector=None
+        if detect:
+            limit=None
+            if self.jsDetectLimitKB is not None:
+                limit=int(self.jsDetectLimitKB*1024)
+            detector=JavascriptTrickDetector(limit)
+        decoder=codecs.getincrementaldecoder('utf-8')('ignore')
+        html=[]
+        try:
+            for chunk in iterChunks(f,chunkSize):
+                text=decoder.decode(chunk)
+                html.append(text)
+                if detector is not None and not detector.done \
+                    and detector.feed(text,len(chunk)):
+                    #
+                    return None,True
+            html.append(decoder.decode(b'',True))
+        finally:
+            f.close()
+        return ''.join(html),False
+
+    def _deliverItem(self,
+        fn:WebFetchCallback,
+        url:typing.Union[UrlCompatible,str],
+        returnSeleniumObject:bool,
+        stream:typing.Optional[str],
+        html:typing.Any,
+        sel:typing.Any
+        )->typing.Any:
+        """
+        The non-blocking half of running a queued item.
+        Calls the callback with what _fetchItem() got.
+
+        Callbacks are serialized, so they never need to be thread-safe.
+        (Except streamed ones, which are busy reading the network.)
+        """
+        if stream is not None and html is not None:
+            return self._callStreamCallback(fn,url,stream,html)
+        with self._callbackLock:
+            return self._callCallback(fn,url,returnSeleniumObject,html,sel)
+
+    def _callStreamCallback(self,
+        fn:WebFetchCallback,
+        url:typing.Union[UrlCompatible,str],
+        stream:str,
+        f:typing.Any
+        )->typing.Any:
+        """
+        call a streamed callback with either chunks or a file-like object
+        """
+        from .connectionPool import iterChunks
+        if isinstance(f,str):
+            # they gave us data, not a url
+            import io
+            f=io.BytesIO(f.encode('utf-8'))
+            url=''
+        try:
+            if stream==STREAM_FILE:
+                return fn(url,f)
+            return fn(url,iterChunks(f))
+        finally:
+            f.close()
+
+    def _callCallback(self,
+        fn:WebFetchCallback,
+        url:typing.Union[UrlCompatible,str],
+        returnSeleniumObject:bool,
+        html:typing.Optional[str],
+        sel:typing.Any
+        )->typing.Any:
+        """
+        call the callback (the lock must already be held)
+        """
+        if sel is None and html is None:
+            return None # not allowed to fetch it
+        if sel is None:
+            if returnSeleniumObject:
+                # TODO: Somehow turn this into a selenium.selenium object
+                return ''
+            if not _looksLikeUrl(url):
+                # they gave us data, not a url
+                return fn('',html)
+            return fn(url,html)
+        healthy=False
+        try:
             if returnSeleniumObject:
-                retval=fn(sel)
+                ret=fn(sel)
             else:
-                print(dir(sel))
-                retval=fn(url,sel)
-            sel.stop()
-        return retval
+                ret=fn(url,sel)
+            healthy=True
+            return ret
+        finally:
+            self.seleniumPool.checkin(sel,healthy)
+
+    def runNext(self)->typing.Any:
+        """
+        run the next fetch in the queue
+        """
+        item=self._nextItem()
+        while item is None and self.queue:
+            # politeness is making us wait
+            time.sleep(self._pollTime())
+            item=self._nextItem()
+        if item is None:
+            if self.debug>=3:
+                print('runNext - queue empty')
+            return None
+        return self._runItem(item)
 
     def runAll(self)->None:
         """
         fetch all of the items in the queue right now
+
+        If threadWorkers is set, this dispatches on a thread pool,
+        else if maxConcurrency>1 this runs the asyncio engine, otherwise
+        it goes one at a time.  (If called from within a running
+        event loop, where asyncio.run() is not allowed, the thread pool
+        is used instead.  Await runAllAsync() to stay on the loop.)
+        """
+        if self.threadWorkers:
+            self.runAllThreaded(self.threadWorkers)
+        elif self.maxConcurrency>1:
+            try:
+                asyncio.get_running_loop()
+            except RuntimeError:
+                asyncio.run(self.runAllAsync())
+            else:
+                self.runAllThreaded(self.maxConcurrency)
+        else:
+            while self.queue:
+                self.runNext()
+
+    def _runItem(self,
+        item:WebFetchItem
+        )->typing.Any:
+        """
+        fetch and deliver a single queued item
+        """
+        html,sel=self._fetchQueuedItem(item)
+        return self._deliverItem(*item,html,sel)
+
+    def runAllThreaded(self,workers:int)->None:
+        """
+        fetch all of the items in the queue using a pool of worker
+        threads
+
+        Callbacks run on the worker threads, but only one at a time.
+        Items that callbacks enqueue() are picked up before this returns.
+        """
+        workers=max(1,workers)
+        with concurrent.futures.ThreadPoolExecutor(workers) as pool:
+            pending:typing.Set[concurrent.futures.Future]=set()
+            while True:
+                while len(pending)<workers:
+                    item=self._nextItem()
+                    if item is None:
+                        break
+                    pending.add(pool.submit(self._runItem,item))
+                if not pending:
+                    if not self.queue:
+                        break
+                    # politeness is making us wait
+                    time.sleep(self._pollTime())
+                    continue
+                timeout=self._pollTime() if self.queue else None
+                done,pending=concurrent.futures.wait(pending,timeout,
+                    return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    future.result() # re-raise any errors
+
+    def getMany(self,
+        urls:typing.Iterable[UrlCompatible],
+        workers:typing.Optional[int]=None
+        )->typing.Generator[
+            typing.Tuple[UrlCompatible,typing.Union[str,Exception]],None,None]:
         """
-        while self.runNext() is not None:
-            pass
+        Fetch a batch of urls on a thread pool, independent of the queue.
+        (Politeness limits and robots.txt are still obeyed.  A url that
+        robots.txt does not allow comes back as None.)
+
+        Yields (url,html) in the order they complete.  If a fetch fails,
+        the exception is yielded in place of the html.
+
+        :param workers: how many threads to use (defaults to threadWorkers,
+            or maxConcurrency if that is unset)
+        """
+        if workers is None:
+            workers=self.threadWorkers or self.maxConcurrency
+        def getOne(url):
+            data=[None]
+            def onDone(_,html):
+                data[0]=html
+            item=(onDone,url,False,None)
+            self._waitForHost(hostOf(url))
+            html,sel=self._fetchQueuedItem(item)
+            self._deliverItem(*item,html,sel)
+            return data[0]
+        with concurrent.futures.ThreadPoolExecutor(max(1,workers)) as pool:
+            futures={pool.submit(getOne,url):url for url in urls}
+            for future in concurrent.futures.as_completed(futures):
+                try:
+                    yield futures[future],future.result()
+                except Exception as e:
+                    yield futures[future],e
+
+    async def runAllAsync(self)->None:
+        """
+        fetch all of the items in the queue, with up to
+        maxConcurrency fetches in flight at once
+
+        The blocking network work and the callbacks are farmed out to
+        worker threads, so a slow callback never stalls the event loop,
+        but callbacks are still called one at a time, so the (url,html)
+        callback contract is unchanged.
+        Callbacks are free to enqueue() more items and they will be
+        picked up before this returns.
+
+        If an item fails, no more are started, the ones in flight are
+        allowed to finish, and then the first error is raised.
+        """
+        semaphore=asyncio.Semaphore(max(1,self.maxConcurrency))
+        pending:typing.Set[asyncio.Future]=set()
+        error:typing.Optional[BaseException]=None
+        while error is None and (self.queue or pending):
+            while self.queue:
+                await semaphore.acquire()
+                item=self._nextItem()
+                if item is None:
+                    semaphore.release()
+                    break
+                pending.add(asyncio.ensure_future(
+                    self._runItemAsync(item,semaphore)))
+            if pending:
+                timeout=self._pollTime() if self.queue else None
+                done,pending=await asyncio.wait(pending,timeout=timeout,
+                    return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if error is None and task.exception() is not None:
+                        error=task.exception()
+            elif self.queue:
+                # politeness is making us wait
+                await asyncio.sleep(self._pollTime())
+        if pending:
+            await asyncio.gather(*pending,return_exceptions=True)
+        if error is not None:
+            raise error
+
+    async def _runItemAsync(self,
+        item:WebFetchItem,
+        semaphore:asyncio.Semaphore
+        )->typing.Any:
+        """
+        run a single queued item on the asyncio engine
+        """
+        if item[3] is not None:
+            # streamed callbacks do blocking reads, so keep them
+            # off of the event loop
+            try:
+                return await asyncio.to_thread(self._runItem,item)
+            finally:
+                semaphore.release()
+        try:
+            html,sel=await asyncio.to_thread(self._fetchQueuedItem,item)
+        finally:
+            semaphore.release()
+        return await asyncio.to_thread(self._deliverItem,*item,html,sel)
 
     def __del__(self)->None:
         self._stop()
 
     def _stop(self)->None:
+        if hasattr(self,'seleniumPool'):
+            self.seleniumPool.closeAll()
         if self.p is not None:
             try:
                 import win32api # type: ignore
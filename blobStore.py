@@ -0,0 +1,277 @@
+"""
+A content-addressed, deduplicated blob store.
+
+Bodies are stored once, in a file named after the SHA-256 digest of
+their contents, no matter how many urls (or caches) refer to them.
+The digest is computed while the body streams in, so nothing needs
+to be held in memory.  Each blob carries a reference count, and is
+deleted once nothing refers to it any more.
+
+Layout:
+    directory/refs.db           sqlite refcounts
+    directory/ab/cdef0123...    the blob with digest abcdef0123...
+
+USAGE:
+    store=getBlobStore('blobs')
+    digest=store.putStream(chunks)
+    data=store.get(digest)
+    store.decref(digest)
+"""
+import typing
+import os
+import hashlib
+import shutil
+import sqlite3
+import tempfile
+import threading
+from pathlib import Path
+
+
+class BlobRef(str):
+    """
+    A digest string, marking a body that lives in a BlobStore
+    rather than inline
+    """
+
+
+class BlobStore:
+    """
+    A content-addressed, deduplicated blob store.
+    """
+
+    def __init__(self,directory:typing.Union[str,Path]):
+        """
+        :param directory: where the blobs live
+        """
+        self.directory:Path=Path(directory)
+        self.directory.mkdir(parents=True,exist_ok=True)
+        self._lock=threading.RLock()
+        self._db=sqlite3.connect(str(self.directory/'refs.db'),
+            check_same_thread=False)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute("""CREATE TABLE IF NOT EXISTS blobs (
+            digest TEXT PRIMARY KEY,
+            size INTEGER NOT NULL,
+            refcount INTEGER NOT NULL)""")
+        self._db.commit()
+        self.bytesWritten:int=0
+        self.bytesDeduplicated:int=0
+
+    def path(self,digest:str)->Path:
+        """
+        the file a blob is stored in
+        """
+        return self.directory/digest[:2]/digest[2:]
+
+    def __contains__(self,digest:object)->bool:
+        with self._lock:
+            row=self._db.execute('SELECT 1 FROM blobs WHERE digest=?',
+                (str(digest),)).fetchone()
+        return row is not None
+
+    def _commitBlob(self,tempName:str,digest:str,size:int)->BlobRef:
+        """
+        move a finished temp file into place (or throw it away if we
+        already have it) and take a reference to it
+        """
+        with self._lock:
+            row=self._db.execute('SELECT refcount FROM blobs WHERE digest=?',
+                (digest,)).fetchone()
+            if row is not None and self.path(digest).exists():
+                os.remove(tempName)
+                self._db.execute(
+                    'UPDATE blobs SET refcount=refcount+1 WHERE digest=?',
+                    (digest,))
+                self.bytesDeduplicated+=size
+            else:
+                filename=self.path(digest)
+                filename.parent.mkdir(exist_ok=True)
+                os.replace(tempName,filename)
+                self._db.execute(
+                    'INSERT OR REPLACE INTO blobs VALUES (?,?,?)',
+                    (digest,size,(row[0] if row is not None else 0)+1))
+                self.bytesWritten+=size
+            self._db.commit()
+        return BlobRef(digest)
+
+    def putStream(self,chunks:typing.Iterable[bytes])->BlobRef:
+        """
+        store a body that arrives as an iterable of chunks,
+        hashing it as it goes
+
+        :return: the digest (the caller now holds one reference to it)
+        """
+        hasher=hashlib.sha256()
+        size=0
+        fd,tempName=tempfile.mkstemp(dir=str(self.directory),suffix='.tmp')
+        try:
+            with os.fdopen(fd,'wb') as f:
+                for chunk in chunks:
+                    if isinstance(chunk,str):
+                        chunk=chunk.encode('utf-8')
+                    hasher.update(chunk)
+                    f.write(chunk)
+                    size+=len(chunk)
+        except BaseException:
+            os.remove(tempName)
+            raise
+        return self._commitBlob(tempName,hasher.hexdigest(),size)
+
+    def putFile(self,
+        filename:typing.Union[str,Path],
+        digest:typing.Optional[str]=None
+        )->BlobRef:
+        """
+        move a file into the store (rather than copying it)
+
+        :param digest: its sha256 hexdigest, if already known
+            (eg it was hashed while it was downloaded)
+        :return: the digest (the caller now holds one reference to it)
+        """
+        filename=str(filename)
+        if digest is None:
+            hasher=hashlib.sha256()
+            with open(filename,'rb') as f:
+                for chunk in iter(lambda:f.read(1024*1024),b''):
+                    hasher.update(chunk)
+            digest=hasher.hexdigest()
+        fd,tempName=tempfile.mkstemp(dir=str(self.directory),suffix='.tmp')
+        os.close(fd)
+        try:
+            os.replace(filename,tempName)
+        except OSError:
+            # on another drive, so it has to be copied after all
+            os.remove(tempName)
+            with open(filename,'rb') as f:
+                ref=self.putStream(iter(lambda:f.read(1024*1024),b''))
+            os.remove(filename)
+            return ref
+        return self._commitBlob(tempName,digest,os.path.getsize(tempName))
+
+    def put(self,data:typing.Union[str,bytes])->BlobRef:
+        """
+        store a body
+
+        :return: the digest (the caller now holds one reference to it)
+        """
+        if isinstance(data,str):
+            data=data.encode('utf-8')
+        digest=hashlib.sha256(data).hexdigest()
+        with self._lock:
+            row=self._db.execute('SELECT 1 FROM blobs WHERE digest=?',
+                (digest,)).fetchone()
+            if row is not None and self.path(digest).exists():
+                # skip writing it out at all
+                self.incref(digest)
+                self.bytesDeduplicated+=len(data)
+                return BlobRef(digest)
+        return self.putStream([data])
+
+    def get(self,digest:str)->bytes:
+        """
+        get the contents of a blob
+        """
+        with open(self.path(digest),'rb') as f:
+            return f.read()
+
+    def open(self,digest:str)->typing.BinaryIO:
+        """
+        open a blob for streaming reads
+        """
+        return open(self.path(digest),'rb')
+
+    def incref(self,digest:str)->None:
+        """
+        take another reference to a blob
+        """
+        with self._lock:
+            self._db.execute(
+                'UPDATE blobs SET refcount=refcount+1 WHERE digest=?',
+                (digest,))
+            self._db.commit()
+
+    def decref(self,digest:str)->None:
+        """
+        drop a reference to a blob, deleting it once nothing refers to it
+        """
+        with self._lock:
+            row=self._db.execute('SELECT refcount FROM blobs WHERE digest=?',
+                (digest,)).fetchone()
+            if row is None:
+                return
+            if row[0]<=1:
+                self._db.execute('DELETE FROM blobs WHERE digest=?',(digest,))
+                try:
+                    os.remove(self.path(digest))
+                except FileNotFoundError:
+                    pass
+            else:
+                self._db.execute(
+                    'UPDATE blobs SET refcount=refcount-1 WHERE digest=?',
+                    (digest,))
+            self._db.commit()
+
+    def refcount(self,digest:str)->int:
+        """
+        how many references there are to a blob
+        """
+        with self._lock:
+            row=self._db.execute('SELECT refcount FROM blobs WHERE digest=?',
+                (digest,)).fetchone()
+        return 0 if row is None else row[0]
+
+    def linkTo(self,digest:str,filename:typing.Union[str,Path])->None:
+        """
+        make a blob appear at another filename, hardlinking if possible
+        (so it takes no more disk space) and copying if not
+
+        NOTE: since a hardlink shares the data, the file should be
+        treated as read-only
+        """
+        filename=Path(filename)
+        if filename.exists():
+            filename.unlink()
+        try:
+            os.link(self.path(digest),filename)
+        except OSError:
+            shutil.copyfile(self.path(digest),filename)
+
+    def stats(self)->typing.Dict[str,int]:
+        """
+        get the usage counters
+        """
+        with self._lock:
+            blobs,size,refs=self._db.execute(
+                'SELECT COUNT(*),TOTAL(size),TOTAL(refcount) FROM blobs'
+                ).fetchone()
+        return {
+            'blobs':blobs,
+            'bytes':int(size),
+            'references':int(refs),
+            'bytesWritten':self.bytesWritten,
+            'bytesDeduplicated':self.bytesDeduplicated}
+
+    def close(self)->None:
+        """
+        close the refcount database
+        """
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db=None
+
+
+_blobStores:typing.Dict[str,BlobStore]={}
+_blobStoresLock=threading.Lock()
+def getBlobStore(directory:typing.Union[str,Path]='blobs')->BlobStore:
+    """
+    get the shared BlobStore for a directory, so that every cache using
+    the same directory shares one set of refcounts
+    """
+    key=os.path.abspath(str(directory))
+    with _blobStoresLock:
+        store=_blobStores.get(key)
+        if store is None:
+            store=BlobStore(directory)
+            _blobStores[key]=store
+        return store
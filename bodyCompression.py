@@ -0,0 +1,363 @@
+"""
+Compression of cached bodies at rest, with a dictionary per domain
+
+Pages from one site share most of their markup, so once a few pages
+from a domain have been seen, a dictionary is made from them and used
+to compress (and later decompress) the rest.
+
+zstd is used if the zstandard module is installed, otherwise zlib with
+a preset dictionary.  (gzip files have no way to carry a preset
+dictionary, so the fallback is a plain zlib stream.)
+
+Compressed bodies start with a small header naming the codec and the
+dictionary, so anything without one is read back as-is, and a cache
+can hold a mixture of compressed and uncompressed bodies.
+
+USAGE:
+    codec=BodyCodec('dictionaries')
+    with open(filename,'wb') as f:
+        for chunk in codec.compressChunks(chunks,'example.com'):
+            f.write(chunk)
+    for chunk in codec.readChunks(filename):
+        ...
+"""
+import typing
+import os
+import json
+import zlib
+import struct
+import threading
+import collections
+from pathlib import Path
+try:
+    import zstandard # type: ignore
+    hasZstd=True
+except ImportError:
+    hasZstd=False
+
+
+CODEC_ZSTD='zstd'
+CODEC_ZLIB='zlib'
+CODEC_NONE='none' # store as-is (but still able to read compressed bodies)
+
+_MAGIC=b'\x89WFZ'
+# magic,codec,dictionaryId (0 means no dictionary)
+_HEADER=struct.Struct('>4scI')
+_CODEC_IDS={CODEC_ZSTD:b'z',CODEC_ZLIB:b'd'}
+_CODEC_NAMES={v:k for k,v in _CODEC_IDS.items()}
+# zlib can only look back this far, so a bigger dictionary is no use
+_ZLIB_MAX_DICTIONARY=32*1024
+_MAX_DICTIONARY_ID=0xffffffff
+
+
+def defaultCodec()->str:
+    """
+    the best codec we have available
+    """
+    return CODEC_ZSTD if hasZstd else CODEC_ZLIB
+
+
+class BodyCodec:
+    """
+    Compresses and decompresses cached bodies, training a dictionary
+    per domain as it goes
+    """
+
+    def __init__(self,
+        directory:typing.Union[None,str,Path]=None,
+        codec:typing.Optional[str]=None,
+        level:typing.Optional[int]=None,
+        trainAfter:int=32,
+        dictionarySize:int=16*1024,
+        sampleSize:int=64*1024,
+        maxSampleDomains:int=256,
+        maxSampleBytes:int=16*1024*1024):
+        """
+        :param directory: where to keep the dictionaries
+            (if None, no dictionaries are used)
+        :param codec: CODEC_ZSTD, CODEC_ZLIB ('gzip' also means zlib),
+            or CODEC_NONE.  If None, zstd if it is installed
+        :param level: compression level (None for the codec's default)
+        :param trainAfter: make a domain's dictionary once this many
+            bodies from it have been seen
+        :param dictionarySize: how big to make dictionaries
+        :param sampleSize: how much of each body to keep for training
+        :param maxSampleDomains: most domains to keep samples for at
+            once (the least recently seen are forgotten)
+        :param maxSampleBytes: most sample data to keep at once, for
+            all domains together
+        """
+        if codec is None:
+            codec=defaultCodec()
+        codec=codec.lower()
+        if codec=='gzip':
+            codec=CODEC_ZLIB
+        if codec not in _CODEC_IDS and codec!=CODEC_NONE:
+            raise ValueError(f'Unknown compression "{codec}"')
+        if codec==CODEC_ZSTD and not hasZstd:
+            raise ValueError('zstandard module is not installed')
+        self.codec:str=codec
+        self.level:typing.Optional[int]=level
+        self.directory:typing.Optional[Path]=None
+        if directory is not None:
+            self.directory=Path(directory)
+        self.trainAfter:int=trainAfter
+        self.dictionarySize:int=dictionarySize
+        self.sampleSize:int=sampleSize
+        self.maxSampleDomains:int=maxSampleDomains
+        self.maxSampleBytes:int=maxSampleBytes
+        self._dictionaries:typing.Dict[int,bytes]={}
+        self._domains:typing.Dict[str,int]={} # domain:dictionaryId
+        # domain:samples, least recently seen first
+        self._samples:typing.OrderedDict[str,typing.List[bytes]]=collections.OrderedDict() # noqa: E501 # pylint: disable=line-too-long
+        self._sampleBytes:int=0
+        self._training:typing.Set[str]=set() # domains being trained
+        self._lock=threading.RLock()
+        if self.directory is not None and self._domainsFilename.exists():
+            with open(self._domainsFilename,'r',encoding='utf-8') as f:
+                self._domains=json.load(f)
+
+    @property
+    def _domainsFilename(self)->Path:
+        return self.directory/'domains.json'
+
+    def _dictionaryFilename(self,dictionaryId:int)->Path:
+        return self.directory/f'{dictionaryId:08x}.dict'
+
+    def dictionary(self,dictionaryId:int)->bytes:
+        """
+        get a dictionary by id
+        """
+        if dictionaryId==0:
+            return b''
+        with self._lock:
+            data=self._dictionaries.get(dictionaryId)
+            if data is None:
+                if self.directory is None:
+                    raise KeyError(f'No compression dictionary {dictionaryId:08x}') # noqa: E501 # pylint: disable=line-too-long
+                with open(self._dictionaryFilename(dictionaryId),'rb') as f:
+                    data=f.read()
+                self._dictionaries[dictionaryId]=data
+            return data
+
+    def dictionaryFor(self,domain:typing.Optional[str])->int:
+        """
+        the id of the dictionary to use for a domain (0 for none)
+        """
+        if domain is None:
+            return 0
+        with self._lock:
+            return self._domains.get(domain,0)
+
+    def _train(self,samples:typing.List[bytes])->bytes:
+        """
+        make a dictionary from some sample bodies
+        """
+        if self.codec==CODEC_ZSTD:
+            try:
+                return zstandard.train_dictionary(
+                    self.dictionarySize,samples).as_bytes()
+            except zstandard.ZstdError:
+                pass # not enough to go on, so use the raw samples
+        # zlib prefers what is nearest the end of the dictionary, and it is
+        # the start of pages (the <head>, nav, etc) that sites have in common
+        size=min(self.dictionarySize,_ZLIB_MAX_DICTIONARY)
+        each=max(1,size//len(samples))
+        return b''.join(sample[:each] for sample in samples)[-size:]
+
+    def addSample(self,domain:typing.Optional[str],sample:bytes)->None:
+        """
+        remember part of a body for training the domain's dictionary
+        (trains it once there are enough)
+        """
+        if domain is None or self.directory is None or not sample:
+            return
+        with self._lock:
+            if domain in self._domains or domain in self._training:
+                return
+            sample=sample[:self.sampleSize]
+            samples=self._samples.setdefault(domain,[])
+            self._samples.move_to_end(domain)
+            samples.append(sample)
+            self._sampleBytes+=len(sample)
+            if len(samples)<self.trainAfter:
+                self._forgetSamples()
+                return
+            self._dropSamples(domain)
+            self._training.add(domain)
+        try:
+            # (training is slow, so other threads carry on meanwhile)
+            data=self._train(samples)
+            with self._lock:
+                dictionaryId=self._saveDictionary(data)
+                self._dictionaries[dictionaryId]=data
+                self._domains[domain]=dictionaryId
+                tempName=str(self._domainsFilename)+'.tmp'
+                with open(tempName,'w',encoding='utf-8') as f:
+                    json.dump(self._domains,f)
+                os.replace(tempName,self._domainsFilename)
+        finally:
+            with self._lock:
+                self._training.discard(domain)
+
+    def _saveDictionary(self,data:bytes)->int:
+        """
+        write a new dictionary to the next unused id (the lock must be held)
+
+        Never overwrites an existing dictionary file, since bodies
+        compressed with it could no longer be read.
+
+        :return: the dictionary id
+        """
+        os.makedirs(self.directory,exist_ok=True)
+        used=set(self._domains.values())
+        dictionaryId=max(used,default=0)
+        while True:
+            dictionaryId=dictionaryId%_MAX_DICTIONARY_ID+1
+            if dictionaryId in used:
+                continue
+            try:
+                with open(self._dictionaryFilename(dictionaryId),'xb') as f:
+                    f.write(data)
+            except FileExistsError:
+                continue # (eg another process sharing the directory)
+            return dictionaryId
+
+    def _dropSamples(self,domain:str)->None:
+        """
+        forget the samples for a domain (the lock must be held)
+        """
+        samples=self._samples.pop(domain,[])
+        self._sampleBytes-=sum(len(sample) for sample in samples)
+
+    def _forgetSamples(self)->None:
+        """
+        forget the least recently seen domains' samples until we are
+        within maxSampleDomains and maxSampleBytes (the lock must be held)
+        """
+        while self._samples and (len(self._samples)>self.maxSampleDomains
+            or self._sampleBytes>self.maxSampleBytes):
+            #
+            self._dropSamples(next(iter(self._samples)))
+
+    def _compressor(self,dictionaryId:int)->typing.Any:
+        data=self.dictionary(dictionaryId)
+        if self.codec==CODEC_ZSTD:
+            kwargs={}
+            if data:
+                kwargs['dict_data']=zstandard.ZstdCompressionDict(data)
+            level=3 if self.level is None else self.level
+            return zstandard.ZstdCompressor(level=level,
+                **kwargs).compressobj()
+        level=zlib.Z_DEFAULT_COMPRESSION if self.level is None else self.level
+        if data:
+            return zlib.compressobj(level,zdict=data)
+        return zlib.compressobj(level)
+
+    def _decompressor(self,codec:str,dictionaryId:int)->typing.Any:
+        data=self.dictionary(dictionaryId)
+        if codec==CODEC_ZSTD:
+            if not hasZstd:
+                raise ValueError('zstandard module is not installed')
+            kwargs={}
+            if data:
+                kwargs['dict_data']=zstandard.ZstdCompressionDict(data)
+            return zstandard.ZstdDecompressor(**kwargs).decompressobj()
+        if data:
+            return zlib.decompressobj(zdict=data)
+        return zlib.decompressobj()
+
+    def compressChunks(self,
+        chunks:typing.Iterable[bytes],
+        domain:typing.Optional[str]=None
+        )->typing.Generator[bytes,None,None]:
+        """
+        compress an iterable of chunks into compressed chunks
+        (with a header saying how to decompress them)
+
+        :param domain: what site the body is from (for choosing, and
+            training, a dictionary)
+        """
+        if self.codec==CODEC_NONE:
+            yield from chunks
+            return
+        dictionaryId=self.dictionaryFor(domain)
+        compressor=self._compressor(dictionaryId)
+        yield _HEADER.pack(_MAGIC,_CODEC_IDS[self.codec],dictionaryId)
+        # (only domains that do not have a dictionary yet are sampled)
+        sampling=dictionaryId==0 and self.directory is not None
+        sample:typing.List[bytes]=[]
+        sampleLength=0
+        for chunk in chunks:
+            if sampling and sampleLength<self.sampleSize:
+                sample.append(chunk)
+                sampleLength+=len(chunk)
+            chunk=compressor.compress(chunk)
+            if chunk:
+                yield chunk
+        chunk=compressor.flush()
+        if chunk:
+            yield chunk
+        if sample:
+            self.addSample(domain,b''.join(sample))
+
+    def compress(self,data:bytes,domain:typing.Optional[str]=None)->bytes:
+        """
+        compress a whole body
+        """
+        return b''.join(self.compressChunks([data],domain))
+
+    def decompressChunks(self,
+        chunks:typing.Iterable[bytes]
+        )->typing.Generator[bytes,None,None]:
+        """
+        decompress an iterable of chunks into decompressed chunks
+        (anything that was not compressed comes back as-is)
+        """
+        chunks=iter(chunks)
+        head=b''
+        for chunk in chunks:
+            head+=chunk
+            if len(head)>=_HEADER.size:
+                break
+        if len(head)<_HEADER.size or not head.startswith(_MAGIC):
+            if head:
+                yield head
+            yield from chunks
+            return
+        _,codec,dictionaryId=_HEADER.unpack(head[:_HEADER.size])
+        codec=_CODEC_NAMES.get(codec)
+        if codec is None:
+            raise ValueError('Unknown compression in cached body')
+        decompressor=self._decompressor(codec,dictionaryId)
+        head=head[_HEADER.size:]
+        if head:
+            head=decompressor.decompress(head)
+            if head:
+                yield head
+        for chunk in chunks:
+            chunk=decompressor.decompress(chunk)
+            if chunk:
+                yield chunk
+        if hasattr(decompressor,'flush'):
+            chunk=decompressor.flush()
+            if chunk:
+                yield chunk
+
+    def decompress(self,data:bytes)->bytes:
+        """
+        decompress a whole body
+        """
+        return b''.join(self.decompressChunks([data]))
+
+    def readChunks(self,
+        f:typing.Union[str,Path,typing.BinaryIO],
+        chunkSize:int=64*1024
+        )->typing.Generator[bytes,None,None]:
+        """
+        lazily read and decompress a file a chunk at a time
+        """
+        if isinstance(f,(str,Path)):
+            f=open(f,'rb')
+        with f:
+            yield from self.decompressChunks(iter(lambda:f.read(chunkSize),b'')) # noqa: E501 # pylint: disable=line-too-long
@@ -0,0 +1,245 @@
+"""
+Keeps an on-disk cache within limits (bytes, entries, age).
+
+The cache tells the janitor when entries are added, used, and removed,
+which only costs a dict update, and a background thread evicts a batch
+at a time whenever the cache is over its limits, so the fetch path
+never waits on it.
+
+The cache being looked after must provide:
+    _janitorEntries() -> iterable of (key,size,timestamp)
+        (every entry, for when the janitor first starts)
+    _janitorEvict(keys) -> None
+        (remove these entries)
+
+USAGE:
+    janitor=CacheJanitor(cache,maxBytes=10*1024**3,policy='gdsf')
+    janitor.start()
+"""
+import typing
+import time
+import logging
+import weakref
+import threading
+import collections
+from .memoryCache import EvictionPolicy, makePolicy
+
+
+class CacheJanitor:
+    """
+    Keeps an on-disk cache within limits (bytes, entries, age).
+    """
+
+    def __init__(self,
+        cache:typing.Any,
+        maxBytes:typing.Optional[int]=None,
+        maxEntries:typing.Optional[int]=None,
+        maxAgeSeconds:typing.Optional[float]=None,
+        policy:typing.Union[str,EvictionPolicy]='lru',
+        interval:float=60.0,
+        batchSize:int=100):
+        """
+        :param cache: the cache to look after (only weakly referenced,
+            so the janitor does not keep it alive)
+        :param maxBytes: how much disk the cache may use (None is unlimited)
+        :param maxEntries: how many entries it may have (None is unlimited)
+        :param maxAgeSeconds: evict entries stored longer ago than this
+            (None keeps them forever)
+        :param policy: what to evict when over the limits.
+            'lru', 'lfu', 'gdsf' (size-aware), or an EvictionPolicy
+        :param interval: how often the background thread checks
+        :param batchSize: most entries to evict in one go
+        """
+        self._cache=weakref.ref(cache)
+        self.maxBytes:typing.Optional[int]=maxBytes
+        self.maxEntries:typing.Optional[int]=maxEntries
+        self.maxAgeSeconds:typing.Optional[float]=maxAgeSeconds
+        self.policy:EvictionPolicy=makePolicy(policy)
+        self.interval:float=interval
+        self.batchSize:int=batchSize
+        self._sizes:typing.Dict[typing.Any,int]={}
+        # key:timestamp, oldest first
+        self._stored:typing.OrderedDict[typing.Any,float]=collections.OrderedDict() # noqa: E501 # pylint: disable=line-too-long
+        self._lock=threading.RLock()
+        self._seeded:bool=False
+        self._stop=threading.Event()
+        self._thread:typing.Optional[threading.Thread]=None
+        self.totalBytes:int=0
+        self.evictions:int=0
+        self.expirations:int=0
+        self.errors:int=0 # sweeps that failed
+
+    def stats(self)->typing.Dict[str,int]:
+        """
+        get the usage counters
+        """
+        with self._lock:
+            return {
+                'entries':len(self._sizes),
+                'totalBytes':self.totalBytes,
+                'evictions':self.evictions,
+                'expirations':self.expirations,
+                'errors':self.errors}
+
+    def _track(self,key:typing.Any,size:int,timestamp:float)->None:
+        """
+        start tracking an entry (the lock must be held)
+        """
+        self.totalBytes+=size-self._sizes.get(key,0)
+        self._sizes[key]=size
+        self._stored.pop(key,None)
+        self._stored[key]=timestamp
+        self.policy.add(key,size)
+
+    def add(self,
+        key:typing.Any,
+        size:int,
+        timestamp:typing.Optional[float]=None
+        )->None:
+        """
+        an entry was stored (or replaced)
+        """
+        if timestamp is None:
+            timestamp=time.time()
+        with self._lock:
+            self._track(key,size,timestamp)
+
+    def touch(self,key:typing.Any)->None:
+        """
+        an entry was used
+        """
+        with self._lock:
+            self.policy.touch(key)
+
+    def remove(self,key:typing.Any)->None:
+        """
+        an entry went away
+        """
+        with self._lock:
+            self._untrack(key)
+
+    def _untrack(self,key:typing.Any)->None:
+        """
+        stop tracking an entry (the lock must be held)
+        """
+        if key not in self._sizes:
+            return
+        self.totalBytes-=self._sizes.pop(key)
+        self._stored.pop(key,None)
+        self.policy.remove(key)
+
+    def _seed(self,cache:typing.Any)->None:
+        """
+        start tracking whatever was already in the cache
+        """
+        entries=sorted(cache._janitorEntries(),key=lambda entry:entry[2])
+        with self._lock:
+            # what was added since we started is newer than any of these
+            newer=list(self._stored.items())
+            for key,size,timestamp in entries:
+                if key not in self._sizes:
+                    self._track(key,size,timestamp)
+            for key,_ in newer:
+                if key in self._stored:
+                    self._stored.move_to_end(key)
+            self._seeded=True
+
+    def overLimits(self)->bool:
+        """
+        whether the cache is over any of its limits
+        """
+        with self._lock:
+            if self.maxBytes is not None and self.totalBytes>self.maxBytes:
+                return True
+            if self.maxEntries is not None \
+                and len(self._sizes)>self.maxEntries:
+                #
+                return True
+            if self.maxAgeSeconds is not None and self._stored:
+                oldest=next(iter(self._stored.values()))
+                return time.time()-oldest>self.maxAgeSeconds
+            return False
+
+    def _pickVictims(self)->typing.List[typing.Any]:
+        """
+        choose the next batch to evict, and stop tracking them
+        """
+        victims=[]
+        with self._lock:
+            if self.maxAgeSeconds is not None:
+                cutoff=time.time()-self.maxAgeSeconds
+                while self._stored and len(victims)<self.batchSize:
+                    key,timestamp=next(iter(self._stored.items()))
+                    if timestamp>=cutoff:
+                        break
+                    victims.append(key)
+                    self._untrack(key)
+                    self.expirations+=1
+            while len(victims)<self.batchSize and (
+                (self.maxBytes is not None and self.totalBytes>self.maxBytes)
+                or (self.maxEntries is not None
+                    and len(self._sizes)>self.maxEntries)):
+                #
+                key=self.policy.victim()
+                if key is None or key not in self._sizes:
+                    break
+                victims.append(key)
+                self._untrack(key)
+                self.evictions+=1
+        return victims
+
+    def sweep(self)->int:
+        """
+        evict one batch (if over the limits)
+
+        :return: how many were evicted
+        """
+        cache=self._cache()
+        if cache is None:
+            return 0
+        if not self._seeded:
+            self._seed(cache)
+        victims=self._pickVictims()
+        if victims:
+            # (not holding our lock, so the fetch path is never blocked)
+            try:
+                cache._janitorEvict(victims)
+            except Exception:
+                # some may still be there, so look again next time
+                self._seeded=False
+                raise
+        return len(victims)
+
+    def _run(self)->None:
+        while not self._stop.wait(self.interval):
+            if self._cache() is None:
+                break # the cache went away
+            try:
+                while self.sweep() and not self._stop.is_set():
+                    time.sleep(0) # let everybody else have a turn
+            except Exception:
+                # try again next time around
+                with self._lock:
+                    self.errors+=1
+                logging.getLogger(__name__).exception(
+                    'cache janitor sweep failed')
+
+    def start(self)->None:
+        """
+        start the background thread
+        """
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread=threading.Thread(target=self._run,
+            name='CacheJanitor',daemon=True)
+        self._thread.start()
+
+    def stop(self)->None:
+        """
+        stop the background thread
+        """
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread=None
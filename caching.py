@@ -2,10 +2,30 @@
 Single cached website
 """
 import typing
+import os
+import time
+import bisect
+import threading
 from pathlib import Path
 import datetime
 import uuid
+import urllib.parse
 from paths import URL,URLCompatible,asUrl
+from .blobStore import BlobStore
+from .memoryCache import EvictionPolicy
+from .cacheJanitor import CacheJanitor
+from .bodyCompression import BodyCodec, CODEC_NONE
+from .webfetchTypes import WebFetchResponse
+from .freshness import FreshnessPolicy, STALE, STALE_WHILE_REVALIDATE, refreshInBackground # noqa: E501 # pylint: disable=line-too-long
+
+
+_BLOB_PREFIX='blob:'
+# manifest journal records
+_JOURNAL_SET='+'
+_JOURNAL_REMOVE='-'
+_JOURNAL_REPLACE='=' # set, dropping every other version of the url
+# response headers that get remembered for deciding freshness
+_FRESHNESS_HEADERS=('cache-control','expires','date','age')
 
 
 class CachedWebsite:
@@ -13,55 +33,224 @@ class CachedWebsite:
     Single cached website
     """
 
-    def __init__(self)->None:
+    def __init__(self,
+        blobStore:typing.Optional[BlobStore]=None,
+        codec:typing.Optional[BodyCodec]=None)->None:
+        """
+        :param blobStore: if given, the data is kept in this shared
+            content-addressed store instead of its own file
+        :param codec: if given, compresses the data at rest
+        """
         self.url:typing.Optional[URL]=None
         self.retrievalDate:typing.Optional[datetime.datetime]=None
+        # when this version was first retrieved (retrievalDate moves
+        # forward when it is revalidated, but this stays put)
+        self.versionDate:typing.Optional[datetime.datetime]=None
         self.dataFilename:typing.Optional[str]=None
+        self.blobStore:typing.Optional[BlobStore]=blobStore
+        self.codec:typing.Optional[BodyCodec]=codec
+        self.digest:typing.Optional[str]=None
+        self.etag:typing.Optional[str]=None
+        self.lastModified:typing.Optional[str]=None
+        self.cacheHeaders:typing.Dict[str,str]={}
+
+    def setValidators(self,headers:typing.Mapping[str,str])->None:
+        """
+        remember the ETag / Last-Modified, and the headers that say how
+        long it stays fresh, from a set of response headers
+        """
+        for k,v in headers.items():
+            if k.lower()=='etag':
+                self.etag=v
+            elif k.lower()=='last-modified':
+                self.lastModified=v
+            elif k.lower() in _FRESHNESS_HEADERS:
+                self.cacheHeaders[k.lower()]=v
+
+    @property
+    def headers(self)->typing.Dict[str,str]:
+        """
+        the response headers we remember
+        """
+        headers=dict(self.cacheHeaders)
+        if self.etag is not None:
+            headers['ETag']=self.etag
+        if self.lastModified is not None:
+            headers['Last-Modified']=self.lastModified
+        return headers
+
+    @property
+    def fetchTime(self)->typing.Optional[float]:
+        """
+        retrievalDate as a time.time() value
+        """
+        if self.retrievalDate is None:
+            return None
+        return self.retrievalDate.timestamp()
+
+    @property
+    def versionTime(self)->float:
+        """
+        versionDate as a time.time() value (for sorting versions)
+        """
+        versionDate=self.versionDate or self.retrievalDate
+        if versionDate is None:
+            return float('-inf')
+        return versionDate.timestamp()
+
+    @property
+    def hasValidators(self)->bool:
+        """
+        whether we can ask the server if this has changed
+        """
+        return self.etag is not None or self.lastModified is not None
+
+    def asResponse(self)->WebFetchResponse:
+        """
+        this cached copy as a response (for revalidation)
+        """
+        return WebFetchResponse(self.data,None,200,self.headers,
+            self.fetchTime)
 
     @property
     def filename(self)->typing.Optional[str]:
         """
         the data filename
         """
+        if self.digest is not None:
+            return str(self.blobStore.path(self.digest))
         return self.dataFilename
 
+    @property
+    def domain(self)->typing.Optional[str]:
+        """
+        the domain of the url (for choosing a compression dictionary)
+        """
+        if self.url is None:
+            return None
+        return urllib.parse.urlsplit(str(self.url)).hostname
+
+    def iterData(self,chunkSize:int=64*1024)->typing.Iterator[bytes]:
+        """
+        lazily read the data a chunk at a time
+        (decompressing it as it goes)
+        """
+        if self.digest is not None:
+            f=self.blobStore.open(self.digest)
+        elif self.dataFilename is None:
+            raise FileNotFoundError(str(self.dataFilename))
+        else:
+            f=open(self.dataFilename,'rb')
+        if self.codec is not None:
+            return self.codec.readChunks(f,chunkSize)
+        def readAll():
+            with f:
+                yield from iter(lambda:f.read(chunkSize),b'')
+        return readAll()
+
     @property
     def data(self)->bytes:
         """
         this value automatically loads/saves the data from file
         """
-        if self.dataFilename is None:
-            raise FileNotFoundError(str(self.dataFilename))
-        with open(self.dataFilename,'rb') as f:
-            data=f.read()
-        return data
+        if self.codec is None:
+            if self.digest is not None:
+                return self.blobStore.get(self.digest)
+            if self.dataFilename is None:
+                raise FileNotFoundError(str(self.dataFilename))
+            with open(self.dataFilename,'rb') as f:
+                data=f.read()
+            return data
+        return b''.join(self.iterData())
     @data.setter
-    def data(self,data:bytes):
+    def data(self,data:typing.Union[bytes,typing.Iterable[bytes]]):
+        if isinstance(data,str):
+            data=data.encode('utf-8')
+        if self.codec is not None and self.codec.codec!=CODEC_NONE:
+            if isinstance(data,bytes):
+                data=[data]
+            data=self.codec.compressChunks(data,self.domain)
+        if self.blobStore is not None:
+            old=self.digest
+            if isinstance(data,bytes):
+                self.digest=self.blobStore.put(data)
+            else:
+                self.digest=self.blobStore.putStream(data)
+            if old is not None:
+                self.blobStore.decref(old)
+            return
         if self.dataFilename is None:
             raise FileNotFoundError(str(self.dataFilename))
+        if isinstance(data,bytes):
+            data=[data]
         with open(self.dataFilename,'wb') as f:
-            f.write(data)
+            for chunk in data:
+                f.write(chunk)
 
-    def decode(self,data:str):
+    def release(self)->None:
         """
-        decode a line of data
+        let go of the stored data
+        """
+        if self.digest is not None:
+            self.blobStore.decref(self.digest)
+            self.digest=None
+        elif self.dataFilename is not None \
+            and os.path.isfile(self.dataFilename):
+            #
+            os.remove(self.dataFilename)
+
+    def decode(self,data:str,columns:typing.Optional[typing.List[str]]=None):
         """
-        data_a=data.split(',',3)
-        self.retrievalDate=datetime.datetime.strptime("",data_a[0].strip())
-        self.dataFilename=data_a[1].strip()
-        self.url=asUrl(data_a[2].strip())
+        decode a line of data
+
+        :param columns: the column names from the csv header
+            (if None, assumes the current csvHeader())
+        """
+        if columns is None:
+            columns=self.csvHeader().split(',')
+        # the url is always last, and may contain commas
+        values=dict(zip(columns,data.split(',',len(columns)-1)))
+        retrievalDate=values.get('retrievalDate','').strip()
+        if retrievalDate in ('','None'):
+            self.retrievalDate=None
+        else:
+            self.retrievalDate=datetime.datetime.fromisoformat(retrievalDate)
+        versionDate=values.get('versionDate','').strip()
+        if versionDate in ('','None'):
+            self.versionDate=self.retrievalDate
+        else:
+            self.versionDate=datetime.datetime.fromisoformat(versionDate)
+        dataFilename=values.get('dataFilename','').strip()
+        if dataFilename.startswith(_BLOB_PREFIX):
+            self.digest=dataFilename[len(_BLOB_PREFIX):]
+        else:
+            self.dataFilename=dataFilename
+        self.etag=urllib.parse.unquote(values.get('etag','').strip()) or None
+        self.lastModified=urllib.parse.unquote(
+            values.get('lastModified','').strip()) or None
+        self.cacheHeaders=dict(urllib.parse.parse_qsl(
+            values.get('headers','').strip()))
+        self.url=asUrl(values.get('url','').strip())
 
     def encode(self)->str:
         """
         encode a line of data
         """
-        return '%s,%s,%s'%(self.retrievalDate,self.dataFilename,self.url)
+        dataFilename=self.dataFilename
+        if self.digest is not None:
+            dataFilename=_BLOB_PREFIX+self.digest
+        return '%s,%s,%s,%s,%s,%s,%s'%(self.retrievalDate,self.versionDate,
+            dataFilename,
+            urllib.parse.quote(self.etag or '',safe=''),
+            urllib.parse.quote(self.lastModified or '',safe=''),
+            urllib.parse.urlencode(self.cacheHeaders),
+            self.url)
 
     def csvHeader(self)->str:
         """
         encode a line of data
         """
-        return 'retrievalDate,dataFilename,url'
+        return 'retrievalDate,versionDate,dataFilename,etag,lastModified,headers,url' # noqa: E501 # pylint: disable=line-too-long
 
 
 class Cache:
@@ -73,19 +262,93 @@ class Cache:
 
     def __init__(self,cacheLocation:URLCompatible,
         fetcher:typing.Optional[str]=None,
-        autosave:bool=False):
+        autosave:bool=False,
+        blobStore:typing.Optional[BlobStore]=None,
+        freshness:typing.Optional[FreshnessPolicy]=None,
+        checkpointEvery:int=1000,
+        shardDepth:int=2,
+        keepVersions:bool=True,
+        compression:typing.Optional[str]=None,
+        maxDiskBytes:typing.Optional[int]=None,
+        maxEntries:typing.Optional[int]=None,
+        maxAgeSeconds:typing.Optional[float]=None,
+        diskEvictionPolicy:typing.Union[str,EvictionPolicy]='lru',
+        janitorInterval:float=60.0):
         """
         :param cacheLocation: can be
             * a single cache file
             * a folder full of cache files
         :param fetcher: a fetcher tool to use if the cache hit fails
-        """
+        :param blobStore: if given, page data is kept in this shared
+            content-addressed store (deduplicating identical bodies)
+            instead of a file per page
+        :param freshness: if given, decides from the Cache-Control /
+            Expires headers when a cached page is stale (when no
+            explicit date is asked for)
+        :param checkpointEvery: changes are appended to a journal, and
+            the whole manifest is only rewritten after this many of them
+        :param shardDepth: how many levels of subdirectories to spread
+            the cached files across (eg 2 means "ab/cd/abcd...cache")
+            so no one directory gets huge.  0 puts them all in
+            cacheLocation.  See also migrate().
+        :param keepVersions: keep every retrieval of a page (so that
+            getCache(url,asOf=date) can look back in time) rather than
+            overwriting it
+        :param compression: compress pages at rest, with a dictionary
+            trained for each domain.  'zstd', 'zlib' (or 'gzip'),
+            'auto' for zstd if it is installed, or None (the default)
+            to store them as-is.  Either way, pages stored either way
+            can be read.  With a blobStore, no dictionaries are used,
+            so that the same page always compresses to the same blob
+            and is still deduplicated.
+        :param maxDiskBytes: evict pages once they take up more than
+            this (None is unlimited)
+        :param maxEntries: evict pages once there are more urls than
+            this (None is unlimited)
+        :param maxAgeSeconds: evict pages last stored longer ago than
+            this (None keeps them forever)
+        :param diskEvictionPolicy: which pages to evict when over the
+            limits.  'lru', 'lfu', 'gdsf' (size-aware), or an EvictionPolicy
+        :param janitorInterval: how often (in seconds) the background
+            thread checks the limits
+        """
+        if isinstance(cacheLocation,str):
+            cacheLocation=Path(cacheLocation)
         self.cacheLocation=cacheLocation
+        self.blobStore:typing.Optional[BlobStore]=blobStore
+        self.freshness:typing.Optional[FreshnessPolicy]=freshness
         self._currentCache:typing.Optional[str]=None
         self._dirty:bool=False
+        self.checkpointEvery:int=checkpointEvery
+        self.shardDepth:int=shardDepth
+        self.keepVersions:bool=keepVersions
+        if compression is None:
+            compression=CODEC_NONE
+        elif compression=='auto':
+            compression=None
+        self.codec:typing.Optional[BodyCodec]=None
+        if isinstance(self.cacheLocation,Path):
+            dictionaries=None
+            if blobStore is None:
+                dictionaries=self.cacheLocation/'dictionaries'
+            self.codec=BodyCodec(dictionaries,compression)
+        self._journal:typing.List[str]=[] # records not yet written
+        self._journalRecords:int=0 # records in the journal file
         self._fetcher:typing.Optional[str]=fetcher
         self.autosave:bool=autosave
+        # the latest version of each url
         self.cache:typing.Dict[typing.Optional[URL],CachedWebsite]={}
+        # every version of each url, oldest first, and their versionTimes
+        self._versions:typing.Dict[typing.Optional[URL],typing.List[CachedWebsite]]={} # noqa: E501 # pylint: disable=line-too-long
+        self._versionTimes:typing.Dict[typing.Optional[URL],typing.List[float]]={} # noqa: E501 # pylint: disable=line-too-long
+        self._lock=threading.RLock()
+        self.janitor:typing.Optional[CacheJanitor]=None
+        if maxDiskBytes is not None or maxEntries is not None \
+            or maxAgeSeconds is not None:
+            #
+            self.janitor=CacheJanitor(self,maxDiskBytes,maxEntries,
+                maxAgeSeconds,diskEvictionPolicy,janitorInterval)
+            self.janitor.start()
 
     @property
     def fetcher(self):
@@ -110,6 +373,14 @@ class Cache:
         """
         return self.cacheLocation/'manifest.csv'
 
+    @property
+    def journalFilename(self)->Path:
+        """
+        get the filename of the manifest journal
+        (changes since the manifest was last written out in full)
+        """
+        return self.cacheLocation/'manifest.journal'
+
     def __del__(self):
         """
         when this goes away, attempt to save
@@ -121,12 +392,16 @@ class Cache:
         decode manifest for the cache database
         """
         lines=data.split('\n')
+        columns=None
         if lines:
+            columns=lines[0].strip().split(',')
             lines=lines[1:]
         for line in lines:
-            cw=CachedWebsite()
-            cw.decode(line)
-            self.cache[cw.url]=cw
+            if not line.strip():
+                continue
+            cw=CachedWebsite(self.blobStore,self.codec)
+            cw.decode(line,columns)
+            self._addVersion(cw)
         self._dirty=False
 
     def encode(self)->str:
@@ -134,27 +409,183 @@ class Cache:
         encode manifest for the cache database
         """
         ret:typing.List[str]=[]
-        for v in self.cache.values():
+        for v in self._allVersions():
             if not ret:
                 ret.append(v.csvHeader())
             ret.append(v.encode())
         return '\n'.join(ret)
 
-    def save(self)->None:
+    def _allVersions(self)->typing.Iterable[CachedWebsite]:
         """
-        save out the manifest file
+        every version of every url
+        """
+        for versions in self._versions.values():
+            yield from versions
+
+    def _addVersion(self,cWebsite:CachedWebsite)->typing.Optional[CachedWebsite]: # noqa: E501 # pylint: disable=line-too-long
+        """
+        add a version to the time index (replacing the one with the same
+        versionDate, if any)
+
+        :return: the version that was replaced
+        """
+        url=cWebsite.url
+        versions=self._versions.setdefault(url,[])
+        times=self._versionTimes.setdefault(url,[])
+        versionTime=cWebsite.versionTime
+        replaced=None
+        i=bisect.bisect_left(times,versionTime)
+        if i<len(times) and times[i]==versionTime:
+            replaced=versions[i]
+            versions[i]=cWebsite
+        else:
+            versions.insert(i,cWebsite)
+            times.insert(i,versionTime)
+        self.cache[url]=versions[-1]
+        return replaced
+
+    def _dropVersions(self,url:URLCompatible)->typing.List[CachedWebsite]:
+        """
+        take every version of a url out of the index
+
+        :return: the versions removed
+        """
+        url=asUrl(url)
+        self.cache.pop(url,None)
+        self._versionTimes.pop(url,None)
+        return self._versions.pop(url,[])
+
+    def versions(self,url:URLCompatible)->typing.List[CachedWebsite]:
+        """
+        every cached version of a url, oldest first
         """
-        if self._dirty:
-            with open(self.filename,'w',encoding='utf-8') as f:
+        return list(self._versions.get(asUrl(url),[]))
+
+    def snapshot(self,
+        url:URLCompatible,
+        asOf:typing.Optional[datetime.datetime]=None
+        )->typing.Optional[CachedWebsite]:
+        """
+        get the version of a url as it was at a given time
+
+        :param asOf: the time (if None, the latest version)
+        :return: the newest version retrieved at or before asOf,
+            or None if there is not one
+        """
+        url=asUrl(url)
+        if asOf is None:
+            return self.cache.get(url)
+        times=self._versionTimes.get(url)
+        if not times:
+            return None
+        i=bisect.bisect_right(times,asOf.timestamp())
+        if i==0:
+            return None
+        return self._versions[url][i-1]
+
+    def _journalChange(self,
+        cWebsite:CachedWebsite,
+        replace:bool=False
+        )->None:
+        """
+        note that an entry was added or changed
+
+        :param replace: it replaces every other version of the url
+            (in one record, so there is no point at which a crash
+            leaves the url removed but not yet set again)
+        """
+        record=_JOURNAL_REPLACE if replace else _JOURNAL_SET
+        self._journal.append(record+cWebsite.encode())
+        self.dirty=True
+
+    def _journalRemove(self,url:URLCompatible)->None:
+        """
+        note that an entry was removed
+        """
+        self._journal.append(_JOURNAL_REMOVE+str(url))
+        self.dirty=True
+
+    def checkpoint(self)->None:
+        """
+        write out the whole manifest and start a new journal
+        """
+        with self._lock:
+            os.makedirs(self.cacheLocation,exist_ok=True)
+            tempName=self.filename.with_name(self.filename.name+'.tmp')
+            with open(tempName,'w',encoding='utf-8') as f:
                 f.write(self.encode())
+            os.replace(tempName,self.filename)
+            # (if we die right here, replaying the old journal on top of
+            # the new manifest comes out the same)
+            if self.journalFilename.exists():
+                os.remove(self.journalFilename)
+            self._journal=[]
+            self._journalRecords=0
+            self._dirty=False
+
+    def save(self)->None:
+        """
+        save out the manifest file
+
+        Usually this only appends the changes to the journal.
+        """
+        with self._lock:
+            if not self._dirty:
+                return
+            if not self._journal \
+                or not self.filename.exists() \
+                or self._journalRecords+len(self._journal)>=self.checkpointEvery: # noqa: E501 # pylint: disable=line-too-long
+                #
+                # (dirty with nothing journaled means somebody changed
+                # things behind our back, so write out everything)
+                self.checkpoint()
+                return
+            newJournal=not self.journalFilename.exists()
+            with open(self.journalFilename,'a',encoding='utf-8') as f:
+                if newJournal:
+                    f.write(CachedWebsite().csvHeader()+'\n')
+                for record in self._journal:
+                    f.write(record+'\n')
+            self._journalRecords+=len(self._journal)
+            self._journal=[]
             self._dirty=False
 
+    def _replayJournal(self)->None:
+        """
+        apply the changes in the journal on top of what was loaded
+        """
+        self._journalRecords=0
+        if not self.journalFilename.exists():
+            return
+        with open(self.journalFilename,'r',encoding='utf-8',errors='ignore') as f: # noqa: E501 # pylint: disable=line-too-long
+            lines=f.read().split('\n')
+        # the last line is either empty or was cut off part way through
+        lines=lines[:-1]
+        if not lines:
+            return
+        columns=lines[0].strip().split(',')
+        for line in lines[1:]:
+            if line.startswith((_JOURNAL_SET,_JOURNAL_REPLACE)):
+                cw=CachedWebsite(self.blobStore,self.codec)
+                cw.decode(line[len(_JOURNAL_SET):],columns)
+                if line.startswith(_JOURNAL_REPLACE):
+                    self._dropVersions(cw.url)
+                self._addVersion(cw)
+            elif line.startswith(_JOURNAL_REMOVE):
+                self._dropVersions(line[len(_JOURNAL_REMOVE):])
+            else:
+                continue
+            self._journalRecords+=1
+
     def load(self)->None:
         """
-        load the manifest file
+        load the manifest file (and replay the journal)
         """
-        with open(self.filename,'r',encoding='utf-8',errors='ignore') as f:
-            self.decode(f.read())
+        if self.filename.exists():
+            with open(self.filename,'r',encoding='utf-8',errors='ignore') as f: # noqa: E501 # pylint: disable=line-too-long
+                self.decode(f.read())
+        self._replayJournal()
+        self._journal=[]
         self._dirty=False
 
     @property
@@ -184,75 +615,241 @@ class Cache:
         """
         if hasattr(self.cacheLocation,'fetch'):
             return self.cacheLocation.fetch(url,date)
-        if not isinstance(self.cacheLocation,str):
-            raise Exception()
-        self.cacheLocation.makedirs()
+        os.makedirs(self.cacheLocation,exist_ok=True)
         data=self.getCache(url,date)
         if data is None:
-            data=self.fetcher.fetch(url)
-            self.setCache(url,data)
+            data=self._refetch(url)
+        return data
+
+    def _refetch(self,url:URLCompatible)->bytes:
+        """
+        fetch a url again (revalidating the cached copy if we can)
+        and update the cache
+        """
+        cWebsite=self.cache.get(asUrl(url))
+        if cWebsite is not None and cWebsite.hasValidators \
+            and hasattr(self.fetcher,'revalidate'):
+            #
+            # only have the server send it again if it has changed
+            result=self.fetcher.revalidate(url,cWebsite.asResponse())
+            if getattr(result,'notModified',False):
+                cWebsite.retrievalDate=datetime.datetime.now()
+                cWebsite.setValidators(result.headers)
+                with self._lock:
+                    self._journalChange(cWebsite)
+                self._janitorAdd(cWebsite.url)
+                return result[0]
+        else:
+            result=self.fetcher.fetch(url)
+        data=result
+        headers=getattr(result,'headers',None)
+        if isinstance(result,tuple):
+            data=result[0]
+        if headers is not None and self.freshness is not None \
+            and not self.freshness.isStorable(headers):
+            #
+            return data
+        self.setCache(url,data,headers=headers)
         return data
 
     def getCache(self,
         url:URLCompatible,
-        date:typing.Optional[datetime.datetime]=None
+        date:typing.Optional[datetime.datetime]=None,
+        asOf:typing.Optional[datetime.datetime]=None
         )->typing.Optional[bytes]:
         """
         getCache
 
         return None if the item is not in the cache, or
             it is out-of-date.  Otherwise returns the data.
-        """
+
+        :param date: if given, anything retrieved before this is
+            out-of-date.  Otherwise the freshness policy (if any) decides.
+        :param asOf: if given, get the page as it was at this time
+            (see snapshot()) rather than the latest
+        """
+        if asOf is not None:
+            v=self.snapshot(url,asOf)
+            return None if v is None else v.data
         v=self.cache.get(asUrl(url))
         if v is None:
             return None
-        if date is not None \
-            and v.retrievalDate is None \
-            or date is None \
-            or v.retrievalDate<date:
-            #
-            return None
+        if self.janitor is not None:
+            self.janitor.touch(v.url)
+        if date is not None:
+            if v.retrievalDate is None or v.retrievalDate<date:
+                return None
+        elif self.freshness is not None:
+            state=self.freshness.evaluate(v.headers,v.fetchTime)
+            if state==STALE:
+                return None
+            if state==STALE_WHILE_REVALIDATE:
+                refreshInBackground((id(self),str(url)),
+                    lambda: self._refetch(url))
         return v.data
 
-    def _nextFilename(self)->str:
+    def shardedFilename(self,name:str)->Path:
+        """
+        where a cached file with a given (hex) name belongs
+        """
+        directory=self.cacheLocation
+        for level in range(self.shardDepth):
+            directory=directory/name[level*2:level*2+2]
+        return directory/f"{name}.cache"
+
+    def _nextFilename(self)->Path:
         """
         get the next filename for a cached file
         """
-        return self.cacheLocation/f"{uuid.uuid4().hex}.cache"
+        filename=self.shardedFilename(uuid.uuid4().hex)
+        os.makedirs(filename.parent,exist_ok=True)
+        return filename
+
+    def migrate(self)->int:
+        """
+        move cached files that are not where shardDepth says they
+        belong (eg from an old flat cache directory) into place
+
+        :return: how many were moved
+        """
+        moved=0
+        for cWebsite in self._allVersions():
+            if cWebsite.dataFilename is None:
+                continue
+            oldFilename=Path(cWebsite.dataFilename)
+            newFilename=self.shardedFilename(oldFilename.stem)
+            if oldFilename==newFilename or not oldFilename.is_file():
+                continue
+            os.makedirs(newFilename.parent,exist_ok=True)
+            os.replace(oldFilename,newFilename)
+            cWebsite.dataFilename=str(newFilename)
+            moved+=1
+        if moved:
+            # everything moved, so might as well write it all out
+            self.checkpoint()
+        return moved
 
-    def setCache(self,url:URLCompatible,data:bytes,
-        retrievalDate:typing.Union[None,str,datetime.datetime]=None
+    def setCache(self,url:URLCompatible,
+        data:typing.Union[bytes,typing.Iterable[bytes]],
+        retrievalDate:typing.Union[None,str,datetime.datetime]=None,
+        headers:typing.Optional[typing.Mapping[str,str]]=None
         )->None:
         """
         set some url data
+
+        :param data: the data, or an iterable of chunks of it
+            (so that it can be streamed to disk)
+        :param headers: the response headers (to keep the ETag and
+            Last-Modified for revalidating later)
         """
         url=asUrl(url)
         if retrievalDate is None:
             retrievalDate=datetime.datetime.now()
+        elif not isinstance(retrievalDate,datetime.datetime):
+            retrievalDate=datetime.datetime.fromisoformat(str(retrievalDate))
+        replace=url in self.cache and not self.keepVersions
+        if replace:
+            with self._lock:
+                cWebsite=self.cache[url]
+                cWebsite.data=data
+                cWebsite.retrievalDate=retrievalDate
+                cWebsite.versionDate=retrievalDate
+                for old in self._dropVersions(url):
+                    if old is not cWebsite:
+                        old.release()
+                self._addVersion(cWebsite)
         else:
-            retrievalDate=datetime.datetime.strptime(
-                "",str(retrievalDate))
-        if url in self.cache:
-            cWebsite=self.cache[url]
-            cWebsite.data=data
-            cWebsite.retrievalDate=retrievalDate
-        else:
-            cWebsite=CachedWebsite()
-            cWebsite.url=url
-            cWebsite.dataFilename=self.cacheLocation
-            cWebsite.data=self._nextFilename()
+            cWebsite=CachedWebsite(self.blobStore,self.codec)
+            cWebsite.url=URL(url)
+            if self.blobStore is None:
+                cWebsite.dataFilename=self._nextFilename()
+            cWebsite.data=data # (written before locking, as it may be big)
             cWebsite.retrievalDate=retrievalDate
-            self.cache[URL(url)]=cWebsite
-        self.dirty=True
+            cWebsite.versionDate=retrievalDate
+            with self._lock:
+                replaced=self._addVersion(cWebsite)
+                if replaced is not None:
+                    replaced.release()
+        if headers is not None:
+            cWebsite.etag=None
+            cWebsite.lastModified=None
+            cWebsite.setValidators(headers)
+        with self._lock:
+            # (versionDate changed, so a replacement has to say so)
+            self._journalChange(cWebsite,replace)
+        self._janitorAdd(cWebsite.url)
+
+    def removeCache(self,url:URLCompatible)->None:
+        """
+        remove some url data (every version of it)
+        """
+        with self._lock:
+            versions=self._dropVersions(url)
+            for cWebsite in versions:
+                cWebsite.release()
+            if versions:
+                self._journalRemove(versions[0].url)
+                if self.janitor is not None:
+                    self.janitor.remove(versions[0].url)
+
+    def _sizeOnDisk(self,cWebsite:CachedWebsite)->int:
+        """
+        how much disk one version takes up
+        """
+        try:
+            return os.path.getsize(cWebsite.filename)
+        except (OSError,TypeError):
+            return 0
 
-    def __getattr__(self,url:URLCompatible)->bytes:
+    def _janitorAdd(self,url:URL)->None:
+        """
+        tell the janitor (if any) about a stored page
+        """
+        if self.janitor is None:
+            return
+        versions=self._versions.get(url)
+        if versions:
+            self.janitor.add(url,sum(self._sizeOnDisk(v) for v in versions),
+                versions[-1].fetchTime)
+
+    def _janitorEntries(self)->typing.Iterable[typing.Tuple[URL,int,float]]:
+        """
+        every url, how much disk it takes up, and when it was last stored
+        (for the janitor)
+        """
+        with self._lock:
+            items=list(self._versions.items())
+        now=time.time()
+        for url,versions in items:
+            yield (url,sum(self._sizeOnDisk(v) for v in versions),
+                versions[-1].fetchTime or now)
+
+    def _janitorEvict(self,urls:typing.Iterable[URL])->None:
+        """
+        remove pages (for the janitor)
+        """
+        with self._lock:
+            autosave=self.autosave
+            self.autosave=False # save once at the end, not for every page
+            try:
+                for url in urls:
+                    self.removeCache(url)
+            finally:
+                self.autosave=autosave
+            if autosave:
+                self.save()
+
+    def __getitem__(self,url:URLCompatible)->bytes:
         """
         Interesting feature:  You can say WebpageGetter[url] to get a webpage!
         """
         return self.fetch(url)
 
-    def __setattr__(self,url:URLCompatible,data:bytes)->None:
+    def __setitem__(self,url:URLCompatible,data:bytes)->None:
         """
         Interesting feature:  You can say WebpageGetter[url] to get a webpage!
         """
         return self.setCache(url,data)
+
+    def __delitem__(self,url:URLCompatible)->None:
+        self.removeCache(url)
@@ -0,0 +1,522 @@
+"""
+A process-wide pool of keep-alive http connections.
+
+Every getter goes through here so that fetching many pages from the
+same host only pays for the TCP/TLS handshake once.
+
+Compressed transfer (gzip/deflate/brotli) is asked for automatically
+and decoded a chunk at a time as the body is read.
+
+Requests that need to go through a proxy (per the usual *_proxy
+environment variables) are handed to urllib instead.
+
+USAGE:
+    from webFetch.connectionPool import urlopen,getConnectionPool
+    f=urlopen('https://example.com/')
+    html=f.read()
+    f.close() # the socket goes back to the pool, not away
+    print(getConnectionPool().stats())
+"""
+import typing
+import os
+import time
+import threading
+import collections
+import ssl
+import sys
+import http.client
+import urllib.parse
+import urllib.error
+import urllib.request
+from .contentEncoding import Decompressor,acceptEncoding,canDecode
+
+
+PoolKey=typing.Tuple[str,str,int] # (scheme,host,port)
+
+DEFAULT_USER_AGENT='Python-urllib/%d.%d'%sys.version_info[0:2]
+REDIRECT_STATUSES=(301,302,303,307,308)
+# safe to send again if a reused connection turns out to be dead
+IDEMPOTENT_METHODS=('GET','HEAD','OPTIONS','TRACE','PUT','DELETE')
+# not to be passed on when redirected to somewhere else
+CREDENTIAL_HEADERS=('authorization','cookie')
+
+
+class PooledResponse:
+    """
+    A response that gives its connection back to the pool
+    when it has been completely read (or closed).
+
+    Looks enough like what urllib.request.urlopen() returns that
+    callers do not need to care which one they got.
+
+    If the body has a Content-Encoding we asked for, read() returns
+    it already decoded, and the headers are changed to match
+    (no Content-Encoding, and no Content-Length since the decoded
+    length is not known up front).  wireHeaders are the originals.
+    """
+
+    def __init__(self,
+        pool:"ConnectionPool",
+        key:PoolKey,
+        conn:http.client.HTTPConnection,
+        response:http.client.HTTPResponse,
+        url:str,
+        decode:bool=False):
+        """
+        :param decode: decode the Content-Encoding as it is read
+        """
+        self._pool=pool
+        self._key=key
+        self._conn:typing.Optional[http.client.HTTPConnection]=conn
+        self._response=response
+        self.url:str=url
+        self.status:int=response.status
+        self.reason:str=response.reason
+        self.headers=response.headers
+        self.wireHeaders=response.headers
+        self.bytesOnWire:int=0
+        self.bytesDecoded:int=0
+        self._decoder:typing.Optional[Decompressor]=None
+        self._buffer:bytes=b''
+        self._eof:bool=False
+        encoding=response.getheader('Content-Encoding')
+        if decode and encoding and canDecode(encoding):
+            self._decoder=Decompressor(encoding)
+            self.headers=http.client.HTTPMessage()
+            for k,v in response.headers.items():
+                if k.lower() not in ('content-encoding','content-length'):
+                    self.headers[k]=v
+
+    def getheader(self,
+        name:str,
+        default:typing.Optional[str]=None
+        )->typing.Optional[str]:
+        """
+        get a response header
+        """
+        values=self.headers.get_all(name)
+        if not values:
+            return default
+        return ', '.join(values)
+
+    def getheaders(self)->typing.List[typing.Tuple[str,str]]:
+        """
+        get all response headers
+        """
+        return list(self.headers.items())
+
+    def geturl(self)->str:
+        """
+        the final url (after any redirects)
+        """
+        return self.url
+
+    @property
+    def decoded(self)->bool:
+        """
+        whether read() is undoing a Content-Encoding
+        """
+        return self._decoder is not None
+
+    def _readRaw(self,amt:typing.Optional[int])->bytes:
+        """
+        read bytes as they came over the wire
+        """
+        if self._conn is None:
+            return b''
+        data=self._response.read(amt)
+        self.bytesOnWire+=len(data)
+        return data
+
+    def _counted(self,data:bytes,wire:int)->bytes:
+        """
+        tally up bytes read for the stats
+        """
+        self.bytesDecoded+=len(data)
+        self._pool._countBytes(wire,len(data))
+        return data
+
+    def read(self,amt:typing.Optional[int]=None)->bytes:
+        """
+        read some (or all) of the response body
+        """
+        wireBefore=self.bytesOnWire
+        if self._decoder is None:
+            data=self._readRaw(amt)
+            if amt is None or not data or self._response.isclosed():
+                self._release()
+            return self._counted(data,self.bytesOnWire-wireBefore)
+        while not self._eof and (amt is None or len(self._buffer)<amt):
+            raw=self._readRaw(amt)
+            self._buffer+=self._decoder.decompress(raw)
+            if amt is None or not raw or self._response.isclosed():
+                self._buffer+=self._decoder.flush()
+                self._eof=True
+                self._release()
+        if amt is None:
+            data,self._buffer=self._buffer,b''
+        else:
+            data,self._buffer=self._buffer[:amt],self._buffer[amt:]
+        return self._counted(data,self.bytesOnWire-wireBefore)
+
+    def _release(self)->None:
+        """
+        give the connection back to the pool if it is reusable
+        """
+        conn,self._conn=self._conn,None
+        if conn is None:
+            return
+        if self._response.isclosed() and not self._response.will_close:
+            self._pool._checkin(self._key,conn)
+        else:
+            self._response.close()
+            conn.close()
+
+    def close(self)->None:
+        """
+        done with the response
+
+        (If it was not read to the end, the connection cannot be reused.)
+        """
+        self._eof=True
+        self._release()
+
+    def __enter__(self)->"PooledResponse":
+        return self
+
+    def __exit__(self,*args)->None:
+        self.close()
+
+    def __del__(self)->None:
+        self.close()
+
+
+class ConnectionPool:
+    """
+    A pool of idle keep-alive http connections, keyed by
+    (scheme,host,port)
+    """
+
+    def __init__(self,
+        maxPerHost:int=8,
+        idleTimeout:float=60.0,
+        timeout:float=30.0,
+        compress:bool=True,
+        proxies:typing.Optional[typing.Dict[str,str]]=None):
+        """
+        :param maxPerHost: how many idle connections to keep for each host
+        :param idleTimeout: seconds before an idle connection is discarded
+        :param timeout: socket timeout for new connections
+        :param compress: ask servers for compressed bodies (which are
+            then decoded transparently)
+        :param proxies: {scheme:proxyUrl} for requests that must go
+            through a proxy (if None, taken from the environment)
+        """
+        if proxies is None:
+            proxies=urllib.request.getproxies()
+        self.proxies:typing.Dict[str,str]=proxies
+        self._opener=urllib.request.build_opener(
+            urllib.request.ProxyHandler(proxies))
+        self.maxPerHost:int=maxPerHost
+        self.idleTimeout:float=idleTimeout
+        self.timeout:float=timeout
+        self.compress:bool=compress
+        self._idle:typing.Dict[PoolKey,typing.Deque[
+            typing.Tuple[http.client.HTTPConnection,float]]]={}
+        self._lock=threading.Lock()
+        self._sslContext:typing.Optional[ssl.SSLContext]=None
+        self.requests:int=0
+        self.connectionsOpened:int=0
+        self.connectionsReused:int=0
+        self.connectionsExpired:int=0
+        self.bytesOnWire:int=0
+        self.bytesDecoded:int=0
+
+    def stats(self)->typing.Dict[str,int]:
+        """
+        get the reuse and transfer counters
+
+        (hits are connections reused, so are handshakes saved.
+        bytesOnWire vs bytesDecoded shows what compression saved.)
+        """
+        with self._lock:
+            idle=sum(len(v) for v in self._idle.values())
+        return {
+            'requests':self.requests,
+            'hits':self.connectionsReused,
+            'misses':self.connectionsOpened,
+            'expired':self.connectionsExpired,
+            'idle':idle,
+            'bytesOnWire':self.bytesOnWire,
+            'bytesDecoded':self.bytesDecoded}
+
+    def _countBytes(self,wire:int,decoded:int)->None:
+        """
+        tally up bytes transferred
+        """
+        with self._lock:
+            self.bytesOnWire+=wire
+            self.bytesDecoded+=decoded
+
+    def _newConnection(self,
+        key:PoolKey,
+        timeout:typing.Optional[float]
+        )->http.client.HTTPConnection:
+        """
+        open a brand new connection
+        """
+        scheme,host,port=key
+        if timeout is None:
+            timeout=self.timeout
+        with self._lock:
+            self.connectionsOpened+=1
+        if scheme=='https':
+            if self._sslContext is None:
+                self._sslContext=ssl.create_default_context()
+            return http.client.HTTPSConnection(
+                host,port,timeout=timeout,context=self._sslContext)
+        return http.client.HTTPConnection(host,port,timeout=timeout)
+
+    def _checkout(self,
+        key:PoolKey,
+        timeout:typing.Optional[float]=None
+        )->typing.Optional[http.client.HTTPConnection]:
+        """
+        get an idle connection for this host, if there is one
+
+        :param timeout: socket timeout for this request
+            (the connection may have been opened with another one)
+        """
+        if timeout is None:
+            timeout=self.timeout
+        now=time.monotonic()
+        conn=None
+        with self._lock:
+            idle=self._idle.get(key)
+            while idle:
+                conn,lastUsed=idle.pop()
+                if now-lastUsed<=self.idleTimeout:
+                    self.connectionsReused+=1
+                    break
+                self.connectionsExpired+=1
+                conn.close()
+                conn=None
+        if conn is not None:
+            conn.timeout=timeout
+            if conn.sock is not None:
+                conn.sock.settimeout(timeout)
+        return conn
+
+    def _checkin(self,key:PoolKey,conn:http.client.HTTPConnection)->None:
+        """
+        return a connection to the idle pool
+        """
+        with self._lock:
+            idle=self._idle.setdefault(key,collections.deque())
+            idle.append((conn,time.monotonic()))
+            while len(idle)>self.maxPerHost:
+                oldest,_=idle.popleft()
+                oldest.close()
+
+    def closeAll(self)->None:
+        """
+        close all idle connections
+        """
+        with self._lock:
+            idle,self._idle=self._idle,{}
+        for connections in idle.values():
+            for conn,_ in connections:
+                conn.close()
+
+    def _proxied(self,scheme:str,host:str)->bool:
+        """
+        whether a request has to go through a proxy
+        """
+        if scheme not in self.proxies:
+            return False
+        return not urllib.request.proxy_bypass(host)
+
+    def urlopen(self,
+        url:typing.Union[str,urllib.request.Request],
+        data:typing.Optional[bytes]=None,
+        headers:typing.Optional[typing.Dict[str,str]]=None,
+        method:typing.Optional[str]=None,
+        timeout:typing.Optional[float]=None,
+        maxRedirects:int=10
+        )->PooledResponse:
+        """
+        Open a url, reusing an idle connection if there is one.
+
+        Acts like urllib.request.urlopen(), including following redirects
+        and raising urllib.error.HTTPError for error statuses.
+        Anything that is not http(s), or that has to go through a proxy,
+        is handed to urllib.
+
+        :param url: a url or a urllib.request.Request
+        """
+        allHeaders={'User-Agent':DEFAULT_USER_AGENT}
+        if isinstance(url,urllib.request.Request):
+            allHeaders.update(url.header_items())
+            if data is None:
+                data=url.data
+            if method is None:
+                method=url.get_method()
+            url=url.full_url
+        url=str(url)
+        if headers is not None:
+            allHeaders.update(headers)
+        if method is None:
+            method='GET' if data is None else 'POST'
+        if data is not None and 'content-type' not in (
+            k.lower() for k in allHeaders):
+            #
+            # (the same default urllib uses)
+            allHeaders['Content-Type']='application/x-www-form-urlencoded'
+        decode=False
+        if self.compress and 'accept-encoding' not in (
+            k.lower() for k in allHeaders):
+            #
+            allHeaders['Accept-Encoding']=acceptEncoding()
+            decode=True
+        origin:typing.Optional[PoolKey]=None
+        for _ in range(maxRedirects+1):
+            parsed=urllib.parse.urlsplit(url)
+            scheme=parsed.scheme.lower()
+            if scheme not in ('http','https') \
+                or self._proxied(scheme,parsed.hostname or ''):
+                #
+                if decode:
+                    # urllib will not decode it for us
+                    del allHeaders['Accept-Encoding']
+                req=urllib.request.Request(url,data,allHeaders,method=method)
+                if timeout is None:
+                    timeout=self.timeout
+                return self._opener.open(req,timeout=timeout)
+            port=parsed.port
+            if port is None:
+                port=443 if scheme=='https' else 80
+            key=(scheme,parsed.hostname or '',port)
+            if origin is None:
+                origin=key
+            elif key!=origin:
+                # redirected to another site, so keep credentials to ourselves
+                for k in list(allHeaders):
+                    if k.lower() in CREDENTIAL_HEADERS:
+                        del allHeaders[k]
+            path=urllib.parse.urlunsplit(('','',parsed.path or '/',parsed.query,'')) # noqa: E501 # pylint: disable=line-too-long
+            with self._lock:
+                self.requests+=1
+            conn,response=self._request(key,method,path,data,allHeaders,timeout) # noqa: E501 # pylint: disable=line-too-long
+            ret=PooledResponse(self,key,conn,response,url,decode)
+            location=ret.getheader('Location')
+            if ret.status in REDIRECT_STATUSES and location:
+                ret.read() # drain so the connection can be reused
+                ret.close()
+                url=urllib.parse.urljoin(url,location)
+                if ret.status==303 or (ret.status in (301,302) and method=='POST'): # noqa: E501 # pylint: disable=line-too-long
+                    method='GET'
+                    data=None
+                    for k in list(allHeaders):
+                        if k.lower() in ('content-type','content-length'):
+                            del allHeaders[k]
+                continue
+            if ret.status>=400:
+                raise urllib.error.HTTPError(
+                    url,ret.status,ret.reason,ret.headers,ret)
+            return ret
+        raise urllib.error.HTTPError(
+            url,ret.status,'Too many redirects',ret.headers,ret)
+
+    def _request(self,
+        key:PoolKey,
+        method:str,
+        path:str,
+        data:typing.Optional[bytes],
+        headers:typing.Dict[str,str],
+        timeout:typing.Optional[float]
+        )->typing.Tuple[http.client.HTTPConnection,http.client.HTTPResponse]:
+        """
+        send a request, on a pooled connection if possible
+
+        If a reused connection turns out to have been closed by the
+        server while it sat idle, retry once on a fresh one.
+        (Only if the method is idempotent, since the server may
+        have acted on it before the connection died.)
+        """
+        conn=self._checkout(key,timeout)
+        if conn is not None:
+            try:
+                conn.request(method,path,data,headers)
+                return conn,conn.getresponse()
+            except (http.client.HTTPException,ConnectionError,OSError):
+                conn.close()
+                if method.upper() not in IDEMPOTENT_METHODS:
+                    raise
+        conn=self._newConnection(key,timeout)
+        try:
+            conn.request(method,path,data,headers)
+            return conn,conn.getresponse()
+        except Exception:
+            conn.close()
+            raise
+
+
+def iterChunks(
+    f:typing.Any,
+    chunkSize:int=64*1024
+    )->typing.Generator[bytes,None,None]:
+    """
+    iterate over a response (or any file-like object) in chunks
+    """
+    while True:
+        chunk=f.read(chunkSize)
+        if not chunk:
+            break
+        yield chunk
+
+
+def streamToFile(
+    f:typing.Any,
+    path:typing.Union[str,"os.PathLike"],
+    chunkSize:int=1024*1024
+    )->int:
+    """
+    copy a response (or any file-like object) to disk a chunk at a time
+
+    returns the number of bytes written
+    """
+    size=0
+    with open(path,'wb') as out:
+        for chunk in iterChunks(f,chunkSize):
+            out.write(chunk)
+            size+=len(chunk)
+    return size
+
+
+_connectionPool:typing.Optional[ConnectionPool]=None
+_connectionPoolLock=threading.Lock()
+
+
+def getConnectionPool()->ConnectionPool:
+    """
+    get the process-wide connection pool
+    """
+    global _connectionPool
+    if _connectionPool is None:
+        with _connectionPoolLock:
+            if _connectionPool is None:
+                _connectionPool=ConnectionPool()
+    return _connectionPool
+
+
+def urlopen(
+    url:typing.Union[str,urllib.request.Request],
+    data:typing.Optional[bytes]=None,
+    headers:typing.Optional[typing.Dict[str,str]]=None,
+    method:typing.Optional[str]=None,
+    timeout:typing.Optional[float]=None
+    )->PooledResponse:
+    """
+    shortcut to open a url using the process-wide connection pool
+    """
+    return getConnectionPool().urlopen(url,data,headers,method,timeout)
@@ -0,0 +1,127 @@
+"""
+Incremental decoding of http Content-Encoding (gzip, deflate, brotli)
+
+Brotli is only used if the brotli (or brotlicffi) module is installed.
+"""
+import typing
+import zlib
+try:
+    import brotli # type: ignore
+    hasBrotli=True
+except ImportError:
+    try:
+        import brotlicffi as brotli # type: ignore
+        hasBrotli=True
+    except ImportError:
+        hasBrotli=False
+
+
+def acceptEncoding()->str:
+    """
+    the Accept-Encoding header value for what we are able to decode
+    """
+    encodings=['gzip','deflate']
+    if hasBrotli:
+        encodings.append('br')
+    return ', '.join(encodings)
+
+
+def canDecode(contentEncoding:typing.Optional[str])->bool:
+    """
+    whether we know how to decode a given Content-Encoding
+    """
+    if contentEncoding is None:
+        return True
+    contentEncoding=contentEncoding.strip().lower()
+    if contentEncoding in ('','identity','gzip','x-gzip','deflate'):
+        return True
+    return contentEncoding=='br' and hasBrotli
+
+
+def _isZlibHeader(data:bytes)->bool:
+    """
+    whether data starts with a zlib header (deflate method, valid check bits)
+    """
+    return (data[0]&0x0f)==8 and (data[0]*256+data[1])%31==0
+
+
+class Decompressor:
+    """
+    Decodes a Content-Encoding a chunk at a time
+    """
+
+    def __init__(self,contentEncoding:typing.Optional[str]):
+        """
+        :param contentEncoding: the Content-Encoding header value
+            (None or 'identity' passes data straight through)
+        """
+        if contentEncoding is None:
+            contentEncoding='identity'
+        self.contentEncoding:str=contentEncoding.strip().lower() or 'identity'
+        self._decoder:typing.Any=None
+        # the start of a deflate stream, until there is enough of it to
+        # tell whether it has a zlib header
+        self._head:typing.Optional[bytes]=None
+        if self.contentEncoding in ('gzip','x-gzip'):
+            self._decoder=zlib.decompressobj(16+zlib.MAX_WBITS)
+        elif self.contentEncoding=='deflate':
+            self._decoder=zlib.decompressobj(zlib.MAX_WBITS)
+            self._head=b''
+        elif self.contentEncoding=='br':
+            if not hasBrotli:
+                raise ValueError('brotli module is not installed')
+            self._decoder=brotli.Decompressor()
+        elif self.contentEncoding!='identity':
+            raise ValueError(f'Unknown Content-Encoding "{contentEncoding}"')
+
+    def decompress(self,data:bytes)->bytes:
+        """
+        decode the next chunk
+        """
+        if self._decoder is None or not data:
+            return data
+        if self.contentEncoding=='br':
+            if hasattr(self._decoder,'process'):
+                return self._decoder.process(data)
+            return self._decoder.decompress(data)
+        if self._head is not None:
+            data=self._head+data
+            if len(data)<2:
+                self._head=data
+                return b''
+            self._head=None
+            if not _isZlibHeader(data):
+                # plenty of servers send raw deflate without the zlib header
+                self._decoder=zlib.decompressobj(-zlib.MAX_WBITS)
+        return self._decoder.decompress(data)
+
+    def flush(self)->bytes:
+        """
+        get anything left over at the end of the stream
+        """
+        if self._decoder is None or self.contentEncoding=='br':
+            return b''
+        if self._head:
+            # (too short to be anything but raw deflate)
+            self._decoder=zlib.decompressobj(-zlib.MAX_WBITS)
+            data=self._decoder.decompress(self._head)
+            self._head=None
+            return data+self._decoder.flush()
+        return self._decoder.flush()
+
+
+def decodeChunks(
+    chunks:typing.Iterable[bytes],
+    contentEncoding:typing.Optional[str]
+    )->typing.Generator[bytes,None,None]:
+    """
+    decode an iterable of encoded chunks into decoded chunks
+    """
+    decoder=Decompressor(contentEncoding)
+    for chunk in chunks:
+        chunk=decoder.decompress(chunk)
+        if chunk:
+            yield chunk
+    chunk=decoder.flush()
+    if chunk:
+        yield chunk
@@ -0,0 +1,155 @@
+"""
+A persistent registry of which domains use javascript tricks
+(and therefore need to be rendered with a browser).
+
+Lookups are a set/dict check in memory.  If given a filename, entries
+are also kept in a small sqlite database so that what we learned
+survives restarts and is shared between worker processes.
+
+Each entry expires after a while, so that a site that stops using
+tricks gets probed again.
+"""
+import typing
+import time
+import threading
+import sqlite3
+
+
+class DomainRegistry:
+    """
+    A persistent registry of which domains use javascript tricks
+
+    Acts like the old trickyPages list:
+        if domain in registry: ...
+        registry.append(domain)
+    """
+
+    def __init__(self,
+        filename:typing.Optional[str]=None,
+        ttlSeconds:float=7*24*60*60,
+        refreshSeconds:float=60.0):
+        """
+        :param filename: sqlite file to persist to (if None, memory only)
+        :param ttlSeconds: how long an entry is trusted before the
+            domain gets probed again
+        :param refreshSeconds: how often to pick up entries other
+            processes have added to the file
+        """
+        self.filename:typing.Optional[str]=filename
+        self.ttlSeconds:float=ttlSeconds
+        self.refreshSeconds:float=refreshSeconds
+        self._expires:typing.Dict[str,float]={}
+        self._lock=threading.RLock()
+        self._db:typing.Optional[sqlite3.Connection]=None
+        self._lastRefresh:float=0.0
+        if filename is not None:
+            self._db=sqlite3.connect(filename,check_same_thread=False)
+            self._db.execute('PRAGMA journal_mode=WAL')
+            self._db.execute("""CREATE TABLE IF NOT EXISTS domains (
+                domain TEXT PRIMARY KEY,
+                expires REAL NOT NULL,
+                updated REAL NOT NULL)""")
+            self._db.execute("""CREATE INDEX IF NOT EXISTS domains_updated
+                ON domains(updated)""")
+            self._db.commit()
+            self.refresh()
+
+    def refresh(self)->None:
+        """
+        pick up anything that has changed in the file
+        """
+        if self._db is None:
+            return
+        now=time.time()
+        with self._lock:
+            rows=self._db.execute(
+                'SELECT domain,expires FROM domains WHERE updated>=?',
+                (self._lastRefresh,)).fetchall()
+            self._lastRefresh=now
+            for domain,expires in rows:
+                if expires>now:
+                    self._expires[domain]=expires
+                else:
+                    self._expires.pop(domain,None)
+
+    def _maybeRefresh(self)->None:
+        if self._db is not None \
+            and time.time()-self._lastRefresh>=self.refreshSeconds:
+            #
+            self.refresh()
+
+    def __contains__(self,domain:object)->bool:
+        """
+        whether a domain is known to be tricky (and the entry is current)
+        """
+        self._maybeRefresh()
+        with self._lock:
+            expires=self._expires.get(str(domain))
+            if expires is None:
+                return False
+            if expires<=time.time():
+                # expired, so let it be probed again
+                del self._expires[str(domain)]
+                return False
+            return True
+
+    def add(self,domain:str,ttlSeconds:typing.Optional[float]=None)->None:
+        """
+        mark a domain as tricky
+        """
+        if ttlSeconds is None:
+            ttlSeconds=self.ttlSeconds
+        now=time.time()
+        expires=now+ttlSeconds
+        with self._lock:
+            self._expires[domain]=expires
+            if self._db is not None:
+                self._db.execute(
+                    'INSERT OR REPLACE INTO domains VALUES (?,?,?)',
+                    (domain,expires,now))
+                self._db.commit()
+    append=add
+
+    def discard(self,domain:str)->None:
+        """
+        forget about a domain
+        """
+        with self._lock:
+            self._expires.pop(domain,None)
+            if self._db is not None:
+                # leave an expired entry so other processes hear about it
+                self._db.execute(
+                    'INSERT OR REPLACE INTO domains VALUES (?,0,?)',
+                    (domain,time.time()))
+                self._db.commit()
+    remove=discard
+
+    def purgeExpired(self)->None:
+        """
+        remove all expired entries
+        """
+        now=time.time()
+        with self._lock:
+            for domain in [k for k,v in self._expires.items() if v<=now]:
+                del self._expires[domain]
+            if self._db is not None:
+                self._db.execute('DELETE FROM domains WHERE expires<=?',(now,))
+                self._db.commit()
+
+    def __iter__(self)->typing.Iterator[str]:
+        now=time.time()
+        with self._lock:
+            domains=[k for k,v in self._expires.items() if v>now]
+        return iter(domains)
+
+    def __len__(self)->int:
+        return len(list(iter(self)))
+
+    def close(self)->None:
+        """
+        close the file
+        """
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db=None
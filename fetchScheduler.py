@@ -0,0 +1,183 @@
+"""
+A priority queue of things to fetch that is fair between hosts.
+
+Each host gets its own heap of items.  The hosts themselves sit in
+a heap ordered by the priority of their best item, and ties are broken
+by whichever host was served least recently, so hosts of equal
+priority are taken round-robin and one big site cannot starve the rest.
+
+Both push() and pop() are O(log n).
+"""
+import typing
+import heapq
+import itertools
+import urllib.parse
+
+
+T=typing.TypeVar('T')
+
+
+def hostOf(url:typing.Any)->str:
+    """
+    get the "scheme://host:port" part of a url
+    (anything that is not a url all lands under '')
+    """
+    url=str(url)
+    pos=url.find('://')
+    if pos<3 or pos>7:
+        return ''
+    return '/'.join(url.split('/',3)[0:3])
+
+
+def normalizeUrl(url:typing.Any)->str:
+    """
+    Normalize a url so that trivially different spellings of the
+    same page match each other
+    (lowercase scheme and host, no default port, no fragment)
+    """
+    parts=urllib.parse.urlsplit(str(url).strip())
+    scheme=parts.scheme.lower()
+    netloc=parts.netloc.lower()
+    if (scheme=='http' and netloc.endswith(':80')) \
+        or (scheme=='https' and netloc.endswith(':443')):
+        #
+        netloc=netloc.rsplit(':',1)[0]
+    path=parts.path
+    if not path and netloc:
+        path='/'
+    return urllib.parse.urlunsplit((scheme,netloc,path,parts.query,''))
+
+
+def hostOfUrl(url:typing.Any)->str:
+    """
+    get the lowercase host name of a url ('' if there is none)
+    """
+    return (urllib.parse.urlsplit(str(url).strip()).hostname or '').lower()
+
+
+class FetchScheduler(typing.Generic[T]):
+    """
+    A priority queue of things to fetch that is fair between hosts.
+
+    Higher priority items come out first.  Items of equal priority from
+    the same host come out in the order they went in.
+    """
+
+    def __init__(self)->None:
+        self._hosts:typing.Dict[str,typing.List[typing.Tuple[int,int,T]]]={}
+        self._hostHeap:typing.List[typing.Tuple[int,int,int,str]]=[]
+        self._hostVersions:typing.Dict[str,int]={}
+        self._sequence=itertools.count()
+        self._turn=itertools.count()
+        self._versions=itertools.count()
+        self._len:int=0
+
+    def __len__(self)->int:
+        return self._len
+
+    def __bool__(self)->bool:
+        return self._len>0
+
+    def hosts(self)->typing.Iterable[str]:
+        """
+        all the hosts that have something waiting
+        """
+        return self._hosts.keys()
+
+    def _scheduleHost(self,host:str)->None:
+        """
+        (re)place a host in the host heap according to its best item
+
+        Any entry already in the heap for this host goes stale and is
+        skipped when it comes up.
+        """
+        items=self._hosts.get(host)
+        if not items:
+            return
+        version=next(self._versions)
+        self._hostVersions[host]=version
+        heapq.heappush(self._hostHeap,
+            (items[0][0],next(self._turn),version,host))
+
+    def push(self,
+        item:T,
+        priority:int=0,
+        host:typing.Optional[str]=None
+        )->None:
+        """
+        add an item
+
+        :param item: the thing to schedule
+        :param priority: higher numbers come out first
+        :param host: which host it belongs to for fairness
+            (if None, will use hostOf(item))
+        """
+        if host is None:
+            host=hostOf(item)
+        entry=(-priority,next(self._sequence),item)
+        items=self._hosts.get(host)
+        if items is None:
+            items=[]
+            self._hosts[host]=items
+            heapq.heappush(items,entry)
+            self._scheduleHost(host)
+        else:
+            heapq.heappush(items,entry)
+            if items[0] is entry:
+                # jumped the line, so the host needs to move up too
+                self._scheduleHost(host)
+        self._len+=1
+
+    def _popHost(self,
+        isReady:typing.Optional[typing.Callable[[str],bool]]=None
+        )->typing.Optional[str]:
+        """
+        pop the next host that is due (and ready, if isReady is given)
+        """
+        skipped=[]
+        found=None
+        while self._hostHeap:
+            entry=heapq.heappop(self._hostHeap)
+            host=entry[3]
+            if self._hostVersions.get(host)!=entry[2]:
+                continue # stale
+            if isReady is not None and not isReady(host):
+                skipped.append(entry)
+                continue
+            found=host
+            break
+        for entry in skipped:
+            heapq.heappush(self._hostHeap,entry)
+        return found
+
+    def pop(self,
+        isReady:typing.Optional[typing.Callable[[str],bool]]=None
+        )->typing.Optional[T]:
+        """
+        take the next item, or None if there is nothing (ready)
+
+        :param isReady: if given, hosts for which this returns False
+            are passed over and keep their place in line
+        """
+        host=self._popHost(isReady)
+        if host is None:
+            return None
+        items=self._hosts[host]
+        _,_,item=heapq.heappop(items)
+        self._len-=1
+        if items:
+            # go to the back of the line for this priority
+            self._scheduleHost(host)
+        else:
+            del self._hosts[host]
+            del self._hostVersions[host]
+        return item
+
+    def clear(self)->None:
+        """
+        remove everything
+        """
+        self._hosts.clear()
+        self._hostHeap.clear()
+        self._hostVersions.clear()
+        self._len=0
@@ -0,0 +1,238 @@
+"""
+Decides whether a cached response is still fresh, along the lines of
+RFC 9111 (http caching).
+
+Freshness lifetime comes from (first one found):
+    * Cache-Control: s-maxage  (shared caches only)
+    * Cache-Control: max-age
+    * Expires
+    * a heuristic fraction of how long ago it was Last-Modified
+    * a default
+
+Cache-Control: stale-while-revalidate lets a stale response be served
+while it is refreshed in the background, and no-cache means it must
+always be revalidated.
+
+USAGE:
+    policy=FreshnessPolicy()
+    if policy.evaluate(headers,fetchTime)==FRESH:
+        # no need to touch the network
+"""
+import typing
+import time
+import logging
+import threading
+import email.utils
+
+
+FRESH='fresh'
+STALE_WHILE_REVALIDATE='stale-while-revalidate'
+STALE='stale'
+
+
+def parseCacheControl(value:typing.Optional[str])->typing.Dict[str,typing.Optional[str]]: # noqa: E501 # pylint: disable=line-too-long
+    """
+    parse a Cache-Control header into {directive:value or None}
+    """
+    ret:typing.Dict[str,typing.Optional[str]]={}
+    if not value:
+        return ret
+    for directive in value.split(','):
+        directive=directive.strip()
+        if not directive:
+            continue
+        name,eq,arg=directive.partition('=')
+        ret[name.strip().lower()]=arg.strip().strip('"') if eq else None
+    return ret
+
+
+def parseHttpDate(value:typing.Optional[str])->typing.Optional[float]:
+    """
+    parse an http date into a time.time() value (None if invalid)
+    """
+    if not value:
+        return None
+    try:
+        return email.utils.parsedate_to_datetime(value).timestamp()
+    except (TypeError,ValueError,IndexError):
+        return None
+
+
+def _seconds(value:typing.Optional[str])->typing.Optional[float]:
+    if value is None:
+        return None
+    try:
+        return max(0.0,float(int(value)))
+    except ValueError:
+        return None
+
+
+def _header(headers:typing.Mapping[str,str],name:str)->typing.Optional[str]:
+    name=name.lower()
+    for k,v in headers.items():
+        if k.lower()==name:
+            return v
+    return None
+
+
+class FreshnessPolicy:
+    """
+    Decides whether a cached response is still fresh
+    """
+
+    def __init__(self,
+        shared:bool=False,
+        heuristicFraction:float=0.1,
+        maxHeuristicSeconds:float=24*60*60,
+        defaultSeconds:float=0.0,
+        honorNoCache:bool=True):
+        """
+        :param shared: act as a shared cache (s-maxage applies and
+            private responses are not fresh)
+        :param heuristicFraction: with no explicit lifetime, a response
+            is fresh for this fraction of the time since it was
+            Last-Modified
+        :param maxHeuristicSeconds: cap on the heuristic lifetime
+        :param defaultSeconds: lifetime when there is nothing to go on
+        :param honorNoCache: if False, ignore no-cache (always use the
+            computed lifetime)
+        """
+        self.shared:bool=shared
+        self.heuristicFraction:float=heuristicFraction
+        self.maxHeuristicSeconds:float=maxHeuristicSeconds
+        self.defaultSeconds:float=defaultSeconds
+        self.honorNoCache:bool=honorNoCache
+
+    def isStorable(self,headers:typing.Mapping[str,str])->bool:
+        """
+        whether a response may be cached at all
+        """
+        cacheControl=parseCacheControl(_header(headers,'Cache-Control'))
+        if 'no-store' in cacheControl:
+            return False
+        return not (self.shared and 'private' in cacheControl)
+
+    def lifetime(self,
+        headers:typing.Mapping[str,str],
+        fetchTime:typing.Optional[float]=None
+        )->float:
+        """
+        how many seconds a response is fresh for
+
+        :param fetchTime: when the response was received (stands in for
+            a missing Date header)
+        """
+        cacheControl=parseCacheControl(_header(headers,'Cache-Control'))
+        if self.shared:
+            seconds=_seconds(cacheControl.get('s-maxage'))
+            if seconds is not None:
+                return seconds
+        seconds=_seconds(cacheControl.get('max-age'))
+        if seconds is not None:
+            return seconds
+        date=parseHttpDate(_header(headers,'Date'))
+        if date is None:
+            date=fetchTime
+        expires=_header(headers,'Expires')
+        if expires is not None:
+            expiresTime=parseHttpDate(expires)
+            if expiresTime is None:
+                return 0.0 # an invalid Expires means already expired
+            if date is None:
+                return 0.0 # nothing to measure it from
+            return max(0.0,expiresTime-date)
+        lastModified=parseHttpDate(_header(headers,'Last-Modified'))
+        if lastModified is not None and date is not None:
+            return min(self.maxHeuristicSeconds,
+                max(0.0,(date-lastModified)*self.heuristicFraction))
+        return self.defaultSeconds
+
+    def age(self,
+        headers:typing.Mapping[str,str],
+        fetchTime:float,
+        now:typing.Optional[float]=None
+        )->float:
+        """
+        how old a response is now
+        """
+        if now is None:
+            now=time.time()
+        initialAge=_seconds(_header(headers,'Age')) or 0.0
+        date=parseHttpDate(_header(headers,'Date'))
+        if date is not None:
+            initialAge=max(initialAge,fetchTime-date)
+        return initialAge+max(0.0,now-fetchTime)
+
+    def evaluate(self,
+        headers:typing.Optional[typing.Mapping[str,str]],
+        fetchTime:typing.Optional[float],
+        now:typing.Optional[float]=None
+        )->str:
+        """
+        decide whether a cached response can be used as is
+
+        :return: FRESH, STALE_WHILE_REVALIDATE (use it, but refresh it
+            in the background) or STALE (refresh it first)
+        """
+        if fetchTime is None:
+            # no idea how old it is (cached before we kept track)
+            return FRESH
+        if headers is None:
+            headers={}
+        cacheControl=parseCacheControl(_header(headers,'Cache-Control'))
+        if self.honorNoCache and 'no-cache' in cacheControl:
+            return STALE
+        if self.shared and 'private' in cacheControl:
+            return STALE
+        lifetime=self.lifetime(headers,fetchTime)
+        age=self.age(headers,fetchTime,now)
+        if age<lifetime:
+            return FRESH
+        if 'must-revalidate' in cacheControl \
+            or (self.shared and 'proxy-revalidate' in cacheControl):
+            #
+            return STALE
+        staleWhileRevalidate=_seconds(cacheControl.get('stale-while-revalidate')) # noqa: E501 # pylint: disable=line-too-long
+        if staleWhileRevalidate is not None \
+            and age<lifetime+staleWhileRevalidate:
+            #
+            return STALE_WHILE_REVALIDATE
+        return STALE
+
+    def evaluateResponse(self,
+        response:typing.Any,
+        now:typing.Optional[float]=None
+        )->str:
+        """
+        evaluate a WebFetchResponse (anything without headers and
+        a fetch time is treated as fresh)
+        """
+        return self.evaluate(getattr(response,'headers',None),
+            getattr(response,'fetchTime',None),now)
+
+
+_refreshing:typing.Set[typing.Any]=set()
+_refreshingLock=threading.Lock()
+def refreshInBackground(key:typing.Any,fn:typing.Callable[[],typing.Any])->bool: # noqa: E501 # pylint: disable=line-too-long
+    """
+    run fn in a background thread, unless a refresh for the same key
+    is already running
+
+    :return: whether a refresh was started
+    """
+    with _refreshingLock:
+        if key in _refreshing:
+            return False
+        _refreshing.add(key)
+    def run():
+        try:
+            fn()
+        except Exception:
+            # the stale copy stays in the cache
+            logging.getLogger(__name__).exception(
+                'background refresh of %s failed',key)
+        finally:
+            with _refreshingLock:
+                _refreshing.discard(key)
+    threading.Thread(target=run,name='refreshInBackground',daemon=True).start()
+    return True
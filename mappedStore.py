@@ -0,0 +1,284 @@
+"""
+A lazily-loaded, memory-mapped key/value file.
+
+Layout:
+    header      magic,version,indexOffset,indexLength
+    bodies      pickled values, one after the other
+    index       pickled (prevOffset,prevLength,{key:(offset,length)})
+    bodies...
+    index...
+
+Opening the file only reads the header and the index, and the rest is
+memory-mapped, so looking up an entry only touches that entry's bytes
+no matter how big the file is.
+
+Changes are kept in memory until save(), which appends the new bodies
+and an index of only what changed (a deleted key maps to None) that
+points back at the previous index, and only then points the header at
+it, so a crash part way through leaves the file as it was, and saving
+costs as much as the changes rather than the whole index.  Once the
+chain of indexes gets long, a full index (pointing back at nothing) is
+appended to start a new chain, and once the file is mostly garbage it
+is rewritten with only the live entries.
+"""
+import typing
+import os
+import mmap
+import struct
+import pickle
+import threading
+from pathlib import Path
+
+
+_MAGIC=b'WFMC'
+_VERSION=2 # (version 1 had a single {key:(offset,length)} index)
+# magic,version,indexOffset,indexLength
+_HEADER=struct.Struct('>4sHQQ')
+
+
+def isMappedStore(filename:typing.Union[str,Path])->bool:
+    """
+    whether a file is in the mapped store format
+    """
+    try:
+        with open(filename,'rb') as f:
+            return f.read(len(_MAGIC))==_MAGIC
+    except OSError:
+        return False
+
+
+class MappedStore(typing.MutableMapping[str,typing.Any]):
+    """
+    A lazily-loaded, memory-mapped key/value file.
+
+    Acts like a dict of str:anything-picklable.
+    """
+
+    def __init__(self,
+        filename:typing.Union[str,Path],
+        compactRatio:float=0.5,
+        maxIndexChain:int=64):
+        """
+        :param filename: the file to use (created on first save)
+        :param compactRatio: rewrite the file on save once this fraction
+            of it is garbage
+        :param maxIndexChain: start a new chain with a full index on
+            save once there are this many partial indexes to read when
+            opening the file
+        """
+        self.filename:Path=Path(filename)
+        self.compactRatio:float=compactRatio
+        self.maxIndexChain:int=maxIndexChain
+        self._index:typing.Dict[str,typing.Tuple[int,int]]={}
+        self._indexAt:typing.Tuple[int,int]=(0,0) # (offset,length)
+        self._indexChain:int=0
+        self._indexBytes:int=0 # (of the indexes in the chain)
+        self._version:int=_VERSION
+        self._pending:typing.Dict[str,typing.Any]={}
+        self._deleted:typing.Set[str]=set()
+        self._file:typing.Optional[typing.BinaryIO]=None
+        self._map:typing.Optional[mmap.mmap]=None
+        self._end:int=_HEADER.size
+        self._lock=threading.RLock()
+        self._open()
+
+    def _open(self)->None:
+        """
+        read the header and index, and map the file
+        """
+        self._close()
+        self._index={}
+        self._indexAt=(0,0)
+        self._indexChain=0
+        self._indexBytes=0
+        self._end=_HEADER.size
+        if not self.filename.exists():
+            return
+        self._file=open(self.filename,'rb')
+        header=self._file.read(_HEADER.size)
+        if len(header)<_HEADER.size:
+            raise ValueError(f'"{self.filename}" is not a mapped store')
+        magic,version,indexOffset,indexLength=_HEADER.unpack(header)
+        if magic!=_MAGIC or version not in (1,_VERSION):
+            raise ValueError(f'"{self.filename}" is not a mapped store')
+        self._version=version
+        self._indexAt=(indexOffset,indexLength)
+        # newest first
+        changes:typing.List[typing.Dict[str,typing.Any]]=[]
+        offset,length=indexOffset,indexLength
+        while length:
+            self._indexBytes+=length
+            self._file.seek(offset)
+            record=pickle.loads(self._file.read(length))
+            if version==1:
+                record=(0,0,record)
+            offset,length,changed=record
+            changes.append(changed)
+        self._indexChain=len(changes)
+        for changed in reversed(changes):
+            for key,entry in changed.items():
+                if entry is None:
+                    self._index.pop(key,None)
+                else:
+                    self._index[key]=entry
+        self._end=indexOffset+indexLength
+        if self._end>0 and os.path.getsize(self.filename)>0:
+            self._map=mmap.mmap(self._file.fileno(),0,access=mmap.ACCESS_READ)
+
+    def _close(self)->None:
+        if self._map is not None:
+            self._map.close()
+            self._map=None
+        if self._file is not None:
+            self._file.close()
+            self._file=None
+
+    def __getitem__(self,key:str)->typing.Any:
+        with self._lock:
+            if key in self._pending:
+                return self._pending[key]
+            if key in self._deleted:
+                raise KeyError(key)
+            offset,length=self._index[key]
+            data=self._map[offset:offset+length]
+        return pickle.loads(data)
+
+    def __setitem__(self,key:str,value:typing.Any)->None:
+        with self._lock:
+            self._pending[key]=value
+            self._deleted.discard(key)
+
+    def __delitem__(self,key:str)->None:
+        with self._lock:
+            if key not in self._pending and \
+                (key not in self._index or key in self._deleted):
+                #
+                raise KeyError(key)
+            self._pending.pop(key,None)
+            if key in self._index:
+                self._deleted.add(key)
+
+    def __contains__(self,key:object)->bool:
+        with self._lock:
+            if key in self._pending:
+                return True
+            return key in self._index and key not in self._deleted
+
+    def _keys(self)->typing.List[str]:
+        with self._lock:
+            keys=[k for k in self._index
+                if k not in self._deleted and k not in self._pending]
+            keys.extend(self._pending.keys())
+            return keys
+
+    def __iter__(self)->typing.Iterator[str]:
+        return iter(self._keys())
+
+    def __len__(self)->int:
+        return len(self._keys())
+
+    @property
+    def dirty(self)->bool:
+        """
+        whether there are changes that have not been saved
+        """
+        return bool(self._pending or self._deleted)
+
+    def _garbageRatio(self)->float:
+        """
+        roughly what fraction of the file is no longer used
+
+        (the indexes still in the chain are in use, and a new chain is
+        started rather than compacting when there are too many of them)
+        """
+        if self._end<=_HEADER.size:
+            return 0.0
+        live=sum(length for key,(_,length) in self._index.items()
+            if key not in self._deleted and key not in self._pending)
+        live+=self._indexBytes
+        return 1.0-live/(self._end-_HEADER.size)
+
+    def save(self)->None:
+        """
+        write out all changes
+        """
+        with self._lock:
+            if not self.dirty:
+                return
+            if not self.filename.exists() \
+                or self._version!=_VERSION \
+                or self._garbageRatio()>=self.compactRatio:
+                #
+                self.compact()
+                return
+            newChain=self._indexChain>=self.maxIndexChain
+            changed:typing.Dict[str,typing.Optional[typing.Tuple[int,int]]]={} # noqa: E501 # pylint: disable=line-too-long
+            if newChain:
+                # a full index, so nothing before it need be read
+                changed.update((k,v) for k,v in self._index.items()
+                    if k not in self._deleted)
+            else:
+                for key in self._deleted:
+                    changed[key]=None
+            self._close()
+            with open(self.filename,'r+b') as f:
+                f.seek(self._end)
+                for key,value in self._pending.items():
+                    data=pickle.dumps(value,protocol=pickle.HIGHEST_PROTOCOL)
+                    changed[key]=(f.tell(),len(data))
+                    f.write(data)
+                indexOffset=f.tell()
+                previous=(0,0) if newChain else self._indexAt
+                indexData=pickle.dumps((*previous,changed),
+                    protocol=pickle.HIGHEST_PROTOCOL)
+                f.write(indexData)
+                f.flush()
+                os.fsync(f.fileno())
+                # only now switch over to the new index
+                f.seek(0)
+                f.write(_HEADER.pack(_MAGIC,_VERSION,indexOffset,len(indexData))) # noqa: E501 # pylint: disable=line-too-long
+                f.flush()
+                os.fsync(f.fileno())
+            self._pending={}
+            self._deleted=set()
+            self._open()
+
+    def compact(self)->None:
+        """
+        rewrite the file with only the live entries (and any changes)
+        """
+        with self._lock:
+            tempName=self.filename.with_name(self.filename.name+'.tmp')
+            index:typing.Dict[str,typing.Tuple[int,int]]={}
+            with open(tempName,'wb') as f:
+                f.write(_HEADER.pack(_MAGIC,_VERSION,0,0))
+                for key,(offset,length) in self._index.items():
+                    if key in self._deleted or key in self._pending:
+                        continue
+                    index[key]=(f.tell(),length)
+                    f.write(self._map[offset:offset+length])
+                for key,value in self._pending.items():
+                    data=pickle.dumps(value,protocol=pickle.HIGHEST_PROTOCOL)
+                    index[key]=(f.tell(),len(data))
+                    f.write(data)
+                indexOffset=f.tell()
+                indexData=pickle.dumps((0,0,index),
+                    protocol=pickle.HIGHEST_PROTOCOL)
+                f.write(indexData)
+                f.seek(0)
+                f.write(_HEADER.pack(_MAGIC,_VERSION,indexOffset,len(indexData))) # noqa: E501 # pylint: disable=line-too-long
+                f.flush()
+                os.fsync(f.fileno())
+            self._close()
+            os.replace(tempName,self.filename)
+            self._pending={}
+            self._deleted=set()
+            self._open()
+
+    def close(self)->None:
+        """
+        save and close the file
+        """
+        with self._lock:
+            self.save()
+            self._close()
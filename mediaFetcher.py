@@ -9,9 +9,13 @@ import re
 import os
 from pathlib import Path
 import pickle
+import threading
+import concurrent.futures
 from datetime import date
 from paths import UrlCompatible,Url
 from webFetch import WebFetch
+from webFetch.blobStore import BlobStore
+from webFetch.rangedDownload import downloadResumable,downloadHashed
 
 
 class Download:
@@ -112,8 +116,27 @@ class MediaFetcher(WebFetch):
     Tool for downloading media from a website
     """
 
-    def __init__(self,downloadRecordsFile:str='downloadRecords.dat'):
+    def __init__(self,
+        downloadRecordsFile:str='downloadRecords.dat',
+        blobStore:typing.Optional[BlobStore]=None,
+        downloadSegments:int=1,
+        maxDownloads:int=4):
+        """
+        :param blobStore: if given, media is stored once in this shared
+            content-addressed store and hardlinked into place, so the same
+            file found under several names does not take up the space twice
+        :param downloadSegments: split large media into this many byte
+            ranges downloaded in parallel (if the server allows it)
+        :param maxDownloads: how many media files to download at once
+            (in the background, so finding pages is not held up)
+        """
         WebFetch.__init__(self)
+        self.blobStore:typing.Optional[BlobStore]=blobStore
+        self.downloadSegments:int=downloadSegments
+        self._downloads=concurrent.futures.ThreadPoolExecutor(
+            max(1,maxDownloads),thread_name_prefix='MediaFetcher')
+        self._pendingDownloads:typing.List[concurrent.futures.Future]=[]
+        self._recordsLock=threading.Lock()
         self.indexDir:typing.Optional[str]=None
         self.startFetchQueue:typing.Dict[str,Download]={}
         self.likeFetchQueue:typing.Dict[Url,typing.Tuple[str,str,Url]]={} # url:(name,downloadTo,originalUrl) # noqa: E501 # pylint: disable=line-too-long
@@ -144,8 +167,9 @@ class MediaFetcher(WebFetch):
                 open(self.downloadRecordsFile,'w+b'))
 
     def _addDownloadRecord(self,url:str,filename:str)->None:
-        self.downloadRecords[url]=filename
-        self._saveDownloadRecords()
+        with self._recordsLock:
+            self.downloadRecords[url]=filename
+            self._saveDownloadRecords()
 
     def saveAsMp3(self,mediaLocation:str,mp3FileName:str)->None:
         """
@@ -212,16 +236,12 @@ class MediaFetcher(WebFetch):
                 output.append(chr(int(z[i][:2],base=16))+z[i][2:])
         return ''.join(output)
 
-    def _resultsFound(self,
-        url:UrlCompatible,
-        data:typing.Union[str,bytes]
-        )->None:
+    def _mediaFilename(self,url:Url)->typing.Tuple[str,Path]:
         """
-        get the results found
+        take a media url off of the queue and decide where it goes
+
+        :return: (name,filename)
         """
-        url=Url(url)
-        if self.debug>=3:
-            print(f'_resultsFound {url}')
         name,downloadTo,originalUrl=self.likeFetchQueue[url]
         del self.likeFetchQueue[url]
         # figure out the file extension
@@ -236,18 +256,59 @@ class MediaFetcher(WebFetch):
                 extension=ext_a[-1]
             else:
                 extension='data'
-        # save the data
         filename=downloadTo/(name.strip().replace(' ','_')+'.'+extension)
-        if not isinstance(data,bytes):
-            data=data.encode('utf-8')
-        f=open(filename,'w+b')
-        f.write(data)
-        f.close()
+        return name,filename
+
+    def _recordDownload(self,url:Url,name:str,filename:Path)->None:
+        """
+        keep track of a finished media download
+        """
+        filename=str(filename)
         if os.sep!='/':
             filename=filename.replace(os.sep,'/')
-        self.links[name]='<b><a href="'+filename+'">'+name+'</a></b>'
+        with self._recordsLock:
+            self.links[name]='<b><a href="'+filename+'">'+name+'</a></b>'
         self._addDownloadRecord(url,'../'+filename)
 
+    def _downloadMedia(self,url:Url,name:str,filename:Path)->None:
+        """
+        download media straight to disk (runs on a download thread)
+
+        Large media is downloaded with Range requests to a .part file,
+        so if the connection drops it resumes rather than starting over.
+        """
+        if self.debug>=3:
+            print(f'_downloadMedia {url}')
+        if self.blobStore is None:
+            downloadResumable(url,filename,segments=self.downloadSegments)
+        else:
+            # hashed as it comes in, then moved into the shared store and
+            # hardlinked back into place (so it is only written once)
+            _,_,digest=downloadHashed(url,filename,
+                segments=self.downloadSegments)
+            digest=self.blobStore.putFile(filename,digest)
+            self.blobStore.linkTo(digest,filename)
+        self._recordDownload(url,name,filename)
+
+    def _queueDownload(self,url:UrlCompatible)->None:
+        """
+        start downloading a media url in the background
+        """
+        url=Url(url)
+        name,filename=self._mediaFilename(url)
+        self._pendingDownloads.append(
+            self._downloads.submit(self._downloadMedia,url,name,filename))
+
+    def waitForDownloads(self)->None:
+        """
+        wait for all of the media downloads to finish
+
+        (raises the first error, if any of them failed)
+        """
+        pending,self._pendingDownloads=self._pendingDownloads,[]
+        for future in pending:
+            future.result()
+
     def _startFound(self,baseUrl:UrlCompatible,html:str)->None:
         """
         This is called when an item has been downloaded
@@ -287,8 +348,7 @@ class MediaFetcher(WebFetch):
                 else:
                     self.likeFetchQueue[url]=(
                         filename,download.downloadTo,baseUrl)
-                    self.enqueue(self._resultsFound,url)
-                    self.runNext()
+                    self._queueDownload(url)
         if not found:
             # if the item is not retrieved, save out an html of
             # what actually was retrieved, to help determine the failure
@@ -316,7 +376,9 @@ class MediaFetcher(WebFetch):
     def getLinksHtml(self,title:typing.Optional[str]=None)->str:
         """
         Creates an html index of all the newly downloaded files.
+        (Waits for any downloads still going.)
         """
+        self.waitForDownloads()
         if title is None:
             title=date.today()
             title='Recordings for '+title.strftime('%a, %b %d %Y')
@@ -0,0 +1,410 @@
+"""
+A memory-budgeted cache tier.
+
+Keeps entries in memory up to a budget in bytes (not entries), and
+evicts according to a pluggable policy (LRU, LFU, GDSF, or TTL) once
+over it.
+
+If given a backing mapping (eg a SegmentStore on disk), the tier acts
+as a write-back cache in front of it: evicted entries that have not
+been written yet are spilled to the backing store, and misses are
+loaded back from it.
+
+USAGE:
+    hot=MemoryBudgetCache(64*1024*1024,'lru',backing=SegmentStore('pages'))
+    hot[url]=data
+    print(hot.stats())
+"""
+import typing
+import sys
+import time
+import heapq
+import threading
+import collections
+
+
+def sizeOf(value:typing.Any)->int:
+    """
+    roughly how many bytes a cached value takes up
+    (counts the payload, which is what matters for pages)
+    """
+    if isinstance(value,(bytes,bytearray,memoryview)):
+        return len(value)
+    if isinstance(value,str):
+        return len(value)
+    if isinstance(value,(tuple,list)):
+        return sum(sizeOf(v) for v in value)+sys.getsizeof(value)
+    if isinstance(value,dict):
+        return sum(sizeOf(k)+sizeOf(v) for k,v in value.items())+sys.getsizeof(value) # noqa: E501 # pylint: disable=line-too-long
+    return sys.getsizeof(value)
+
+
+class EvictionPolicy:
+    """
+    Decides what to evict.  Derived classes override these.
+    """
+
+    def add(self,key:str,size:int=1)->None:
+        """
+        a key was added
+
+        :param size: how big its entry is (for size-aware policies)
+        """
+
+    def touch(self,key:str)->None:
+        """
+        a key was used
+        """
+
+    def remove(self,key:str)->None:
+        """
+        a key went away
+        """
+
+    def victim(self)->typing.Optional[str]:
+        """
+        which key to evict next
+        """
+        raise NotImplementedError()
+
+    def isExpired(self,key:str)->bool:
+        """
+        whether a key should be evicted regardless of the budget
+        """
+        _=key
+        return False
+
+
+class LruPolicy(EvictionPolicy):
+    """
+    Evict the least recently used
+    """
+
+    def __init__(self):
+        self._order:typing.OrderedDict[str,None]=collections.OrderedDict()
+
+    def add(self,key:str,size:int=1)->None:
+        self._order[key]=None
+        self._order.move_to_end(key)
+
+    def touch(self,key:str)->None:
+        if key in self._order:
+            self._order.move_to_end(key)
+
+    def remove(self,key:str)->None:
+        self._order.pop(key,None)
+
+    def victim(self)->typing.Optional[str]:
+        return next(iter(self._order),None)
+
+
+class LfuPolicy(EvictionPolicy):
+    """
+    Evict the least frequently used (oldest first among ties)
+    """
+
+    def __init__(self):
+        self._counts:typing.Dict[str,int]={}
+        self._heap:typing.List[typing.Tuple[int,int,str]]=[]
+        self._seq:int=0
+
+    def _push(self,key:str)->None:
+        self._seq+=1
+        heapq.heappush(self._heap,(self._counts[key],self._seq,key))
+
+    def add(self,key:str,size:int=1)->None:
+        self._counts[key]=self._counts.get(key,0)+1
+        self._push(key)
+
+    def touch(self,key:str)->None:
+        if key in self._counts:
+            self._counts[key]+=1
+            self._push(key)
+
+    def remove(self,key:str)->None:
+        self._counts.pop(key,None)
+
+    def victim(self)->typing.Optional[str]:
+        while self._heap:
+            count,_,key=self._heap[0]
+            if self._counts.get(key)==count:
+                return key
+            heapq.heappop(self._heap) # stale entry
+        return None
+
+
+class GdsfPolicy(EvictionPolicy):
+    """
+    Greedy-Dual-Size-Frequency: evict whatever has the lowest
+    frequency/size (so big, rarely used entries go first), plus an
+    inflation value that rises with each eviction so that entries which
+    were popular long ago eventually age out.
+    """
+
+    def __init__(self):
+        self._counts:typing.Dict[str,int]={}
+        self._sizes:typing.Dict[str,int]={}
+        self._priorities:typing.Dict[str,float]={}
+        self._heap:typing.List[typing.Tuple[float,int,str]]=[]
+        self._seq:int=0
+        self.inflation:float=0.0
+
+    def _push(self,key:str)->None:
+        priority=self.inflation+self._counts[key]/self._sizes[key]
+        self._priorities[key]=priority
+        self._seq+=1
+        heapq.heappush(self._heap,(priority,self._seq,key))
+
+    def add(self,key:str,size:int=1)->None:
+        self._counts[key]=self._counts.get(key,0)+1
+        self._sizes[key]=max(1,size)
+        self._push(key)
+
+    def touch(self,key:str)->None:
+        if key in self._counts:
+            self._counts[key]+=1
+            self._push(key)
+
+    def remove(self,key:str)->None:
+        if key==self.victim():
+            # evicting the lowest priority entry is what inflates
+            self.inflation=self._priorities[key]
+        self._counts.pop(key,None)
+        self._sizes.pop(key,None)
+        self._priorities.pop(key,None)
+
+    def victim(self)->typing.Optional[str]:
+        while self._heap:
+            priority,_,key=self._heap[0]
+            if self._priorities.get(key)==priority:
+                return key
+            heapq.heappop(self._heap) # stale entry
+        return None
+
+
+class TtlPolicy(EvictionPolicy):
+    """
+    Evict entries once they have been in memory too long
+    (and the oldest first when over budget)
+    """
+
+    def __init__(self,ttlSeconds:float):
+        self.ttlSeconds:float=ttlSeconds
+        self._added:typing.OrderedDict[str,float]=collections.OrderedDict()
+
+    def add(self,key:str,size:int=1)->None:
+        self._added.pop(key,None)
+        self._added[key]=time.monotonic()
+
+    def remove(self,key:str)->None:
+        self._added.pop(key,None)
+
+    def victim(self)->typing.Optional[str]:
+        return next(iter(self._added),None)
+
+    def isExpired(self,key:str)->bool:
+        added=self._added.get(key)
+        return added is not None and time.monotonic()-added>self.ttlSeconds
+
+
+def makePolicy(
+    policy:typing.Union[str,EvictionPolicy]='lru',
+    ttlSeconds:typing.Optional[float]=None
+    )->EvictionPolicy:
+    """
+    get an EvictionPolicy by name ('lru', 'lfu', 'gdsf', or 'ttl')
+    """
+    if isinstance(policy,EvictionPolicy):
+        return policy
+    policy=policy.lower()
+    if policy=='lru':
+        return LruPolicy()
+    if policy=='lfu':
+        return LfuPolicy()
+    if policy=='gdsf':
+        return GdsfPolicy()
+    if policy=='ttl':
+        if ttlSeconds is None:
+            raise ValueError('ttl eviction requires ttlSeconds')
+        return TtlPolicy(ttlSeconds)
+    raise ValueError(f'Unknown eviction policy "{policy}"')
+
+
+class MemoryBudgetCache(typing.MutableMapping[str,typing.Any]):
+    """
+    A memory-budgeted cache tier.
+    """
+
+    def __init__(self,
+        maxBytes:int,
+        policy:typing.Union[str,EvictionPolicy]='lru',
+        ttlSeconds:typing.Optional[float]=None,
+        backing:typing.Optional[typing.MutableMapping[str,typing.Any]]=None,
+        sizer:typing.Callable[[typing.Any],int]=sizeOf):
+        """
+        :param maxBytes: how much to keep in memory
+        :param policy: 'lru', 'lfu', 'gdsf', 'ttl', or an EvictionPolicy
+        :param ttlSeconds: how long entries may stay in memory
+            (required for 'ttl')
+        :param backing: where evicted entries spill to and misses are
+            loaded from.  If None, evicted entries are simply dropped.
+        :param sizer: how to measure an entry
+        """
+        self.maxBytes:int=maxBytes
+        self.policy:EvictionPolicy=makePolicy(policy,ttlSeconds)
+        self.backing:typing.Optional[typing.MutableMapping[str,typing.Any]]=backing # noqa: E501 # pylint: disable=line-too-long
+        self.sizer=sizer
+        # key -> (value,size,dirty)
+        self._entries:typing.Dict[str,typing.Tuple[typing.Any,int,bool]]={}
+        self._lock=threading.RLock()
+        self.residentBytes:int=0
+        self.hits:int=0
+        self.misses:int=0
+        self.evictions:int=0
+        self.expirations:int=0
+        self.spills:int=0
+
+    def stats(self)->typing.Dict[str,int]:
+        """
+        get the usage counters
+        """
+        with self._lock:
+            return {
+                'entries':len(self._entries),
+                'residentBytes':self.residentBytes,
+                'maxBytes':self.maxBytes,
+                'hits':self.hits,
+                'misses':self.misses,
+                'evictions':self.evictions,
+                'expirations':self.expirations,
+                'spills':self.spills}
+
+    def _evict(self,key:str)->None:
+        """
+        push an entry out of memory (the lock must be held)
+        """
+        value,size,dirty=self._entries.pop(key)
+        self.policy.remove(key)
+        self.residentBytes-=size
+        self.evictions+=1
+        if dirty and self.backing is not None:
+            self.backing[key]=value
+            self.spills+=1
+
+    def _shrink(self)->None:
+        """
+        evict until we are within budget (the lock must be held)
+        """
+        key=self.policy.victim()
+        while key is not None and key in self._entries \
+            and self.policy.isExpired(key):
+            #
+            self._evict(key)
+            self.expirations+=1
+            key=self.policy.victim()
+        while self.residentBytes>self.maxBytes and self._entries:
+            key=self.policy.victim()
+            if key is None or key not in self._entries:
+                break
+            self._evict(key)
+
+    def _insert(self,key:str,value:typing.Any,dirty:bool)->None:
+        """
+        put an entry in memory (the lock must be held)
+        """
+        old=self._entries.get(key)
+        if old is not None:
+            self.residentBytes-=old[1]
+        size=self.sizer(value)
+        self._entries[key]=(value,size,dirty)
+        self.residentBytes+=size
+        self.policy.add(key,size)
+        self._shrink()
+
+    def _expire(self,key:str)->None:
+        """
+        push an entry out of memory if it has expired (the lock must be held)
+        """
+        if key in self._entries and self.policy.isExpired(key):
+            self._evict(key)
+            self.expirations+=1
+
+    def __getitem__(self,key:str)->typing.Any:
+        with self._lock:
+            self._expire(key)
+            entry=self._entries.get(key)
+            if entry is not None:
+                self.hits+=1
+                self.policy.touch(key)
+                return entry[0]
+            self.misses+=1
+            if self.backing is None:
+                raise KeyError(key)
+            value=self.backing[key]
+            self._insert(key,value,False)
+            return value
+
+    def __setitem__(self,key:str,value:typing.Any)->None:
+        with self._lock:
+            self._insert(key,value,self.backing is not None)
+
+    def __delitem__(self,key:str)->None:
+        with self._lock:
+            found=False
+            entry=self._entries.pop(key,None)
+            if entry is not None:
+                self.policy.remove(key)
+                self.residentBytes-=entry[1]
+                found=True
+            if self.backing is not None and key in self.backing:
+                del self.backing[key]
+                found=True
+            if not found:
+                raise KeyError(key)
+
+    def __contains__(self,key:object)->bool:
+        with self._lock:
+            self._expire(key)
+            if key in self._entries:
+                return True
+            return self.backing is not None and key in self.backing
+
+    def peek(self,key:str,default:typing.Any=None)->typing.Any:
+        """
+        get an entry without loading it into memory or counting it as used
+        """
+        with self._lock:
+            self._expire(key)
+            entry=self._entries.get(key)
+            if entry is not None:
+                return entry[0]
+            if self.backing is not None and key in self.backing:
+                return self.backing[key]
+            return default
+
+    def _keys(self)->typing.List[str]:
+        with self._lock:
+            for key in list(self._entries):
+                self._expire(key)
+            keys=list(self._entries.keys())
+            if self.backing is not None:
+                keys.extend(k for k in self.backing if k not in self._entries)
+            return keys
+
+    def __iter__(self)->typing.Iterator[str]:
+        return iter(self._keys())
+
+    def __len__(self)->int:
+        return len(self._keys())
+
+    def flush(self)->None:
+        """
+        write everything not yet in the backing store out to it
+        """
+        with self._lock:
+            if self.backing is None:
+                return
+            for key,(value,size,dirty) in list(self._entries.items()):
+                if dirty:
+                    self.backing[key]=value
+                    self._entries[key]=(value,size,False)
@@ -10,6 +10,7 @@ from paths import UrlCompatible,MimeType
 from .website import Website
 from .WebFetch import WebFetch
 from .urlGetter import WebpageGetter
+from .fetchScheduler import normalizeUrl
 
 try:
     from formats.plainhtml import PlainHtmlBookmarks # type: ignore # noqa: E501 # pylint: disable=import-error,line-too-long
@@ -129,18 +130,18 @@ class PersonalBackup(WebpageGetter):
         imageExtensions=['jpg','jpeg','jpe','gif','ico','bmp','png','svg']
         htmlExtensions=['htm','html','xhtml']
         htmlBuddyExtensions=['js','css']
-        fetchedUrls=[]
+        fetchedUrls=set() # normalized, so spelling differences still match
         urlsToFetch=[website.bookmark.url]
         while len(urlsToFetch) > 0:
             url=urlsToFetch[0]
             urlsToFetch=urlsToFetch[1:]
-            if url in fetchedUrls:
+            if normalizeUrl(url) in fetchedUrls:
                 continue
             if url in website.ignoreUrls:
                 continue
             print('getting '+url+' ...')
             page,mime=self._webfetch(url)
-            fetchedUrls.append(url)
+            fetchedUrls.add(normalizeUrl(url))
             if page is None:
                 print('ERR: retrieving page "'+url+'"... SKIPPED!')
                 continue
@@ -0,0 +1,261 @@
+"""
+Per-host politeness for crawling.
+
+Each host gets a token bucket (requests per second) and a cap on how
+many requests may be in flight to it at once.  Robots.txt is fetched
+once per host, cached for a while, and its Crawl-delay and Disallow
+rules are honored.
+
+This lets the crawl as a whole go as fast as it likes while each
+individual site only sees a trickle.
+"""
+import typing
+import time
+import threading
+import urllib.robotparser
+from .fetchScheduler import hostOf
+
+
+class TokenBucket:
+    """
+    A simple token bucket rate limiter
+    """
+
+    def __init__(self,rate:float,burst:float=1.0):
+        """
+        :param rate: tokens added per second (0 for unlimited)
+        :param burst: most tokens that can be saved up
+        """
+        self.rate:float=rate
+        self.burst:float=max(1.0,burst)
+        self.tokens:float=self.burst
+        self.lastUpdate:float=time.monotonic()
+
+    def _refill(self,now:float)->None:
+        if now<=self.lastUpdate:
+            # (a time read before this bucket was made, or last refilled)
+            return
+        if self.rate>0:
+            self.tokens=min(self.burst,
+                self.tokens+(now-self.lastUpdate)*self.rate)
+        self.lastUpdate=now
+
+    def waitTime(self,now:typing.Optional[float]=None)->float:
+        """
+        how many seconds until a token is available (0 if one is now)
+        """
+        if self.rate<=0:
+            return 0.0
+        if now is None:
+            now=time.monotonic()
+        self._refill(now)
+        if self.tokens>=1.0:
+            return 0.0
+        return (1.0-self.tokens)/self.rate
+
+    def tryAcquire(self,now:typing.Optional[float]=None)->bool:
+        """
+        take a token if there is one
+        """
+        if self.waitTime(now)>0:
+            return False
+        if self.rate>0:
+            self.tokens-=1.0
+        return True
+
+
+class RobotsCache:
+    """
+    Fetches and caches parsed robots.txt files, one per host
+    """
+
+    def __init__(self,userAgent:str='*',ttlSeconds:float=24*60*60):
+        """
+        :param userAgent: the agent name to match rules against
+        :param ttlSeconds: how long to keep a robots.txt before refetching
+        """
+        self.userAgent:str=userAgent
+        self.ttlSeconds:float=ttlSeconds
+        self._robots:typing.Dict[str,typing.Tuple[
+            urllib.robotparser.RobotFileParser,float]]={}
+        self._lock=threading.Lock()
+
+    def _fetch(self,host:str)->urllib.robotparser.RobotFileParser:
+        """
+        fetch and parse the robots.txt for a host
+
+        If it cannot be had, everything is allowed.
+        """
+        import urllib.error
+        from .connectionPool import urlopen
+        robots=urllib.robotparser.RobotFileParser(host+'/robots.txt')
+        try:
+            f=urlopen(host+'/robots.txt')
+            try:
+                lines=f.read().decode('utf-8','ignore').splitlines()
+            finally:
+                f.close()
+            robots.parse(lines)
+        except urllib.error.HTTPError as e:
+            if e.code in (401,403):
+                robots.disallow_all=True
+            else:
+                robots.allow_all=True
+        except Exception:
+            robots.allow_all=True
+        return robots
+
+    def get(self,host:str)->urllib.robotparser.RobotFileParser:
+        """
+        get the robots.txt for a host, fetching it if need be
+        """
+        now=time.monotonic()
+        with self._lock:
+            cached=self._robots.get(host)
+        if cached is not None and now-cached[1]<self.ttlSeconds:
+            return cached[0]
+        robots=self._fetch(host)
+        with self._lock:
+            self._robots[host]=(robots,now)
+        return robots
+
+    def isCached(self,host:str)->bool:
+        """
+        whether we have a current robots.txt for this host
+        """
+        with self._lock:
+            cached=self._robots.get(host)
+        return cached is not None \
+            and time.monotonic()-cached[1]<self.ttlSeconds
+
+    def allowed(self,url:str)->bool:
+        """
+        whether robots.txt allows us to fetch this url
+        """
+        host=hostOf(url)
+        if not host:
+            return True
+        return self.get(host).can_fetch(self.userAgent,url)
+
+    def crawlDelay(self,host:str)->typing.Optional[float]:
+        """
+        the Crawl-delay for a host, if it specifies one
+        """
+        delay=self.get(host).crawl_delay(self.userAgent)
+        if delay is None:
+            return None
+        return float(delay)
+
+
+class PolitenessLimiter:
+    """
+    Keeps track of how hard we are hitting each host
+    """
+
+    def __init__(self,
+        requestsPerSecond:float=1.0,
+        maxInFlight:int=2,
+        burst:float=1.0,
+        robots:typing.Union[None,bool,RobotsCache]=True):
+        """
+        :param requestsPerSecond: per-host request rate (0 for unlimited)
+        :param maxInFlight: per-host limit on simultaneous requests
+        :param burst: how many requests a host may get back-to-back
+        :param robots: True to honor robots.txt, False to ignore it,
+            or a RobotsCache to share
+        """
+        self.requestsPerSecond:float=requestsPerSecond
+        self.maxInFlight:int=maxInFlight
+        self.burst:float=burst
+        if robots is True:
+            robots=RobotsCache()
+        elif robots is False:
+            robots=None
+        self.robots:typing.Optional[RobotsCache]=robots
+        self._buckets:typing.Dict[str,TokenBucket]={}
+        self._inFlight:typing.Dict[str,int]={}
+        self._lock=threading.RLock()
+
+    def _bucket(self,host:str)->TokenBucket:
+        bucket=self._buckets.get(host)
+        if bucket is None:
+            bucket=TokenBucket(self.requestsPerSecond,self.burst)
+            self._buckets[host]=bucket
+        return bucket
+
+    def isReady(self,host:str)->bool:
+        """
+        whether a request to this host may go out right now
+        (does not use anything up - see acquire())
+        """
+        if not host:
+            return True
+        with self._lock:
+            if self._inFlight.get(host,0)>=self.maxInFlight:
+                return False
+            return self._bucket(host).waitTime()<=0
+
+    def acquire(self,host:str)->bool:
+        """
+        claim a request slot for this host, if one is ready
+        """
+        if not host:
+            return True
+        with self._lock:
+            if not self.isReady(host):
+                return False
+            self._bucket(host).tryAcquire()
+            self._inFlight[host]=self._inFlight.get(host,0)+1
+            return True
+
+    def release(self,host:str)->None:
+        """
+        a request to this host is done
+        """
+        if not host:
+            return
+        with self._lock:
+            count=self._inFlight.get(host,0)-1
+            if count>0:
+                self._inFlight[host]=count
+            else:
+                self._inFlight.pop(host,None)
+
+    def nextReadyIn(self,hosts:typing.Iterable[str])->float:
+        """
+        seconds until any of these hosts has a token
+
+        (hosts that are only blocked by maxInFlight are waiting on a
+        request to finish, not on time, and do not count)
+        """
+        now=time.monotonic()
+        best=float('inf')
+        with self._lock:
+            for host in hosts:
+                if not host:
+                    return 0.0
+                if self._inFlight.get(host,0)>=self.maxInFlight:
+                    continue
+                best=min(best,self._bucket(host).waitTime(now))
+        return best
+
+    def allowed(self,url:str)->bool:
+        """
+        Check robots.txt for the url.
+
+        The first time a host is seen this fetches its robots.txt, and
+        slows the host's bucket down to any Crawl-delay it asks for.
+        """
+        if self.robots is None:
+            return True
+        host=hostOf(url)
+        if not host:
+            return True
+        if not self.robots.isCached(host):
+            delay=self.robots.crawlDelay(host)
+            if delay is not None and delay>0:
+                with self._lock:
+                    bucket=self._bucket(host)
+                    if bucket.rate<=0 or bucket.rate>1.0/delay:
+                        bucket.rate=1.0/delay
+        return self.robots.allowed(url)
@@ -0,0 +1,471 @@
+"""
+Resumable downloads of large files using http Range requests.
+
+The download goes to "filename.part", with what we know about it kept
+in "filename.part.json".  If the connection drops (or the program is
+stopped) the next attempt picks up where it left off, sending If-Range
+so that if the file changed on the server in the meantime, we get the
+whole new file rather than a corrupt mix of the two.
+
+Optionally, big files can be split into several byte ranges that are
+downloaded in parallel.
+
+downloadHashed() does the same, and also hashes the file as it comes in
+(eg so it can be moved straight into a content-addressed store).
+
+USAGE:
+    path,mime=downloadResumable('http://example.com/big.mp4','big.mp4')
+"""
+import typing
+import os
+import json
+import time
+import hashlib
+import threading
+import http.client
+import urllib.error
+import concurrent.futures
+from pathlib import Path
+from .connectionPool import urlopen,iterChunks
+
+
+PART_EXT='.part'
+META_EXT='.part.json'
+
+# what can go wrong mid-download that is worth retrying
+RETRYABLE_ERRORS=(OSError,http.client.HTTPException)
+
+# while downloading segments, save how far each has got this often
+SAVE_EVERY_BYTES=4*1024*1024
+SAVE_EVERY_SECONDS=1.0
+
+
+class IncompleteDownload(IOError):
+    """
+    The connection closed before we got everything
+    (read(n) on a dropped connection just comes back short)
+    """
+
+
+class FileChangedError(Exception):
+    """
+    The file changed on the server part way through the download
+    """
+
+
+def _validatorOf(f:typing.Any)->typing.Optional[str]:
+    """
+    get something usable as an If-Range value from a response
+    (a strong ETag, or else Last-Modified)
+    """
+    etag=f.getheader('ETag')
+    if etag and not etag.startswith('W/'):
+        return etag
+    return f.getheader('Last-Modified')
+
+
+def _totalLength(f:typing.Any)->typing.Optional[int]:
+    """
+    get the full length of the file from a response
+    (from Content-Range if it is a partial response)
+    """
+    contentRange=f.getheader('Content-Range')
+    if contentRange and '/' in contentRange:
+        total=contentRange.rsplit('/',1)[1].strip()
+        if total.isdigit():
+            return int(total)
+    if f.status==200:
+        length=f.getheader('Content-Length')
+        if length and length.isdigit():
+            return int(length)
+    return None
+
+
+def _backoff(attempt:int)->None:
+    time.sleep(min(30.0,0.5*2**attempt))
+
+
+def _openWithRetries(
+    url:str,
+    headers:typing.Dict[str,str],
+    retries:int
+    )->typing.Any:
+    """
+    open a url, retrying (with backoff) if the connection fails
+    (http error statuses are raised right away)
+    """
+    attempt=0
+    while True:
+        try:
+            return urlopen(url,headers=headers)
+        except urllib.error.HTTPError:
+            raise
+        except RETRYABLE_ERRORS:
+            attempt+=1
+            if attempt>retries:
+                raise
+            _backoff(attempt)
+
+
+class _PartFile:
+    """
+    A .part file and its .part.json state
+    """
+
+    def __init__(self,
+        path:Path,
+        url:str,
+        hashName:typing.Optional[str]=None):
+        """
+        :param hashName: hash the file as it is written with this
+            hashlib algorithm (None for no hashing)
+        """
+        self.path:Path=path
+        self.part:Path=Path(str(path)+PART_EXT)
+        self.metaFile:Path=Path(str(path)+META_EXT)
+        self.url:str=url
+        self.meta:typing.Dict[str,typing.Any]={}
+        self.hashName:typing.Optional[str]=hashName
+        self.hasher:typing.Any=None
+        self.hashed:int=0 # how much of the .part file the hasher has seen
+        self._lock=threading.Lock()
+        self._unsaved:int=0 # segment bytes written since the last save
+        self._savedAt:float=0.0
+        if self.part.exists() and self.metaFile.exists():
+            try:
+                with open(self.metaFile,'r',encoding='utf-8') as f:
+                    meta=json.load(f)
+                if meta.get('url')==url:
+                    self.meta=meta
+            except (OSError,ValueError):
+                pass
+
+    def save(self)->None:
+        """
+        write out the state (atomically)
+        """
+        with self._lock:
+            self._save()
+
+    def _save(self)->None:
+        """
+        write out the state (the lock must be held)
+        """
+        tempName=str(self.metaFile)+'.tmp'
+        with open(tempName,'w',encoding='utf-8') as f:
+            json.dump(self.meta,f)
+        os.replace(tempName,self.metaFile)
+        self._unsaved=0
+        self._savedAt=time.time()
+
+    def progressed(self,segment:typing.List[int],length:int)->None:
+        """
+        length more bytes of a segment were written to the .part file
+
+        The state is only saved every so often, since all the segments
+        share it, and saving after every chunk would rewrite it from
+        every thread over and over.  (If we die in between, we just
+        download a little of it again.)
+        """
+        with self._lock:
+            segment[2]+=length
+            self._unsaved+=length
+            if self._unsaved>=SAVE_EVERY_BYTES \
+                or time.time()-self._savedAt>=SAVE_EVERY_SECONDS:
+                #
+                self._save()
+
+    def reset(self,**meta)->None:
+        """
+        start over
+        """
+        self.meta=dict(meta,url=self.url)
+        with open(self.part,'wb'):
+            pass
+        self.hasher=None
+        self.save()
+
+    def hashUpTo(self,offset:int)->None:
+        """
+        make sure the hasher has seen exactly the first offset bytes of
+        the .part file (reading them back in if need be)
+        """
+        if self.hashName is None:
+            return
+        if self.hasher is not None and self.hashed==offset:
+            return
+        self.hasher=hashlib.new(self.hashName)
+        self.hashed=0
+        with open(self.part,'rb') as f:
+            while self.hashed<offset:
+                chunk=f.read(min(1024*1024,offset-self.hashed))
+                if not chunk:
+                    break
+                self.hasher.update(chunk)
+                self.hashed+=len(chunk)
+
+    def written(self,chunk:bytes)->None:
+        """
+        a chunk was appended to the end of the .part file
+        """
+        if self.hasher is not None:
+            self.hasher.update(chunk)
+            self.hashed+=len(chunk)
+
+    def digest(self)->typing.Optional[str]:
+        """
+        the hash of the whole .part file (None if not hashing)
+        """
+        if self.hashName is None:
+            return None
+        self.hashUpTo(self.part.stat().st_size)
+        return self.hasher.hexdigest()
+
+    def finish(self)->None:
+        """
+        move the finished download into place
+        """
+        length=self.meta.get('length')
+        if length is not None and self.part.stat().st_size!=length:
+            raise IOError(f'Download of {self.url} is {self.part.stat().st_size} bytes, expected {length}') # noqa: E501 # pylint: disable=line-too-long
+        os.replace(self.part,self.path)
+        try:
+            os.remove(self.metaFile)
+        except FileNotFoundError:
+            pass
+
+
+def _downloadSingle(
+    state:_PartFile,
+    headers:typing.Dict[str,str],
+    chunkSize:int,
+    retries:int
+    )->None:
+    """
+    download (or resume downloading) in one stream
+    """
+    attempt=0
+    while True:
+        offset=state.part.stat().st_size if state.meta else 0
+        requestHeaders=dict(headers)
+        if offset>0 and state.meta.get('validator'):
+            requestHeaders['Range']=f'bytes={offset}-'
+            requestHeaders['If-Range']=state.meta['validator']
+        try:
+            f=urlopen(state.url,headers=requestHeaders)
+        except urllib.error.HTTPError as e:
+            if e.code==416 and offset>0 \
+                and offset==state.meta.get('length'):
+                #
+                return # we already had all of it
+            raise
+        except RETRYABLE_ERRORS:
+            attempt+=1
+            if attempt>retries:
+                raise
+            _backoff(attempt)
+            continue
+        try:
+            if f.status!=206 or offset==0:
+                # new download, or the file changed, or no range support
+                state.reset(validator=_validatorOf(f),
+                    length=_totalLength(f),mime=f.getheader('Content-Type'))
+            with open(state.part,'ab') as out:
+                state.hashUpTo(out.tell())
+                for chunk in iterChunks(f,chunkSize):
+                    out.write(chunk)
+                    state.written(chunk)
+            length=state.meta.get('length')
+            if length is not None and state.part.stat().st_size<length:
+                raise IncompleteDownload(state.url)
+            return
+        except RETRYABLE_ERRORS:
+            attempt+=1
+            if attempt>retries:
+                raise
+            _backoff(attempt)
+        finally:
+            f.close()
+
+
+def _downloadSegment(
+    state:_PartFile,
+    segment:typing.List[int],
+    headers:typing.Dict[str,str],
+    chunkSize:int,
+    retries:int
+    )->None:
+    """
+    download (or resume downloading) one [start,end,written] byte range
+    into its place in the .part file
+    """
+    start,end,_=segment
+    attempt=0
+    while start+segment[2]<=end:
+        requestHeaders=dict(headers)
+        requestHeaders['Range']=f'bytes={start+segment[2]}-{end}'
+        requestHeaders['If-Range']=state.meta['validator']
+        try:
+            f=urlopen(state.url,headers=requestHeaders)
+        except urllib.error.HTTPError:
+            raise # (an HTTPError is an OSError, but not worth retrying)
+        except RETRYABLE_ERRORS:
+            attempt+=1
+            if attempt>retries:
+                raise
+            _backoff(attempt)
+            continue
+        try:
+            if f.status!=206:
+                raise FileChangedError(state.url)
+            # (unbuffered, so whatever the state says was written, was,
+            # even if another segment's thread is the one saving it)
+            with open(state.part,'r+b',buffering=0) as out:
+                out.seek(start+segment[2])
+                for chunk in iterChunks(f,chunkSize):
+                    chunk=chunk[:end+1-start-segment[2]]
+                    out.write(chunk)
+                    state.progressed(segment,len(chunk))
+            if start+segment[2]<=end:
+                raise IncompleteDownload(state.url)
+        except RETRYABLE_ERRORS:
+            attempt+=1
+            if attempt>retries:
+                raise
+            _backoff(attempt)
+        finally:
+            f.close()
+            state.save()
+
+
+def _downloadSegmented(
+    state:_PartFile,
+    headers:typing.Dict[str,str],
+    segments:int,
+    minSegmentBytes:int,
+    chunkSize:int,
+    retries:int
+    )->bool:
+    """
+    download in several parallel byte ranges
+
+    :return: False if the server cannot do it (so the caller should
+        fall back to a single stream)
+    """
+    if not state.meta.get('segments'):
+        requestHeaders=dict(headers)
+        requestHeaders['Range']='bytes=0-0'
+        f=_openWithRetries(state.url,requestHeaders,retries)
+        try:
+            validator=_validatorOf(f)
+            length=_totalLength(f)
+            mime=f.getheader('Content-Type')
+            ranged=f.status==206
+        finally:
+            f.close()
+        if not ranged or validator is None or length is None \
+            or length<2*minSegmentBytes:
+            #
+            return False
+        count=max(1,min(segments,length//minSegmentBytes))
+        size=length//count
+        bounds=[[i*size,(i+1)*size-1 if i<count-1 else length-1,0]
+            for i in range(count)]
+        state.reset(validator=validator,length=length,mime=mime,
+            segments=bounds)
+        with open(state.part,'r+b') as out:
+            out.truncate(length)
+    with concurrent.futures.ThreadPoolExecutor(
+        len(state.meta['segments'])) as pool:
+        #
+        futures=[pool.submit(_downloadSegment,state,segment,headers,
+            chunkSize,retries) for segment in state.meta['segments']]
+        for future in futures:
+            future.result()
+    return True
+
+
+def downloadResumable(
+    url:str,
+    path:typing.Union[str,Path],
+    chunkSize:int=1024*1024,
+    segments:int=1,
+    minSegmentBytes:int=16*1024*1024,
+    retries:int=5,
+    headers:typing.Optional[typing.Dict[str,str]]=None
+    )->typing.Tuple[Path,typing.Optional[str]]:
+    """
+    Download a url to disk, resuming a previous partial download if
+    there is one, and retrying with Range requests if the connection
+    drops.
+
+    :param chunkSize: how much to hold in memory at a time
+    :param segments: split big files into this many byte ranges
+        downloaded in parallel (if the server allows it)
+    :param minSegmentBytes: do not make segments smaller than this
+    :param retries: how many times to retry after an error
+    :param headers: any extra request headers
+
+    :return: (path,mimetype)
+    """
+    path,mime,_=_download(url,path,chunkSize,segments,minSegmentBytes,
+        retries,headers)
+    return path,mime
+
+
+def downloadHashed(
+    url:str,
+    path:typing.Union[str,Path],
+    hashName:str='sha256',
+    chunkSize:int=1024*1024,
+    segments:int=1,
+    minSegmentBytes:int=16*1024*1024,
+    retries:int=5,
+    headers:typing.Optional[typing.Dict[str,str]]=None
+    )->typing.Tuple[Path,typing.Optional[str],str]:
+    """
+    Same as downloadResumable(), but also hashes the file as it comes in
+    (segmented downloads, and what a resumed download already had, are
+    read back in to hash them)
+
+    :param hashName: the hashlib algorithm to use
+
+    :return: (path,mimetype,hexdigest)
+    """
+    return _download(url,path,chunkSize,segments,minSegmentBytes,
+        retries,headers,hashName)
+
+
+def _download(
+    url:str,
+    path:typing.Union[str,Path],
+    chunkSize:int,
+    segments:int,
+    minSegmentBytes:int,
+    retries:int,
+    headers:typing.Optional[typing.Dict[str,str]],
+    hashName:typing.Optional[str]=None
+    )->typing.Tuple[Path,typing.Optional[str],typing.Optional[str]]:
+    """
+    does the work of downloadResumable() and downloadHashed()
+    """
+    path=Path(path)
+    url=str(url)
+    requestHeaders={'Accept-Encoding':'identity'} # ranges are of the raw bytes
+    if headers is not None:
+        requestHeaders.update(headers)
+    state=_PartFile(path,url,hashName)
+    done=False
+    if segments>1 or state.meta.get('segments'):
+        try:
+            done=_downloadSegmented(state,requestHeaders,segments,
+                minSegmentBytes,chunkSize,retries)
+        except FileChangedError:
+            state.meta={} # start over
+    if not done:
+        if state.meta.get('segments'):
+            state.meta={} # can't resume a segmented download as a stream
+        _downloadSingle(state,requestHeaders,chunkSize,retries)
+    digest=state.digest()
+    state.finish()
+    return path,state.meta.get('mime'),digest
@@ -0,0 +1,367 @@
+"""
+An append-only, log-structured key/value store.
+
+Every write is appended to the current segment file, and an in-memory
+index remembers where the latest value for each key lives, so a write
+costs O(1) no matter how big the store gets.  Old segments are compacted
+in a background thread to reclaim the space taken by overwritten and
+deleted entries.
+
+Each record carries a sequence number and a checksum, so:
+    * a record that was only half written when the process died is
+        detected and dropped on the next open
+    * if compaction is interrupted, the duplicate records it leaves
+        behind sort themselves out on the next open (old segments are
+        deleted oldest records first, so a delete can never be removed
+        before the value it deleted)
+"""
+import typing
+import os
+import struct
+import zlib
+import pickle
+import threading
+from pathlib import Path
+
+
+# op,sequence,keyLength,valueLength,crc32
+_HEADER=struct.Struct('>BQIII')
+_OP_PUT=1
+_OP_DELETE=2
+_SEGMENT_EXT='.seg'
+
+# key -> (segmentId,valueOffset,valueLength,sequence)
+IndexEntry=typing.Tuple[int,int,int,int]
+
+
+class SegmentStore(typing.MutableMapping[str,typing.Any]):
+    """
+    An append-only, log-structured key/value store.
+
+    Acts like a dict of str:anything-picklable.
+    """
+
+    def __init__(self,
+        directory:typing.Union[str,Path],
+        maxSegmentBytes:int=64*1024*1024,
+        compactRatio:float=0.5,
+        backgroundCompaction:bool=True,
+        fsync:bool=False):
+        """
+        :param directory: where the segment files live
+        :param maxSegmentBytes: start a new segment after this size
+        :param compactRatio: compact once this fraction of the sealed
+            segments is garbage
+        :param backgroundCompaction: compact automatically in a
+            background thread (else call compact() yourself)
+        :param fsync: fsync after every write (slower, but survives
+            power loss as well as process death)
+        """
+        self.directory:Path=Path(directory)
+        self.maxSegmentBytes:int=maxSegmentBytes
+        self.compactRatio:float=compactRatio
+        self.backgroundCompaction:bool=backgroundCompaction
+        self.fsync:bool=fsync
+        self._index:typing.Dict[str,IndexEntry]={}
+        self._segmentSizes:typing.Dict[int,int]={}
+        self._liveBytes:typing.Dict[int,int]={}
+        # the newest sequence number in each segment
+        self._maxSequence:typing.Dict[int,int]={}
+        self._readers:typing.Dict[int,typing.BinaryIO]={}
+        self._lock=threading.RLock()
+        self._compactLock=threading.Lock()
+        self._compactThread:typing.Optional[threading.Thread]=None
+        self._sequence:int=0
+        self.directory.mkdir(parents=True,exist_ok=True)
+        self._load()
+        self._nextId:int=max(self._segmentSizes,default=0)+1
+        lastId=max(self._segmentSizes,default=None)
+        if lastId is not None \
+            and self._segmentSizes[lastId]<self.maxSegmentBytes:
+            #
+            # carry on appending to where we left off
+            self._activeId:int=lastId
+        else:
+            self._activeId=self._newSegmentId()
+            self._segmentSizes[self._activeId]=0
+            self._liveBytes[self._activeId]=0
+        # (opened on the first write, so no empty segment files are left)
+        self._active:typing.Optional[typing.BinaryIO]=None
+
+    def _newSegmentId(self)->int:
+        segmentId=self._nextId
+        self._nextId+=1
+        return segmentId
+
+    def _segmentPath(self,segmentId:int)->Path:
+        return self.directory/f'{segmentId:08d}{_SEGMENT_EXT}'
+
+    def _activeFile(self)->typing.BinaryIO:
+        """
+        the active segment, opened if need be (the lock must be held)
+        """
+        if self._active is None:
+            self._active=open(self._segmentPath(self._activeId),'ab')
+        return self._active
+
+    def _load(self)->None:
+        """
+        rebuild the index by replaying every segment
+        """
+        deleted:typing.Dict[str,int]={}
+        for filename in sorted(self.directory.glob('*'+_SEGMENT_EXT)):
+            try:
+                segmentId=int(filename.stem)
+            except ValueError:
+                continue
+            size=0
+            with open(filename,'rb') as f:
+                while True:
+                    header=f.read(_HEADER.size)
+                    if len(header)<_HEADER.size:
+                        break
+                    op,sequence,keyLength,valueLength,crc=_HEADER.unpack(header) # noqa: E501 # pylint: disable=line-too-long
+                    body=f.read(keyLength+valueLength)
+                    if len(body)<keyLength+valueLength \
+                        or zlib.crc32(body)!=crc:
+                        #
+                        break # torn write at the end of the log
+                    key=body[:keyLength].decode('utf-8')
+                    self._sequence=max(self._sequence,sequence)
+                    self._maxSequence[segmentId]=max(
+                        self._maxSequence.get(segmentId,0),sequence)
+                    current=self._index.get(key)
+                    newest=max(
+                        current[3] if current is not None else -1,
+                        deleted.get(key,-1))
+                    if sequence>newest:
+                        if op==_OP_PUT:
+                            self._index[key]=(segmentId,
+                                size+_HEADER.size+keyLength,
+                                valueLength,sequence)
+                            deleted.pop(key,None)
+                        else:
+                            self._index.pop(key,None)
+                            deleted[key]=sequence
+                    size+=_HEADER.size+keyLength+valueLength
+            if size<filename.stat().st_size:
+                # chop off the torn write so appends stay aligned
+                with open(filename,'r+b') as f:
+                    f.truncate(size)
+            self._segmentSizes[segmentId]=size
+            self._liveBytes.setdefault(segmentId,0)
+        for segmentId,_,valueLength,_ in self._index.values():
+            self._liveBytes[segmentId]+=valueLength
+
+    def _append(self,
+        op:int,
+        key:str,
+        value:bytes,
+        out:typing.Optional[typing.BinaryIO]=None,
+        sequence:typing.Optional[int]=None
+        )->typing.Tuple[int,int]:
+        """
+        append a record (the lock must be held if out is None)
+
+        :return: (sequence,offset of the value)
+        """
+        if out is None:
+            out=self._activeFile()
+        if sequence is None:
+            self._sequence+=1
+            sequence=self._sequence
+        if out is self._active:
+            self._maxSequence[self._activeId]=sequence
+        keyBytes=key.encode('utf-8')
+        body=keyBytes+value
+        offset=out.tell()
+        out.write(_HEADER.pack(op,sequence,len(keyBytes),len(value),
+            zlib.crc32(body)))
+        out.write(body)
+        return sequence,offset+_HEADER.size+len(keyBytes)
+
+    def _afterWrite(self)->None:
+        """
+        flush the active segment, and maybe roll over or compact
+        """
+        self._active.flush()
+        if self.fsync:
+            os.fsync(self._active.fileno())
+        size=self._active.tell()
+        self._segmentSizes[self._activeId]=size
+        if size>=self.maxSegmentBytes:
+            self._roll()
+            if self.backgroundCompaction and self._needsCompaction():
+                self.compactInBackground()
+
+    def _roll(self)->None:
+        """
+        seal the active segment and start a new one
+        """
+        if self._active is not None:
+            self._active.close()
+            self._active=None
+        self._activeId=self._newSegmentId()
+        self._segmentSizes[self._activeId]=0
+        self._liveBytes[self._activeId]=0
+
+    def _forget(self,key:str)->None:
+        """
+        account for an entry going away (the lock must be held)
+        """
+        old=self._index.pop(key,None)
+        if old is not None:
+            self._liveBytes[old[0]]-=old[2]
+
+    def __setitem__(self,key:str,value:typing.Any)->None:
+        data=pickle.dumps(value,protocol=pickle.HIGHEST_PROTOCOL)
+        with self._lock:
+            sequence,offset=self._append(_OP_PUT,key,data)
+            self._forget(key)
+            self._index[key]=(self._activeId,offset,len(data),sequence)
+            self._liveBytes[self._activeId]+=len(data)
+            self._afterWrite()
+
+    def __delitem__(self,key:str)->None:
+        with self._lock:
+            if key not in self._index:
+                raise KeyError(key)
+            self._append(_OP_DELETE,key,b'')
+            self._forget(key)
+            self._afterWrite()
+
+    def _read(self,segmentId:int,offset:int,length:int)->bytes:
+        """
+        read raw bytes from a segment (the lock must be held)
+        """
+        if segmentId==self._activeId and self._active is not None:
+            self._active.flush()
+        f=self._readers.get(segmentId)
+        if f is None:
+            f=open(self._segmentPath(segmentId),'rb')
+            self._readers[segmentId]=f
+        f.seek(offset)
+        return f.read(length)
+
+    def __getitem__(self,key:str)->typing.Any:
+        with self._lock:
+            segmentId,offset,length,_=self._index[key]
+            data=self._read(segmentId,offset,length)
+        return pickle.loads(data)
+
+    def __contains__(self,key:object)->bool:
+        return key in self._index
+
+    def __iter__(self)->typing.Iterator[str]:
+        with self._lock:
+            keys=list(self._index.keys())
+        return iter(keys)
+
+    def __len__(self)->int:
+        return len(self._index)
+
+    def flush(self)->None:
+        """
+        make sure everything written so far is on disk
+        """
+        with self._lock:
+            if self._active is not None:
+                self._active.flush()
+                os.fsync(self._active.fileno())
+
+    def _needsCompaction(self)->bool:
+        """
+        whether enough of the sealed segments is garbage to bother
+        """
+        total=0
+        live=0
+        for segmentId,size in self._segmentSizes.items():
+            if segmentId!=self._activeId:
+                total+=size
+                live+=self._liveBytes.get(segmentId,0)
+        return total>0 and (total-live)/total>=self.compactRatio
+
+    def compactInBackground(self)->None:
+        """
+        start compacting in a background thread (if not already)
+        """
+        if self._compactThread is not None and self._compactThread.is_alive(): # noqa: E501 # pylint: disable=line-too-long
+            return
+        self._compactThread=threading.Thread(
+            target=self.compact,name='SegmentStore.compact',daemon=True)
+        self._compactThread.start()
+
+    def compact(self)->None:
+        """
+        Rewrite the live entries of all sealed segments into new
+        segments, then delete the old ones.
+
+        The old segments are deleted in order of their newest record,
+        so if we die partway through, whatever is left over is always
+        newer than what was deleted.  (Deleting by id would not do,
+        since a compacted segment gets a new id but keeps the old
+        sequence numbers.)
+
+        Writes can keep going to the active segment the whole time.
+        """
+        with self._compactLock:
+            with self._lock:
+                if self._segmentSizes[self._activeId]>0:
+                    self._roll()
+                sealed=[s for s in self._segmentSizes if s!=self._activeId]
+                if not sealed:
+                    return
+                sealedSet=set(sealed)
+                entries=[(k,v) for k,v in self._index.items()
+                    if v[0] in sealedSet]
+                newId=self._newSegmentId()
+            moved:typing.Dict[str,typing.Tuple[IndexEntry,IndexEntry]]={}
+            newMaxSequence=0
+            with open(self._segmentPath(newId),'wb') as out:
+                for key,entry in entries:
+                    segmentId,offset,length,sequence=entry
+                    with self._lock:
+                        if self._index.get(key)!=entry:
+                            continue # changed while we were working
+                        data=self._read(segmentId,offset,length)
+                    _,newOffset=self._append(_OP_PUT,key,data,out,sequence)
+                    moved[key]=(entry,(newId,newOffset,length,sequence))
+                    newMaxSequence=max(newMaxSequence,sequence)
+                out.flush()
+                os.fsync(out.fileno())
+                newSize=out.tell()
+            with self._lock:
+                if newSize==0:
+                    # nothing was live
+                    self._segmentPath(newId).unlink()
+                else:
+                    self._segmentSizes[newId]=newSize
+                    self._liveBytes[newId]=0
+                    self._maxSequence[newId]=newMaxSequence
+                for key,(old,new) in moved.items():
+                    if self._index.get(key)==old:
+                        self._index[key]=new
+                        self._liveBytes[newId]+=new[2]
+                sealed.sort(key=lambda s:self._maxSequence.get(s,0))
+                for segmentId in sealed:
+                    f=self._readers.pop(segmentId,None)
+                    if f is not None:
+                        f.close()
+                    self._segmentSizes.pop(segmentId,None)
+                    self._liveBytes.pop(segmentId,None)
+                    self._maxSequence.pop(segmentId,None)
+                    self._segmentPath(segmentId).unlink()
+
+    def close(self)->None:
+        """
+        close all files
+        """
+        if self._compactThread is not None:
+            self._compactThread.join()
+        with self._lock:
+            if self._active is not None:
+                self._active.close()
+                self._active=None
+            for f in self._readers.values():
+                f.close()
+            self._readers.clear()
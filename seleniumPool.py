@@ -0,0 +1,216 @@
+"""
+A pool of warm, long-lived selenium browser sessions.
+
+Starting a browser session costs far more than loading a page in it,
+so sessions are checked out, used, and checked back in rather than
+started and stopped for every page.  Sessions are recycled after a
+number of pages to keep browser memory in check.
+
+USAGE:
+    pool=SeleniumSessionPool(startSession,maxSessions=4)
+    with pool.session('http://example.com') as sel:
+        sel.open('/page.html')
+"""
+import typing
+import time
+import threading
+import contextlib
+
+
+def defaultHealthCheck(sel:typing.Any)->bool:
+    """
+    make sure a session is still responding
+    """
+    try:
+        sel.get_eval('1')
+    except Exception:
+        return False
+    return True
+
+
+class _PooledSession:
+    """
+    Bookkeeping for a single session in the pool
+    """
+
+    def __init__(self,sel:typing.Any,key:str):
+        self.sel:typing.Any=sel
+        self.key:str=key
+        self.pages:int=0
+        self.lastUsed:float=time.monotonic()
+
+
+class SeleniumSessionPool:
+    """
+    A pool of warm, long-lived selenium browser sessions.
+    """
+
+    def __init__(self,
+        startSession:typing.Callable[[str],typing.Any],
+        maxSessions:int=4,
+        perDomain:bool=True,
+        maxPagesPerSession:int=50,
+        healthCheck:typing.Optional[typing.Callable[[typing.Any],bool]]=defaultHealthCheck): # noqa: E501 # pylint: disable=line-too-long
+        """
+        :param startSession: called as startSession(domain) to create a
+            started session
+        :param maxSessions: most sessions alive at once (checkout blocks
+            when they are all busy)
+        :param perDomain: only hand a session back out for the same domain
+            it was started on
+        :param maxPagesPerSession: stop and replace a session after this
+            many pages
+        :param healthCheck: called on an idle session before it is
+            reused.  If it returns False the session is thrown away.
+        """
+        self.startSession=startSession
+        self.maxSessions:int=max(1,maxSessions)
+        self.perDomain:bool=perDomain
+        self.maxPagesPerSession:int=maxPagesPerSession
+        self.healthCheck=healthCheck
+        self._idle:typing.List[_PooledSession]=[]
+        self._busy:typing.Dict[int,_PooledSession]={}
+        self._starting:int=0
+        self._condition=threading.Condition()
+        self.sessionsStarted:int=0
+        self.sessionsReused:int=0
+        self.sessionsRecycled:int=0
+
+    def stats(self)->typing.Dict[str,int]:
+        """
+        get the usage counters
+        """
+        with self._condition:
+            return {
+                'started':self.sessionsStarted,
+                'reused':self.sessionsReused,
+                'recycled':self.sessionsRecycled,
+                'idle':len(self._idle),
+                'busy':len(self._busy)}
+
+    def _count(self)->int:
+        """
+        how many sessions are alive (or on their way)
+        """
+        return len(self._idle)+len(self._busy)+self._starting
+
+    def _key(self,domain:str)->str:
+        return domain if self.perDomain else ''
+
+    def _stopSession(self,session:_PooledSession)->None:
+        try:
+            session.sel.stop()
+        except Exception:
+            pass
+
+    def checkout(self,
+        domain:str,
+        timeout:typing.Optional[float]=None
+        )->typing.Any:
+        """
+        get a session for a domain, starting one if need be
+
+        :param timeout: how long to wait for a free session
+            (None waits forever)
+        """
+        key=self._key(domain)
+        deadline=None if timeout is None else time.monotonic()+timeout
+        while True:
+            toStop:typing.List[_PooledSession]=[]
+            session=None
+            start=False
+            with self._condition:
+                for i in range(len(self._idle)-1,-1,-1):
+                    if self._idle[i].key==key:
+                        session=self._idle.pop(i)
+                        break
+                if session is None:
+                    if self._count()>=self.maxSessions and self._idle:
+                        # make room by dropping the stalest idle session
+                        toStop.append(self._idle.pop(0))
+                    if self._count()<self.maxSessions:
+                        start=True
+                        self._starting+=1
+                if session is None and not start:
+                    remaining=None
+                    if deadline is not None:
+                        remaining=deadline-time.monotonic()
+                        if remaining<=0:
+                            raise TimeoutError('No selenium session available') # noqa: E501 # pylint: disable=line-too-long
+                    self._condition.wait(remaining)
+                    continue
+            for stale in toStop:
+                self._stopSession(stale)
+            if start:
+                try:
+                    sel=self.startSession(domain)
+                except Exception:
+                    with self._condition:
+                        self._starting-=1
+                        self._condition.notify()
+                    raise
+                session=_PooledSession(sel,key)
+                with self._condition:
+                    self._starting-=1
+                    self._busy[id(sel)]=session
+                    self.sessionsStarted+=1
+                return sel
+            if self.healthCheck is not None \
+                and not self.healthCheck(session.sel):
+                #
+                self._stopSession(session)
+                with self._condition:
+                    self._condition.notify()
+                continue
+            with self._condition:
+                self._busy[id(session.sel)]=session
+                self.sessionsReused+=1
+            return session.sel
+
+    def checkin(self,sel:typing.Any,healthy:bool=True)->None:
+        """
+        give a session back to the pool
+
+        :param healthy: set False if something went wrong with it and
+            it should be thrown away
+        """
+        with self._condition:
+            session=self._busy.pop(id(sel),None)
+            if session is None:
+                return
+            session.pages+=1
+            session.lastUsed=time.monotonic()
+            keep=healthy and session.pages<self.maxPagesPerSession
+            if keep:
+                self._idle.append(session)
+            elif healthy:
+                self.sessionsRecycled+=1
+            self._condition.notify()
+        if not keep:
+            self._stopSession(session)
+
+    @contextlib.contextmanager
+    def session(self,
+        domain:str,
+        timeout:typing.Optional[float]=None
+        )->typing.Generator[typing.Any,None,None]:
+        """
+        check out a session for the duration of a with block
+        """
+        sel=self.checkout(domain,timeout)
+        healthy=False
+        try:
+            yield sel
+            healthy=True
+        finally:
+            self.checkin(sel,healthy)
+
+    def closeAll(self)->None:
+        """
+        stop all idle sessions
+        (busy ones are left to whoever has them checked out)
+        """
+        with self._condition:
+            idle,self._idle=self._idle,[]
+        for session in idle:
+            self._stopSession(session)
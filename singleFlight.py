@@ -0,0 +1,92 @@
+"""
+Single-flight request coalescing.
+
+If several threads ask for the same key at the same time, only the
+first one actually does the work, and the rest wait for it and get the
+same result (or the same exception).
+
+USAGE:
+    flight=SingleFlight()
+    data=flight.do(normalizeUrl(url),fetch,url)
+"""
+import typing
+import threading
+
+
+class _Call:
+    """
+    A call in flight
+    """
+
+    def __init__(self):
+        self.done=threading.Event()
+        self.result:typing.Any=None
+        self.error:typing.Optional[BaseException]=None
+        self.waiters:int=0
+
+
+class SingleFlight:
+    """
+    Single-flight request coalescing.
+    """
+
+    def __init__(self):
+        self._calls:typing.Dict[typing.Hashable,_Call]={}
+        self._lock=threading.Lock()
+        self.calls:int=0
+        self.coalesced:int=0
+
+    def stats(self)->typing.Dict[str,int]:
+        """
+        get the usage counters
+        """
+        with self._lock:
+            return {
+                'calls':self.calls,
+                'coalesced':self.coalesced,
+                'inFlight':len(self._calls)}
+
+    def inFlight(self,key:typing.Hashable)->bool:
+        """
+        whether a call for a key is running right now
+        """
+        with self._lock:
+            return key in self._calls
+
+    def do(self,
+        key:typing.Hashable,
+        fn:typing.Callable[...,typing.Any],
+        *args,**kwargs)->typing.Any:
+        """
+        call fn(*args,**kwargs), unless a call for the same key is
+        already running, in which case wait for that one instead
+
+        :return: whatever fn returned
+        :raises: whatever fn raised
+        """
+        with self._lock:
+            call=self._calls.get(key)
+            if call is None:
+                call=_Call()
+                self._calls[key]=call
+                self.calls+=1
+                leader=True
+            else:
+                call.waiters+=1
+                self.coalesced+=1
+                leader=False
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+        try:
+            call.result=fn(*args,**kwargs)
+        except BaseException as e:
+            call.error=e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
@@ -0,0 +1,85 @@
+"""
+Makes the repo importable as the webFetch package without running its
+__init__.py (which pulls in the Qt gui), and provides a local http
+server for the tests to fetch from
+"""
+import os
+import sys
+import types
+import threading
+import http.server
+import pytest
+
+
+here=os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+if 'webFetch' not in sys.modules:
+    package=types.ModuleType('webFetch')
+    package.__path__=[here]
+    sys.modules['webFetch']=package
+
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+    protocol_version='HTTP/1.1'
+
+    def _dispatch(self)->None:
+        self.server.requests.append((self.command,self.path,dict(self.headers))) # noqa: E501 # pylint: disable=line-too-long
+        route=self.server.routes.get(self.path.split('?',1)[0])
+        if route is None:
+            self.send_error(404)
+            return
+        route(self)
+
+    do_GET=_dispatch
+    do_HEAD=_dispatch
+    do_POST=_dispatch
+
+    def log_message(self,*args)->None:
+        pass
+
+
+class LocalServer:
+    """
+    A local http server for the tests to fetch from
+
+    routes maps a path to fn(handler) which writes the response
+    """
+
+    def __init__(self):
+        self.httpd=http.server.ThreadingHTTPServer(('127.0.0.1',0),_Handler)
+        self.httpd.daemon_threads=True
+        self.httpd.routes={}
+        self.httpd.requests=[]
+        self.routes=self.httpd.routes
+        self.requests=self.httpd.requests
+        self.thread=threading.Thread(target=self.httpd.serve_forever,
+            args=(0.01,),daemon=True)
+        self.thread.start()
+
+    def url(self,path:str='/')->str:
+        return f'http://127.0.0.1:{self.httpd.server_address[1]}{path}'
+
+    def close(self)->None:
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def reply(handler,body:bytes=b'',status:int=200,**headers)->None:
+    """
+    write a simple response
+    """
+    handler.send_response(status)
+    headers={k.replace('_','-'):v for k,v in headers.items()}
+    headers.setdefault('Content-Type','text/html')
+    for k,v in headers.items():
+        handler.send_header(k,v)
+    handler.send_header('Content-Length',str(len(body)))
+    handler.end_headers()
+    if handler.command!='HEAD':
+        handler.wfile.write(body)
+
+
+@pytest.fixture
+def server():
+    s=LocalServer()
+    yield s
+    s.close()
@@ -0,0 +1,187 @@
+import gzip
+import asyncio
+import time
+import threading
+import pytest
+pytest.importorskip('paths')
+from conftest import reply # noqa: E402
+from webFetch.WebFetch import WebFetch, STREAM_CHUNKS, STREAM_FILE # noqa: E402
+from webFetch.politeness import PolitenessLimiter # noqa: E402
+
+
+def _fetcher(**kwargs)->WebFetch:
+    return WebFetch(noSelenium=True,**kwargs)
+
+
+def test_runAllAsyncCallsEveryCallbackOnce():
+    w=_fetcher(maxConcurrency=4)
+    got=[]
+    for i in range(10):
+        w.enqueue(lambda url,html:got.append(html),f'<p>{i}</p>')
+    w.runAll()
+    assert sorted(got)==sorted(f'<p>{i}</p>' for i in range(10))
+
+
+def test_callbacksRunOffTheEventLoop():
+    w=_fetcher(maxConcurrency=4)
+    threads=[]
+    w.enqueue(lambda url,html:threads.append(threading.get_ident()),'<p>x</p>') # noqa: E501 # pylint: disable=line-too-long
+
+    async def main():
+        loopThread=threading.get_ident()
+        await w.runAllAsync()
+        return loopThread
+    loopThread=asyncio.run(main())
+    assert threads and threads[0]!=loopThread
+
+
+def test_fetchNowInsideARunningLoop():
+    w=_fetcher(maxConcurrency=4)
+
+    async def main():
+        return w.fetchNow('<p>hello</p>')
+    assert asyncio.run(main())==('<p>hello</p>','text/html')
+
+
+def test_runAllAsyncFinishesTheRestBeforeRaising():
+    w=_fetcher(maxConcurrency=4)
+    got=[]
+
+    def onDone(url,html):
+        if html=='<p>bad</p>':
+            raise ValueError(html)
+        got.append(html)
+    w.enqueue(onDone,'<p>bad</p>',priority=1)
+    w.enqueue(onDone,'<p>good</p>')
+    with pytest.raises(ValueError):
+        w.runAll()
+    # (nothing is left running in the background)
+    assert threading.active_count()<10
+
+
+def test_runAllThreaded():
+    w=_fetcher(threadWorkers=3)
+    got=[]
+    for i in range(6):
+        w.enqueue(lambda url,html:got.append(html),f'<p>{i}</p>')
+    w.runAll()
+    assert len(got)==6
+
+
+def test_getManyObeysPoliteness(server):
+    active=[0]
+    most=[0]
+    lock=threading.Lock()
+
+    def page(handler):
+        with lock:
+            active[0]+=1
+            most[0]=max(most[0],active[0])
+        time.sleep(0.02)
+        with lock:
+            active[0]-=1
+        reply(handler,b'<p>page</p>')
+    server.routes['/robots.txt']=lambda handler: reply(handler,
+        b'User-agent: *\nDisallow: /private\n',Content_Type='text/plain')
+    for i in range(4):
+        server.routes[f'/{i}']=page
+    server.routes['/private']=page
+    limiter=PolitenessLimiter(requestsPerSecond=0,maxInFlight=1)
+    w=_fetcher(politeness=limiter)
+    urls=[server.url(f'/{i}') for i in range(4)]+[server.url('/private')]
+    got=dict(w.getMany(urls,workers=4))
+    assert got[server.url('/private')] is None
+    assert all(got[url]=='<p>page</p>' for url in urls[:4])
+    assert most[0]==1
+    assert '/private' not in [r[1] for r in server.requests]
+
+
+BODY=b'<html>'+b'streamed '*10000+b'</html>'
+
+
+def _maybeGzipped(handler):
+    if 'gzip' in handler.headers.get('Accept-Encoding',''):
+        reply(handler,gzip.compress(BODY),Content_Encoding='gzip')
+    else:
+        reply(handler,BODY)
+
+
+def test_streamChunks(server):
+    server.routes['/page']=_maybeGzipped
+    w=_fetcher()
+    got=[]
+    w.enqueue(lambda url,chunks:got.append((url,b''.join(chunks))),
+        server.url('/page'),stream=STREAM_CHUNKS)
+    w.runAll()
+    assert got==[(server.url('/page'),BODY)]
+    assert 'gzip' in server.requests[0][2]['Accept-Encoding']
+
+
+def test_streamFile(server):
+    server.routes['/page']=_maybeGzipped
+    w=_fetcher(threadWorkers=2)
+    got=[]
+    w.enqueue(lambda url,f:got.append(f.read()),server.url('/page'),
+        stream=STREAM_FILE)
+    w.runAll()
+    assert got==[BODY]
+
+
+def test_streamHtml():
+    w=_fetcher()
+    got=[]
+    w.enqueue(lambda url,f:got.append((url,f.read())),'<p>hi</p>',
+        stream=STREAM_FILE)
+    w.runAll()
+    assert got==[('',b'<p>hi</p>')]
+
+
+def test_fetchToFile(server,tmp_path):
+    server.routes['/page']=lambda handler: reply(handler,BODY,
+        Content_Type='text/plain')
+    path,mime=_fetcher().fetchToFile(server.url('/page'),tmp_path/'page.txt',
+        chunkSize=4096)
+    assert path.read_bytes()==BODY and mime=='text/plain'
+
+
+def test_jsDetectLimitKB(server):
+    page=b'<html><head></head><body>'+b'x'*8192+b'<script src="a.js">'
+    server.routes['/page']=lambda handler: reply(handler,page)
+    html,hasTricks=_fetcher().\
+        _fetchStatic(server.url('/page'),chunkSize=1024)
+    assert html is None and hasTricks
+    html,hasTricks=_fetcher(jsDetectLimitKB=4).\
+        _fetchStatic(server.url('/page'),chunkSize=1024)
+    assert html==page.decode('utf-8') and not hasTricks
+
+
+class FakeBrowser:
+    def __init__(self,domain):
+        self.domain=domain
+        self.opened=[]
+
+    def open(self,page):
+        self.opened.append(page)
+
+    def wait_for_page_to_load(self,timeout):
+        pass
+
+    def get_eval(self,script):
+        return script
+
+    def stop(self):
+        pass
+
+
+def test_trickyPagesGoToTheSessionFactory(server):
+    server.routes['/page']=lambda handler: reply(handler,
+        b'<html><script src="app.js"></script></html>')
+    w=WebFetch(seleniumSessionFactory=FakeBrowser,maxConcurrency=1)
+    got=[]
+    for _ in range(2):
+        w.enqueue(lambda url,sel:got.append(sel),server.url('/page'))
+    w.runAll()
+    assert got[0] is got[1] and got[0].opened==['page','page']
+    assert got[0].domain==server.url('')
+    # the second time, it knew to go straight to the browser
+    assert len(server.requests)==1
@@ -0,0 +1,63 @@
+from webFetch.blobStore import BlobStore
+
+
+def test_putAndDeduplicate(tmp_path):
+    store=BlobStore(tmp_path/'blobs')
+    a=store.put(b'hello')
+    b=store.put('hello')
+    assert a==b and store.get(a)==b'hello'
+    assert store.refcount(a)==2
+    stats=store.stats()
+    assert stats['blobs']==1 and stats['bytesDeduplicated']==5
+    store.close()
+
+
+def test_putStream(tmp_path):
+    store=BlobStore(tmp_path/'blobs')
+    digest=store.putStream([b'hel','lo'])
+    assert digest==store.put(b'hello')
+    with store.open(digest) as f:
+        assert f.read()==b'hello'
+    assert [p for p in store.directory.iterdir() if p.suffix=='.tmp']==[]
+    store.close()
+
+
+def test_decrefDeletesTheLastReference(tmp_path):
+    store=BlobStore(tmp_path/'blobs')
+    digest=store.put(b'hello')
+    store.incref(digest)
+    store.decref(digest)
+    assert digest in store
+    store.decref(digest)
+    assert digest not in store
+    assert not store.path(digest).exists()
+    store.close()
+
+
+def test_linkTo(tmp_path):
+    store=BlobStore(tmp_path/'blobs')
+    digest=store.put(b'hello')
+    store.linkTo(digest,tmp_path/'hello.txt')
+    assert (tmp_path/'hello.txt').read_bytes()==b'hello'
+    store.close()
+
+
+def test_putFileMovesTheFile(tmp_path):
+    store=BlobStore(tmp_path/'blobs')
+    (tmp_path/'video.mp4').write_bytes(b'hello')
+    digest=store.putFile(tmp_path/'video.mp4')
+    assert digest==store.put(b'hello')
+    assert not (tmp_path/'video.mp4').exists()
+    assert store.get(digest)==b'hello' and store.refcount(digest)==2
+    store.close()
+
+
+def test_putFileDeduplicates(tmp_path):
+    store=BlobStore(tmp_path/'blobs')
+    digest=store.put(b'hello')
+    (tmp_path/'video.mp4').write_bytes(b'hello')
+    assert store.putFile(tmp_path/'video.mp4',digest)==digest
+    assert not (tmp_path/'video.mp4').exists()
+    assert store.stats()['bytesDeduplicated']==5
+    assert [p for p in store.directory.iterdir() if p.suffix=='.tmp']==[]
+    store.close()
@@ -0,0 +1,128 @@
+import json
+import zlib
+import threading
+import pytest
+from webFetch.bodyCompression import (BodyCodec, CODEC_ZLIB, CODEC_ZSTD,
+    CODEC_NONE, hasZstd)
+
+
+PAGE=b'<html><head><title>Example</title></head><body>%d</body></html>'
+
+
+def test_roundTrip(tmp_path):
+    codec=BodyCodec(tmp_path,CODEC_ZLIB)
+    data=PAGE%1*100
+    compressed=codec.compress(data,'example.com')
+    assert len(compressed)<len(data)
+    assert codec.decompress(compressed)==data
+    assert b''.join(codec.decompressChunks(
+        [compressed[i:i+7] for i in range(0,len(compressed),7)]))==data
+
+
+def test_uncompressedBodiesComeBackAsIs(tmp_path):
+    codec=BodyCodec(tmp_path,CODEC_NONE)
+    assert codec.compress(b'plain','example.com')==b'plain'
+    assert codec.decompress(b'plain')==b'plain'
+    compressed=BodyCodec(None,CODEC_ZLIB).compress(b'squashed')
+    assert codec.decompress(compressed)==b'squashed'
+
+
+def test_trainsADictionaryPerDomain(tmp_path):
+    codec=BodyCodec(tmp_path,CODEC_ZLIB,trainAfter=3)
+    for i in range(3):
+        assert codec.dictionaryFor('example.com')==0
+        codec.compress(PAGE%i,'example.com')
+    dictionaryId=codec.dictionaryFor('example.com')
+    assert dictionaryId!=0
+    assert 'example.com' not in codec._samples
+    assert codec._sampleBytes==0
+    compressed=codec.compress(PAGE%9,'example.com')
+    # a new codec finds the dictionary on disk
+    again=BodyCodec(tmp_path,CODEC_ZLIB)
+    assert again.decompress(compressed)==PAGE%9
+    with open(tmp_path/'domains.json','r',encoding='utf-8') as f:
+        assert json.load(f)=={'example.com':dictionaryId}
+
+
+def test_dictionariesAreNeverOverwritten(tmp_path):
+    codec=BodyCodec(tmp_path,CODEC_ZLIB,trainAfter=1)
+    # eg written by another process that has not recorded them yet
+    # (including one whose id is the checksum of what a.com will train)
+    taken=[1,zlib.crc32(codec._train([PAGE%1]))]
+    for dictionaryId in taken:
+        (tmp_path/f'{dictionaryId:08x}.dict').write_bytes(b'someone else')
+    codec.compress(PAGE%1,'a.com')
+    codec.compress(b'<p>%d</p>'%2*50,'b.com')
+    ids={codec.dictionaryFor('a.com'),codec.dictionaryFor('b.com')}
+    assert len(ids)==2 and not ids&set(taken) and 0 not in ids
+    for dictionaryId in taken:
+        assert (tmp_path/f'{dictionaryId:08x}.dict').read_bytes()==b'someone else' # noqa: E501 # pylint: disable=line-too-long
+    compressed=[codec.compress(PAGE%3,'a.com'),
+        codec.compress(b'<p>4</p>'*50,'b.com')]
+    again=BodyCodec(tmp_path,CODEC_ZLIB)
+    assert [again.decompress(c) for c in compressed]==[
+        PAGE%3,b'<p>4</p>'*50]
+
+
+def test_trainingDoesNotHoldTheLock(tmp_path):
+    codec=BodyCodec(tmp_path,CODEC_ZLIB,trainAfter=1)
+    lockFree=[]
+    train=codec._train
+
+    def checkingTrain(samples):
+        def tryLock():
+            if codec._lock.acquire(timeout=5):
+                codec._lock.release()
+                lockFree.append(True)
+            else:
+                lockFree.append(False)
+        thread=threading.Thread(target=tryLock)
+        thread.start()
+        thread.join()
+        return train(samples)
+    codec._train=checkingTrain
+    codec.compress(PAGE%1,'example.com')
+    assert lockFree==[True]
+    assert codec.dictionaryFor('example.com')!=0
+
+
+def test_domainsWithADictionaryAreNotSampled(tmp_path):
+    codec=BodyCodec(tmp_path,CODEC_ZLIB,trainAfter=1)
+    codec.compress(PAGE%1,'example.com')
+    codec.compress(PAGE%2,'example.com')
+    assert not codec._samples
+
+
+def test_samplesAreCapped(tmp_path):
+    codec=BodyCodec(tmp_path,CODEC_ZLIB,trainAfter=100,sampleSize=10,
+        maxSampleDomains=3,maxSampleBytes=45)
+    for i in range(5):
+        codec.compress(PAGE%i,f'site{i}.com')
+    assert list(codec._samples)==['site2.com','site3.com','site4.com']
+    codec.compress(PAGE,'site2.com') # now most recently seen
+    codec.compress(PAGE,'site5.com')
+    assert list(codec._samples)==['site4.com','site2.com','site5.com']
+    codec.compress(PAGE,'site5.com')
+    # 5 samples of 10 bytes is over 45, so the oldest domain goes
+    assert list(codec._samples)==['site2.com','site5.com']
+    assert codec._sampleBytes==sum(
+        len(s) for samples in codec._samples.values() for s in samples)
+    assert codec._sampleBytes<=45
+
+
+def test_noDirectoryNoSamples():
+    codec=BodyCodec(None,CODEC_ZLIB,trainAfter=1)
+    codec.compress(PAGE,'example.com')
+    assert not codec._samples
+    assert codec.dictionaryFor('example.com')==0
+
+
+@pytest.mark.skipif(not hasZstd,reason='zstandard is not installed')
+def test_zstdLevelZero(tmp_path):
+    codec=BodyCodec(tmp_path,CODEC_ZSTD,level=0)
+    assert codec.decompress(codec.compress(PAGE,'example.com'))==PAGE
+
+
+def test_unknownCodec():
+    with pytest.raises(ValueError):
+        BodyCodec(None,'lzma')
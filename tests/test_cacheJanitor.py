@@ -0,0 +1,113 @@
+import time
+import logging
+from webFetch.cacheJanitor import CacheJanitor
+
+
+class FakeCache:
+    """
+    just enough of a cache for the janitor to look after
+    """
+
+    def __init__(self,entries=()):
+        self.entries={key:(size,timestamp) for key,size,timestamp in entries}
+        self.evicted=[]
+        self.fail=0
+
+    def _janitorEntries(self):
+        return [(k,size,t) for k,(size,t) in self.entries.items()]
+
+    def _janitorEvict(self,keys):
+        if self.fail:
+            self.fail-=1
+            raise OSError('disk went away')
+        for key in keys:
+            self.entries.pop(key,None)
+            self.evicted.append(key)
+
+
+def test_evictsLeastRecentlyUsedOverBytes():
+    cache=FakeCache()
+    janitor=CacheJanitor(cache,maxBytes=250)
+    for key in 'abc':
+        janitor.add(key,100)
+    janitor.touch('a')
+    assert janitor.overLimits()
+    assert janitor.sweep()==1
+    assert cache.evicted==['b']
+    assert not janitor.overLimits()
+    assert janitor.stats()['totalBytes']==200
+
+
+def test_evictsOverEntries():
+    cache=FakeCache()
+    janitor=CacheJanitor(cache,maxEntries=2,policy='lfu')
+    for key in 'abc':
+        janitor.add(key,10)
+    janitor.touch('a')
+    janitor.touch('c')
+    janitor.sweep()
+    assert cache.evicted==['b']
+    assert janitor.stats()['evictions']==1
+
+
+def test_sizeAwarePolicyEvictsBigEntriesFirst():
+    cache=FakeCache()
+    janitor=CacheJanitor(cache,maxBytes=1000,policy='gdsf')
+    janitor.add('small',10)
+    janitor.add('big',995)
+    janitor.sweep()
+    assert cache.evicted==['big']
+
+
+def test_expiresOldEntries():
+    now=time.time()
+    cache=FakeCache([('old',10,now-100),('new',10,now)])
+    janitor=CacheJanitor(cache,maxAgeSeconds=50)
+    assert janitor.sweep()==1
+    assert cache.evicted==['old']
+    assert janitor.stats()['expirations']==1
+    assert not janitor.overLimits()
+
+
+def test_seedsFromTheCache():
+    now=time.time()
+    cache=FakeCache([('b',100,now-5),('a',100,now-10),('c',100,now)])
+    janitor=CacheJanitor(cache,maxEntries=2)
+    janitor.sweep()
+    assert cache.evicted==['a']
+    assert janitor.stats()['entries']==2
+
+
+def test_batchSize():
+    cache=FakeCache()
+    janitor=CacheJanitor(cache,maxEntries=0,batchSize=2)
+    for key in 'abcde':
+        janitor.add(key,1)
+    assert janitor.sweep()==2
+    assert janitor.sweep()==2
+    assert janitor.sweep()==1
+    assert janitor.sweep()==0
+
+
+def test_failedSweepsAreLoggedAndCounted(caplog):
+    cache=FakeCache([('a',100,time.time())])
+    cache.fail=1
+    janitor=CacheJanitor(cache,maxEntries=0,interval=0.01)
+    with caplog.at_level(logging.ERROR,logger='webFetch.cacheJanitor'):
+        janitor.start()
+        deadline=time.time()+5
+        while cache.entries and time.time()<deadline:
+            time.sleep(0.01)
+        janitor.stop()
+    assert janitor.stats()['errors']==1
+    assert 'cache janitor sweep failed' in caplog.text
+    # it looked again, and got it the second time around
+    assert cache.evicted==['a']
+
+
+def test_doesNotKeepTheCacheAlive():
+    cache=FakeCache()
+    janitor=CacheJanitor(cache,maxEntries=0)
+    janitor.add('a',1)
+    del cache
+    assert janitor.sweep()==0
@@ -0,0 +1,172 @@
+import datetime
+from pathlib import Path
+import pytest
+pytest.importorskip('paths')
+from webFetch.caching import Cache # noqa: E402
+from webFetch.blobStore import BlobStore # noqa: E402
+
+
+URL='http://example.com/page'
+
+
+def _reload(cache:Cache,**kwargs)->Cache:
+    cache.save()
+    again=Cache(cache.cacheLocation,**kwargs)
+    again.load()
+    return again
+
+
+def test_journalReplay(tmp_path):
+    cache=Cache(tmp_path)
+    cache.setCache(URL,b'one')
+    cache.save() # the first save writes the whole manifest
+    cache.setCache(URL+'2',b'two')
+    cache.removeCache(URL)
+    cache.save()
+    assert cache.journalFilename.exists()
+    again=_reload(cache)
+    assert again.getCache(URL) is None
+    assert again.getCache(URL+'2')==b'two'
+    assert again._journalRecords==2
+
+
+def test_tornJournalLineIsIgnored(tmp_path):
+    cache=Cache(tmp_path)
+    cache.setCache(URL,b'one')
+    cache.save()
+    cache.removeCache(URL)
+    cache.save()
+    with open(cache.journalFilename,'a',encoding='utf-8') as f:
+        f.write('+2024-01-01 00:00:00,None,somefile') # cut off
+    again=_reload(cache)
+    assert again.getCache(URL) is None
+    assert list(again.cache)==[]
+
+
+def test_checkpoint(tmp_path):
+    cache=Cache(tmp_path,checkpointEvery=3)
+    cache.setCache(URL,b'one')
+    cache.save()
+    for i in range(3):
+        cache.setCache(f'{URL}{i}',b'more')
+        cache.save()
+    # the third change rewrote the manifest and started a new journal
+    assert not cache.journalFilename.exists()
+    again=_reload(cache)
+    assert sorted(str(url) for url in again.cache)==sorted(
+        [URL]+[f'{URL}{i}' for i in range(3)])
+
+
+def test_replaceIsOneJournalRecord(tmp_path):
+    cache=Cache(tmp_path,keepVersions=False)
+    cache.setCache(URL,b'one',datetime.datetime(2024,1,1))
+    cache.save()
+    cache.setCache(URL,b'two',datetime.datetime(2024,2,1))
+    cache.save()
+    with open(cache.journalFilename,'r',encoding='utf-8') as f:
+        records=f.read().split('\n')[1:-1]
+    assert len(records)==1 and records[0].startswith('=')
+    again=_reload(cache,keepVersions=False)
+    assert again.getCache(URL)==b'two'
+    assert len(again.versions(URL))==1
+
+
+def test_replaceWithAutosave(tmp_path):
+    # every change is written as soon as it is made, so a crash right
+    # after a replace must still find the url
+    cache=Cache(tmp_path,keepVersions=False,autosave=True)
+    cache.setCache(URL,b'one',datetime.datetime(2024,1,1))
+    cache.setCache(URL,b'two',datetime.datetime(2024,2,1))
+    again=Cache(tmp_path,keepVersions=False)
+    again.load()
+    assert again.getCache(URL)==b'two'
+
+
+def test_shardedFilenames(tmp_path):
+    cache=Cache(tmp_path,shardDepth=2)
+    cache.setCache(URL,b'one')
+    filename=Path(cache.cache[URL].filename)
+    name=filename.name
+    assert filename==tmp_path/name[:2]/name[2:4]/name
+    assert cache.getCache(URL)==b'one'
+
+
+def test_migrate(tmp_path):
+    flat=Cache(tmp_path,shardDepth=0)
+    flat.setCache(URL,b'one')
+    flat.setCache(URL+'2',b'two')
+    flat.save()
+    cache=Cache(tmp_path,shardDepth=1)
+    cache.load()
+    assert cache.migrate()==2
+    assert cache.migrate()==0
+    again=_reload(cache,shardDepth=1)
+    for url,data in ((URL,b'one'),(URL+'2',b'two')):
+        filename=Path(again.cache[url].filename)
+        name=filename.name
+        assert filename==tmp_path/name[:2]/name
+        assert again.getCache(url)==data
+    assert [p for p in tmp_path.iterdir() if p.suffix=='.cache']==[]
+
+
+def test_versionsAndSnapshots(tmp_path):
+    cache=Cache(tmp_path)
+    for month,data in ((1,b'january'),(3,b'march'),(2,b'february')):
+        cache.setCache(URL,data,datetime.datetime(2024,month,1))
+    assert [v.data for v in cache.versions(URL)]==[
+        b'january',b'february',b'march']
+    assert cache.getCache(URL)==b'march'
+    assert cache.getCache(URL,asOf=datetime.datetime(2024,2,15))==b'february'
+    assert cache.getCache(URL,asOf=datetime.datetime(2024,3,1))==b'march'
+    assert cache.getCache(URL,asOf=datetime.datetime(2023,12,1)) is None
+    again=_reload(cache)
+    assert len(again.versions(URL))==3
+    assert again.getCache(URL,asOf=datetime.datetime(2024,1,15))==b'january'
+
+
+def test_sameVersionDateReplaces(tmp_path):
+    cache=Cache(tmp_path)
+    when=datetime.datetime(2024,1,1)
+    cache.setCache(URL,b'one',when)
+    first=cache.cache[URL].filename
+    cache.setCache(URL,b'two',when)
+    assert len(cache.versions(URL))==1
+    assert cache.getCache(URL)==b'two'
+    assert not Path(first).exists()
+
+
+def test_removeDropsEveryVersion(tmp_path):
+    cache=Cache(tmp_path)
+    cache.setCache(URL,b'one',datetime.datetime(2024,1,1))
+    cache.setCache(URL,b'two',datetime.datetime(2024,2,1))
+    filenames=[v.filename for v in cache.versions(URL)]
+    cache.removeCache(URL)
+    assert cache.versions(URL)==[]
+    assert not any(Path(f).exists() for f in filenames)
+    assert _reload(cache).versions(URL)==[]
+
+
+def test_notCompressedByDefault(tmp_path):
+    cache=Cache(tmp_path)
+    cache.setCache(URL,b'plain')
+    with open(cache.cache[URL].filename,'rb') as f:
+        assert f.read()==b'plain'
+
+
+def test_compression(tmp_path):
+    cache=Cache(tmp_path,compression='zlib')
+    data=b'<html>'+b'squash me '*100+b'</html>'
+    cache.setCache(URL,data)
+    assert Path(cache.cache[URL].filename).stat().st_size<len(data)
+    assert _reload(cache,compression='zlib').getCache(URL)==data
+
+
+def test_compressedBlobsAreStillDeduplicated(tmp_path):
+    store=BlobStore(tmp_path/'blobs')
+    cache=Cache(tmp_path/'cache',blobStore=store,compression='zlib')
+    cache.codec.trainAfter=2
+    for i in range(4):
+        cache.setCache(f'{URL}{i}',b'the same page')
+    assert store.stats()['blobs']==1
+    assert not (tmp_path/'cache'/'dictionaries').exists()
+    assert cache.getCache(URL+'3')==b'the same page'
@@ -0,0 +1,139 @@
+import gzip
+import time
+import urllib.error
+import urllib.request
+import pytest
+from conftest import LocalServer,reply
+from webFetch.connectionPool import ConnectionPool,iterChunks
+
+
+def test_reusesConnections(server):
+    server.routes['/']=lambda h:reply(h,b'hello')
+    pool=ConnectionPool(proxies={})
+    for _ in range(3):
+        with pool.urlopen(server.url('/')) as f:
+            assert f.read()==b'hello'
+    stats=pool.stats()
+    assert stats['misses']==1 and stats['hits']==2
+
+
+def test_httpErrorStatus(server):
+    pool=ConnectionPool(proxies={})
+    with pytest.raises(urllib.error.HTTPError) as e:
+        pool.urlopen(server.url('/missing'))
+    assert e.value.code==404
+
+
+def test_credentialsNotPassedToAnotherSite(server):
+    other=LocalServer()
+    try:
+        other.routes['/there']=lambda h:reply(h,b'there')
+        server.routes['/here']=lambda h:reply(h,status=302,
+            Location=other.url('/there'))
+        pool=ConnectionPool(proxies={})
+        f=pool.urlopen(server.url('/here'),
+            headers={'Authorization':'Basic eDp5','Cookie':'a=1'})
+        assert f.read()==b'there'
+        sent=server.requests[0][2]
+        assert 'Authorization' in sent and 'Cookie' in sent
+        sent=other.requests[0][2]
+        assert 'Authorization' not in sent and 'Cookie' not in sent
+    finally:
+        other.close()
+
+
+def test_credentialsKeptOnSameSiteRedirect(server):
+    server.routes['/here']=lambda h:reply(h,status=302,Location='/there')
+    server.routes['/there']=lambda h:reply(h,b'there')
+    pool=ConnectionPool(proxies={})
+    assert pool.urlopen(server.url('/here'),
+        headers={'Authorization':'Basic eDp5'}).read()==b'there'
+    assert 'Authorization' in server.requests[1][2]
+
+
+def _replyThenHangUp(handler):
+    # (claims to be keep-alive, but is not)
+    reply(handler,b'ok')
+    handler.close_connection=True
+
+
+def test_staleConnectionRetriedForGet(server):
+    server.routes['/']=_replyThenHangUp
+    pool=ConnectionPool(proxies={})
+    assert pool.urlopen(server.url('/')).read()==b'ok'
+    assert pool.urlopen(server.url('/')).read()==b'ok'
+
+
+def test_staleConnectionNotRetriedForPost(server):
+    server.routes['/']=_replyThenHangUp
+    pool=ConnectionPool(proxies={})
+    assert pool.urlopen(server.url('/')).read()==b'ok'
+    with pytest.raises(OSError):
+        pool.urlopen(server.url('/'),data=b'x=1')
+    assert [r[0] for r in server.requests]==['GET']
+
+
+def test_proxiedRequestsGoThroughUrllib(server):
+    # the local server stands in for the proxy
+    server.routes['http://example.invalid/page']=lambda h:reply(h,b'proxied') # noqa: E501 # pylint: disable=line-too-long
+    pool=ConnectionPool(proxies={'http':server.url('')})
+    f=pool.urlopen('http://example.invalid/page')
+    assert f.read()==b'proxied'
+    assert pool.stats()['requests']==0
+
+
+def test_gzipDecodedAndHeadersMatch(server):
+    body=b'<html>'+b'hello '*1000+b'</html>'
+    server.routes['/']=lambda h:reply(h,gzip.compress(body),
+        Content_Encoding='gzip')
+    pool=ConnectionPool(proxies={})
+    f=pool.urlopen(server.url('/'))
+    assert f.decoded
+    assert f.getheader('Content-Encoding') is None
+    assert f.getheader('Content-Length') is None
+    assert f.getheader('Content-Type')=='text/html'
+    assert 'Content-Encoding' not in dict(f.getheaders())
+    assert f.wireHeaders['Content-Encoding']=='gzip'
+    assert b''.join(iterChunks(f,100))==body
+    assert pool.stats()['bytesOnWire']<len(body)
+
+
+def test_identityLeftAlone(server):
+    server.routes['/']=lambda h:reply(h,b'plain')
+    pool=ConnectionPool(proxies={})
+    f=pool.urlopen(server.url('/'),headers={'Accept-Encoding':'identity'})
+    assert not f.decoded
+    assert f.getheader('Content-Length')=='5'
+    assert f.read()==b'plain'
+
+
+def _echoContentType(handler):
+    handler.rfile.read(int(handler.headers.get('Content-Length',0)))
+    reply(handler,handler.headers.get('Content-Type','none').encode('ascii'))
+
+
+def test_postDefaultsToAFormContentType(server):
+    server.routes['/']=_echoContentType
+    pool=ConnectionPool(proxies={})
+    assert pool.urlopen(server.url('/'),data=b'x=1').read()==\
+        b'application/x-www-form-urlencoded'
+    assert pool.urlopen(server.url('/'),data=b'{}',
+        headers={'Content-Type':'application/json'}).read()==\
+        b'application/json'
+    req=urllib.request.Request(server.url('/'),b'{}',
+        {'Content-type':'application/json'})
+    assert pool.urlopen(req).read()==b'application/json'
+
+
+def test_reusedConnectionTakesTheNewTimeout(server):
+    def slow(handler):
+        time.sleep(0.5)
+        reply(handler,b'slow')
+    server.routes['/']=lambda h:reply(h,b'fast')
+    server.routes['/slow']=slow
+    pool=ConnectionPool(proxies={})
+    assert pool.urlopen(server.url('/'),timeout=5).read()==b'fast'
+    start=time.monotonic()
+    with pytest.raises(OSError):
+        pool.urlopen(server.url('/slow'),timeout=0.1)
+    assert time.monotonic()-start<0.45
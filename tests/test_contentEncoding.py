@@ -0,0 +1,43 @@
+import gzip
+import zlib
+import pytest
+from webFetch.contentEncoding import Decompressor, decodeChunks, canDecode
+
+
+DATA=b'<html>'+b'hello world '*500+b'</html>'
+
+
+def _rawDeflate(data:bytes)->bytes:
+    compressor=zlib.compressobj(wbits=-zlib.MAX_WBITS)
+    return compressor.compress(data)+compressor.flush()
+
+
+def _bytewise(data:bytes):
+    return [data[i:i+1] for i in range(len(data))]
+
+
+@pytest.mark.parametrize('encoding,encoded',[
+    ('gzip',gzip.compress(DATA)),
+    ('x-gzip',gzip.compress(DATA)),
+    ('deflate',zlib.compress(DATA)),
+    ('deflate',_rawDeflate(DATA)),
+    ('identity',DATA),
+    (None,DATA)],ids=['gzip','x-gzip','zlib','raw','identity','none'])
+@pytest.mark.parametrize('split',[lambda data:[data],_bytewise],
+    ids=['whole','bytewise'])
+def test_decodeChunks(encoding,encoded,split):
+    assert b''.join(decodeChunks(split(encoded),encoding))==DATA
+
+
+def test_rawDeflateWithAOneByteFirstChunk():
+    encoded=_rawDeflate(DATA)
+    decoder=Decompressor('deflate')
+    data=decoder.decompress(encoded[:1])
+    data+=decoder.decompress(encoded[1:])
+    assert data+decoder.flush()==DATA
+
+
+def test_unknownEncoding():
+    assert not canDecode('compress')
+    with pytest.raises(ValueError):
+        Decompressor('compress')
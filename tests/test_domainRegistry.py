@@ -0,0 +1,93 @@
+import concurrent.futures
+from webFetch import domainRegistry
+from webFetch.domainRegistry import DomainRegistry
+
+
+class Clock:
+    def __init__(self):
+        self.now=1000000.0
+
+    def __call__(self)->float:
+        return self.now
+
+
+def test_addAndLookup():
+    registry=DomainRegistry()
+    assert 'http://a.com' not in registry
+    registry.append('http://a.com')
+    assert 'http://a.com' in registry
+    assert list(registry)==['http://a.com'] and len(registry)==1
+    registry.remove('http://a.com')
+    assert 'http://a.com' not in registry
+
+
+def test_entriesExpire(monkeypatch):
+    clock=Clock()
+    monkeypatch.setattr(domainRegistry.time,'time',clock)
+    registry=DomainRegistry(ttlSeconds=60)
+    registry.add('http://a.com')
+    registry.add('http://b.com',ttlSeconds=600)
+    clock.now+=61
+    assert 'http://a.com' not in registry
+    assert 'http://b.com' in registry
+    assert list(registry)==['http://b.com']
+
+
+def test_reloadsFromTheFile(tmp_path,monkeypatch):
+    clock=Clock()
+    monkeypatch.setattr(domainRegistry.time,'time',clock)
+    filename=str(tmp_path/'tricky.db')
+    registry=DomainRegistry(filename,ttlSeconds=60)
+    registry.add('http://a.com')
+    registry.add('http://b.com')
+    registry.discard('http://b.com')
+    registry.close()
+    again=DomainRegistry(filename)
+    assert list(again)==['http://a.com']
+    clock.now+=61
+    again.close()
+    # (expired ones are not loaded)
+    assert list(DomainRegistry(filename))==[]
+
+
+def test_sharedBetweenProcesses(tmp_path,monkeypatch):
+    clock=Clock()
+    monkeypatch.setattr(domainRegistry.time,'time',clock)
+    filename=str(tmp_path/'tricky.db')
+    first=DomainRegistry(filename,refreshSeconds=10)
+    second=DomainRegistry(filename,refreshSeconds=10)
+    clock.now+=1
+    first.add('http://a.com')
+    assert 'http://a.com' not in second # not looked yet
+    clock.now+=10
+    assert 'http://a.com' in second
+    clock.now+=1
+    first.discard('http://a.com')
+    clock.now+=10
+    assert 'http://a.com' not in second
+
+
+def test_purgeExpired(tmp_path,monkeypatch):
+    clock=Clock()
+    monkeypatch.setattr(domainRegistry.time,'time',clock)
+    registry=DomainRegistry(str(tmp_path/'tricky.db'),ttlSeconds=60)
+    registry.add('http://a.com')
+    clock.now+=61
+    registry.purgeExpired()
+    assert registry._db.execute('SELECT COUNT(*) FROM domains').fetchone()==(0,) # noqa: E501 # pylint: disable=line-too-long
+
+
+def test_concurrentAddAndLookup(tmp_path):
+    filename=str(tmp_path/'tricky.db')
+    registry=DomainRegistry(filename,refreshSeconds=0)
+
+    def work(i):
+        domain=f'http://{i%20}.com'
+        registry.add(domain)
+        assert domain in registry
+        return domain
+    with concurrent.futures.ThreadPoolExecutor(8) as pool:
+        domains=set(pool.map(work,range(200)))
+    assert set(registry)==domains
+    registry.close()
+    assert set(DomainRegistry(filename))==domains
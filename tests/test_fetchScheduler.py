@@ -0,0 +1,76 @@
+from webFetch.fetchScheduler import (FetchScheduler, hostOf, normalizeUrl,
+    hostOfUrl)
+
+
+def _drain(scheduler,isReady=None):
+    items=[]
+    while True:
+        item=scheduler.pop(isReady)
+        if item is None:
+            return items
+        items.append(item)
+
+
+def test_hostsTakeTurns():
+    scheduler=FetchScheduler()
+    for i in range(3):
+        scheduler.push(f'http://big.com/{i}')
+    scheduler.push('http://small.com/0')
+    scheduler.push('http://other.com/0')
+    assert len(scheduler)==5
+    assert _drain(scheduler)==[
+        'http://big.com/0','http://small.com/0','http://other.com/0',
+        'http://big.com/1','http://big.com/2']
+    assert not scheduler
+
+
+def test_higherPriorityFirst():
+    scheduler=FetchScheduler()
+    scheduler.push('http://a.com/low')
+    scheduler.push('http://b.com/low')
+    scheduler.push('http://a.com/high',priority=5)
+    scheduler.push('http://c.com/mid',priority=1)
+    assert _drain(scheduler)==[
+        'http://a.com/high','http://c.com/mid',
+        'http://b.com/low','http://a.com/low']
+
+
+def test_samePriorityIsFirstInFirstOut():
+    scheduler=FetchScheduler()
+    for i in range(5):
+        scheduler.push(f'http://a.com/{i}')
+    assert _drain(scheduler)==[f'http://a.com/{i}' for i in range(5)]
+
+
+def test_hostsThatAreNotReadyKeepTheirPlace():
+    scheduler=FetchScheduler()
+    scheduler.push('http://slow.com/0')
+    scheduler.push('http://fast.com/0')
+    scheduler.push('http://fast.com/1')
+    assert _drain(scheduler,lambda host: host!='http://slow.com')==[
+        'http://fast.com/0','http://fast.com/1']
+    assert len(scheduler)==1 and list(scheduler.hosts())==['http://slow.com']
+    assert scheduler.pop()=='http://slow.com/0'
+
+
+def test_explicitHost():
+    scheduler=FetchScheduler()
+    scheduler.push(('job',1),host='a')
+    scheduler.push(('job',2),host='a')
+    scheduler.push(('job',3),host='b')
+    assert _drain(scheduler)==[('job',1),('job',3),('job',2)]
+
+
+def test_clear():
+    scheduler=FetchScheduler()
+    scheduler.push('http://a.com/0')
+    scheduler.clear()
+    assert len(scheduler)==0 and scheduler.pop() is None
+
+
+def test_urls():
+    assert hostOf('https://a.com:8080/x/y')=='https://a.com:8080'
+    assert hostOf('not a url')==''
+    assert normalizeUrl('HTTP://A.com:80#top')=='http://a.com/'
+    assert normalizeUrl('https://a.com:443/x?q=1')=='https://a.com/x?q=1'
+    assert hostOfUrl('https://A.com:8080/x')=='a.com'
@@ -0,0 +1,115 @@
+import threading
+import email.utils
+from webFetch.freshness import (FreshnessPolicy, FRESH, STALE,
+    STALE_WHILE_REVALIDATE, parseCacheControl, refreshInBackground)
+
+
+NOW=1_700_000_000.0
+
+
+def _date(t:float)->str:
+    return email.utils.formatdate(t,usegmt=True)
+
+
+def test_parseCacheControl():
+    assert parseCacheControl('max-age=60, no-cache, private="x"')=={
+        'max-age':'60','no-cache':None,'private':'x'}
+    assert parseCacheControl(None)=={}
+
+
+def test_maxAge():
+    policy=FreshnessPolicy()
+    headers={'Cache-Control':'max-age=60'}
+    assert policy.evaluate(headers,NOW,NOW+59)==FRESH
+    assert policy.evaluate(headers,NOW,NOW+61)==STALE
+    # an Age from an upstream cache counts too
+    headers['Age']='30'
+    assert policy.evaluate(headers,NOW,NOW+31)==STALE
+
+
+def test_sMaxAgeOnlyForSharedCaches():
+    headers={'Cache-Control':'max-age=10, s-maxage=100'}
+    assert FreshnessPolicy().evaluate(headers,NOW,NOW+50)==STALE
+    assert FreshnessPolicy(shared=True).evaluate(headers,NOW,NOW+50)==FRESH
+
+
+def test_expires():
+    policy=FreshnessPolicy()
+    headers={'Date':_date(NOW),'Expires':_date(NOW+100)}
+    assert policy.evaluate(headers,NOW,NOW+99)==FRESH
+    assert policy.evaluate(headers,NOW,NOW+101)==STALE
+    assert policy.evaluate({'Expires':'0'},NOW,NOW)==STALE
+
+
+def test_expiresWithoutDateCountsFromTheFetch():
+    policy=FreshnessPolicy()
+    headers={'Expires':_date(NOW+100)}
+    assert policy.lifetime(headers,NOW)==100
+    assert policy.evaluate(headers,NOW,NOW+99)==FRESH
+    assert policy.evaluate(headers,NOW,NOW+101)==STALE
+
+
+def test_heuristicFromLastModified():
+    policy=FreshnessPolicy(heuristicFraction=0.1)
+    headers={'Date':_date(NOW),'Last-Modified':_date(NOW-1000)}
+    assert policy.lifetime(headers)==100
+    assert policy.evaluate(headers,NOW,NOW+99)==FRESH
+
+
+def test_noCacheAndMustRevalidate():
+    policy=FreshnessPolicy()
+    assert policy.evaluate({'Cache-Control':'no-cache, max-age=60'},NOW,NOW)==STALE # noqa: E501 # pylint: disable=line-too-long
+    headers={'Cache-Control':'max-age=1, must-revalidate, stale-while-revalidate=60'} # noqa: E501 # pylint: disable=line-too-long
+    assert policy.evaluate(headers,NOW,NOW+10)==STALE
+
+
+def test_staleWhileRevalidate():
+    policy=FreshnessPolicy()
+    headers={'Cache-Control':'max-age=10, stale-while-revalidate=60'}
+    assert policy.evaluate(headers,NOW,NOW+5)==FRESH
+    assert policy.evaluate(headers,NOW,NOW+30)==STALE_WHILE_REVALIDATE
+    assert policy.evaluate(headers,NOW,NOW+80)==STALE
+
+
+def test_unknownFetchTimeIsFresh():
+    assert FreshnessPolicy().evaluate({'Cache-Control':'max-age=0'},None)==FRESH # noqa: E501 # pylint: disable=line-too-long
+
+
+def test_isStorable():
+    assert not FreshnessPolicy().isStorable({'cache-control':'no-store'})
+    assert FreshnessPolicy().isStorable({'Cache-Control':'private'})
+    assert not FreshnessPolicy(shared=True).isStorable({'Cache-Control':'private'}) # noqa: E501 # pylint: disable=line-too-long
+
+
+def test_refreshInBackgroundRunsOncePerKey():
+    release=threading.Event()
+    done=threading.Event()
+    calls=[]
+
+    def refresh():
+        calls.append(1)
+        release.wait(5)
+        done.set()
+    assert refreshInBackground(('test',1),refresh)
+    assert not refreshInBackground(('test',1),refresh)
+    release.set()
+    assert done.wait(5)
+    assert calls==[1]
+
+
+def test_refreshInBackgroundLogsFailures(caplog):
+    done=threading.Event()
+
+    def refresh():
+        try:
+            raise ValueError('server went away')
+        finally:
+            done.set()
+    with caplog.at_level('ERROR',logger='webFetch.freshness'):
+        refreshInBackground(('test',2),refresh)
+        assert done.wait(5)
+        for _ in range(100):
+            if caplog.records:
+                break
+            threading.Event().wait(0.01)
+    assert 'server went away' in caplog.text
@@ -0,0 +1,51 @@
+import pytest
+pytest.importorskip('paths')
+from webFetch.WebFetch import JavascriptTrickDetector, hasJavascriptTricksRE # noqa: E402,E501 # pylint: disable=line-too-long
+
+
+LONG_TAG='<script type="text/javascript" '+'data-x="y" '*300+'src="app.js">'
+
+
+def _feed(detector,page,chunkSize):
+    for i in range(0,len(page),chunkSize):
+        result=detector.feed(page[i:i+chunkSize])
+        if result is not None:
+            return result
+    return detector.close()
+
+
+@pytest.mark.parametrize('trick',[
+    LONG_TAG,
+    '<script src="app.js"></script>',
+    'el.innerHTML = "<p>"',
+    'document.write  \n  ("<p>")'])
+@pytest.mark.parametrize('chunkSize',[1,7,100,1000,100000])
+def test_foundAcrossChunkBoundaries(trick,chunkSize):
+    page='<html><head></head><body>'+'x'*5000+trick+'y'*5000+'</body></html>'
+    assert hasJavascriptTricksRE.search(page) is not None
+    assert _feed(JavascriptTrickDetector(),page,chunkSize) is True
+
+
+@pytest.mark.parametrize('chunkSize',[1,100,100000])
+def test_cleanPage(chunkSize):
+    page='<html><head><title>a < b</title></head><body>'+'<p>x</p>'*1000+'</body></html>' # noqa: E501 # pylint: disable=line-too-long
+    detector=JavascriptTrickDetector()
+    assert _feed(detector,page,chunkSize) is False
+    assert not detector.found
+    # (a stray "<" does not keep the whole page around)
+    assert len(detector._tail)<=JavascriptTrickDetector.MAX_TAG
+
+
+def test_classifiesEarly():
+    detector=JavascriptTrickDetector(classifyLimit=1024)
+    assert detector.feed('<html><head></head><body>'+'x'*500) is None
+    assert detector.feed('x'*500,size=600) is False
+    assert detector.done and not detector.found
+    # anything after that is not looked at
+    assert detector.feed('<script src="late.js">') is False
+
+
+def test_waitsForTheEndOfTheHead():
+    detector=JavascriptTrickDetector(classifyLimit=10)
+    assert detector.feed('<html><head>'+'x'*100) is None
+    assert detector.feed('<script src="in-head.js">') is True
@@ -0,0 +1,114 @@
+import os
+import pickle
+import struct
+from webFetch.mappedStore import MappedStore, isMappedStore
+
+
+def test_roundTrip(tmp_path):
+    filename=tmp_path/'cache.wfc'
+    store=MappedStore(filename)
+    store['a']={'x':1}
+    store['b']=b'bytes'
+    assert store['a']=={'x':1} # (before it is saved)
+    store.save()
+    assert isMappedStore(filename)
+    store['a']={'x':2}
+    del store['b']
+    store['c']='new'
+    store.close()
+    store=MappedStore(filename)
+    assert {k:store[k] for k in store}=={'a':{'x':2},'c':'new'}
+    store.close()
+
+
+def test_saveOnlyWritesWhatChanged(tmp_path):
+    filename=tmp_path/'cache.wfc'
+    store=MappedStore(filename,compactRatio=1.1)
+    for i in range(2000):
+        store[f'http://example.com/page/{i}']=i
+    store.save()
+    before=os.path.getsize(filename)
+    store['http://example.com/page/0']=-1
+    store.save()
+    # one body and a one-entry index, not another copy of the whole index
+    assert os.path.getsize(filename)-before<200
+    store.close()
+    store=MappedStore(filename)
+    assert len(store)==2000
+    assert store['http://example.com/page/0']==-1
+    assert store['http://example.com/page/1999']==1999
+    store.close()
+
+
+def test_longIndexChainsAreCompacted(tmp_path):
+    filename=tmp_path/'cache.wfc'
+    store=MappedStore(filename,compactRatio=1.1,maxIndexChain=5)
+    for i in range(12):
+        store[str(i)]=i
+        store.save()
+        assert store._indexChain<=5
+    store.close()
+    store=MappedStore(filename)
+    assert {k:store[k] for k in store}=={str(i):i for i in range(12)}
+    store.close()
+
+
+def test_longIndexChainsDoNotRewriteTheBodies(tmp_path):
+    filename=tmp_path/'cache.wfc'
+    store=MappedStore(filename,maxIndexChain=5)
+    store['big']='x'*10000
+    store.save()
+    compactions=[]
+    store.compact=lambda:compactions.append(1)
+    for i in range(30):
+        store[str(i)]=i
+        if i%3==0:
+            del store[str(i)]
+        store.save()
+        assert store._indexChain<=5
+    # the indexes are not garbage, so this never needed compacting
+    assert not compactions
+    store.close()
+    store=MappedStore(filename)
+    expected={str(i):i for i in range(30) if i%3}
+    expected['big']='x'*10000
+    assert {k:store[k] for k in store}==expected
+    store.close()
+
+
+def test_unfinishedSaveIsIgnored(tmp_path):
+    filename=tmp_path/'cache.wfc'
+    store=MappedStore(filename,compactRatio=1.1)
+    store['a']=1
+    store.save()
+    store.close()
+    # a crash after the bodies were written but before the header was
+    with open(filename,'ab') as f:
+        f.write(pickle.dumps('half written'))
+    store=MappedStore(filename,compactRatio=1.1)
+    assert dict(store)=={'a':1}
+    store['b']=2
+    store.save()
+    store.close()
+    store=MappedStore(filename)
+    assert {k:store[k] for k in store}=={'a':1,'b':2}
+    store.close()
+
+
+def test_readsVersion1Files(tmp_path):
+    filename=tmp_path/'cache.wfc'
+    header=struct.Struct('>4sHQQ')
+    body=pickle.dumps('old page')
+    index=pickle.dumps({'a':(header.size,len(body))})
+    with open(filename,'wb') as f:
+        f.write(header.pack(b'WFMC',1,header.size+len(body),len(index)))
+        f.write(body)
+        f.write(index)
+    store=MappedStore(filename)
+    assert store['a']=='old page'
+    store['b']='new page'
+    store.close()
+    store=MappedStore(filename)
+    assert store._version==2
+    assert {k:store[k] for k in store}=={'a':'old page','b':'new page'}
+    store.close()
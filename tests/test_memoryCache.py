@@ -0,0 +1,90 @@
+from webFetch import memoryCache
+from webFetch.memoryCache import MemoryBudgetCache
+
+
+class Clock:
+    def __init__(self):
+        self.now=1000.0
+
+    def __call__(self)->float:
+        return self.now
+
+
+def test_staysWithinBudgetLru():
+    cache=MemoryBudgetCache(300,'lru')
+    for key in 'abc':
+        cache[key]=b'x'*100
+    cache['a'] # a is now the most recently used
+    cache['d']=b'x'*100
+    assert 'b' not in cache
+    assert all(key in cache for key in 'acd')
+    assert cache.residentBytes<=300
+    assert cache.stats()['evictions']==1
+
+
+def test_lfuKeepsTheFavourite():
+    cache=MemoryBudgetCache(200,'lfu')
+    cache['a']=b'x'*100
+    cache['b']=b'x'*100
+    for _ in range(3):
+        cache['a']
+    cache['c']=b'x'*100
+    assert 'a' in cache and 'b' not in cache
+
+
+def test_gdsfEvictsBigRarelyUsedFirst():
+    cache=MemoryBudgetCache(1000,'gdsf')
+    cache['big']=b'x'*800
+    cache['small']=b'x'*100
+    cache['small']
+    cache['another']=b'x'*200
+    assert 'big' not in cache
+    assert 'small' in cache and 'another' in cache
+
+
+def test_expiredEntriesAreNotContained(monkeypatch):
+    clock=Clock()
+    monkeypatch.setattr(memoryCache.time,'monotonic',clock)
+    cache=MemoryBudgetCache(1000,'ttl',ttlSeconds=10)
+    cache['a']=b'page'
+    assert 'a' in cache
+    clock.now+=11
+    assert 'a' not in cache
+    assert cache.get('a') is None
+    assert list(cache)==[]
+    assert cache.stats()['expirations']==1
+
+
+def test_expiredEntriesFallBackToTheBacking(monkeypatch):
+    clock=Clock()
+    monkeypatch.setattr(memoryCache.time,'monotonic',clock)
+    backing={}
+    cache=MemoryBudgetCache(1000,'ttl',ttlSeconds=10,backing=backing)
+    cache['a']=b'page'
+    clock.now+=11
+    assert 'a' in cache
+    assert backing=={'a':b'page'} # spilled on the way out
+    assert cache['a']==b'page'
+
+
+def test_writeBackSpillsAndReloads():
+    backing={}
+    cache=MemoryBudgetCache(150,'lru',backing=backing)
+    cache['a']=b'x'*100
+    assert backing=={}
+    cache['b']=b'y'*100
+    assert backing=={'a':b'x'*100}
+    assert cache['a']==b'x'*100 # (which pushes b out)
+    assert cache.stats()['spills']==2
+    assert set(backing)=={'a','b'}
+    del cache['a']
+    assert 'a' not in backing
+
+
+def test_peekDoesNotLoad():
+    backing={'a':b'x'*100}
+    cache=MemoryBudgetCache(1000,'lru',backing=backing)
+    assert cache.peek('a')==b'x'*100
+    assert cache.peek('nope') is None
+    assert cache.residentBytes==0
+    assert cache.stats()['misses']==0
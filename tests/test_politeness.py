@@ -0,0 +1,64 @@
+from conftest import reply
+from webFetch.politeness import TokenBucket, RobotsCache, PolitenessLimiter
+
+
+ROBOTS=b'User-agent: *\nDisallow: /private\nCrawl-delay: 4\n'
+
+
+def test_tokenBucket():
+    bucket=TokenBucket(2.0,burst=2)
+    now=bucket.lastUpdate
+    assert bucket.tryAcquire(now) and bucket.tryAcquire(now)
+    assert not bucket.tryAcquire(now)
+    assert bucket.waitTime(now)==0.5
+    assert bucket.tryAcquire(now+0.5)
+
+
+def test_unlimitedBucket():
+    bucket=TokenBucket(0)
+    assert all(bucket.tryAcquire() for _ in range(100))
+
+
+def test_inFlightLimit():
+    limiter=PolitenessLimiter(requestsPerSecond=0,maxInFlight=2,robots=False)
+    assert limiter.acquire('http://a.com')
+    assert limiter.acquire('http://a.com')
+    assert not limiter.acquire('http://a.com')
+    assert limiter.isReady('http://b.com')
+    # only waiting on a request to finish, not on time
+    assert limiter.nextReadyIn(['http://a.com'])==float('inf')
+    limiter.release('http://a.com')
+    assert limiter.acquire('http://a.com')
+
+
+def test_rateLimit():
+    limiter=PolitenessLimiter(requestsPerSecond=1,maxInFlight=5,robots=False)
+    assert limiter.acquire('http://a.com')
+    limiter.release('http://a.com')
+    assert not limiter.isReady('http://a.com')
+    assert 0<limiter.nextReadyIn(['http://a.com'])<=1
+    assert limiter.nextReadyIn(['http://a.com','http://b.com'])==0
+
+
+def test_robots(server):
+    server.routes['/robots.txt']=lambda handler: reply(handler,ROBOTS,
+        Content_Type='text/plain')
+    limiter=PolitenessLimiter(requestsPerSecond=10)
+    assert limiter.allowed(server.url('/page'))
+    assert not limiter.allowed(server.url('/private/page'))
+    # slowed down to the Crawl-delay
+    assert limiter._bucket(server.url('')).rate==0.25
+    # and only fetched the once
+    assert [r[1] for r in server.requests]==['/robots.txt']
+
+
+def test_missingRobotsAllowsEverything(server):
+    robots=RobotsCache()
+    assert robots.allowed(server.url('/private/page'))
+    assert robots.crawlDelay(server.url('')) is None
+    assert robots.isCached(server.url(''))
+
+
+def test_forbiddenRobotsDisallowsEverything(server):
+    server.routes['/robots.txt']=lambda handler: reply(handler,status=403)
+    assert not RobotsCache().allowed(server.url('/page'))
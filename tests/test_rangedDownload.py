@@ -0,0 +1,208 @@
+import json
+import hashlib
+import urllib.error
+import pytest
+from webFetch import rangedDownload
+from webFetch.rangedDownload import (downloadResumable, downloadHashed,
+    PART_EXT, META_EXT)
+
+
+BODY=bytes(range(256))*400 # 100KB
+
+
+class RangeServer:
+    """
+    serves BODY with an ETag, honoring Range and If-Range
+    """
+
+    def __init__(self,etag:str='"v1"'):
+        self.etag=etag
+        self.dropNext:int=0 # cut this many responses off half way
+        self.hangUpNext:int=0 # hang up on this many requests
+        self.failRanges:bool=False
+
+    def __call__(self,handler):
+        if self.hangUpNext:
+            self.hangUpNext-=1
+            handler.close_connection=True
+            return
+        body=BODY
+        status=200
+        headers={'ETag':self.etag,'Content-Type':'video/mp4',
+            'Accept-Ranges':'bytes'}
+        requested=handler.headers.get('Range')
+        ifRange=handler.headers.get('If-Range')
+        if requested and (ifRange is None or ifRange==self.etag):
+            if self.failRanges and requested!='bytes=0-0':
+                handler.send_error(503)
+                return
+            start,_,end=requested[len('bytes='):].partition('-')
+            start=int(start)
+            end=int(end) if end else len(BODY)-1
+            if start>=len(BODY):
+                handler.send_response(416)
+                handler.send_header('Content-Range',f'bytes */{len(BODY)}')
+                handler.send_header('Content-Length','0')
+                handler.end_headers()
+                return
+            body=BODY[start:end+1]
+            status=206
+            headers['Content-Range']=f'bytes {start}-{end}/{len(BODY)}'
+        handler.send_response(status)
+        for k,v in headers.items():
+            handler.send_header(k,v)
+        handler.send_header('Content-Length',str(len(body)))
+        handler.end_headers()
+        if self.dropNext:
+            self.dropNext-=1
+            handler.wfile.write(body[:len(body)//2])
+            handler.close_connection=True
+            return
+        handler.wfile.write(body)
+
+
+@pytest.fixture(autouse=True)
+def noBackoff(monkeypatch):
+    monkeypatch.setattr(rangedDownload,'_backoff',lambda attempt:None)
+
+
+def _leftovers(path):
+    return [p for p in path.parent.iterdir() if p.name!=path.name]
+
+
+def test_download(server,tmp_path):
+    server.routes['/big']=RangeServer()
+    path=tmp_path/'big.mp4'
+    assert downloadResumable(server.url('/big'),path)==(path,'video/mp4')
+    assert path.read_bytes()==BODY
+    assert _leftovers(path)==[]
+
+
+def test_resumesAPartialDownload(server,tmp_path):
+    server.routes['/big']=RangeServer()
+    path=tmp_path/'big.mp4'
+    (tmp_path/('big.mp4'+PART_EXT)).write_bytes(BODY[:1000])
+    (tmp_path/('big.mp4'+META_EXT)).write_text(json.dumps({
+        'url':server.url('/big'),'validator':'"v1"',
+        'length':len(BODY),'mime':'video/mp4'}))
+    downloadResumable(server.url('/big'),path)
+    assert path.read_bytes()==BODY
+    headers=server.requests[-1][2]
+    assert headers['Range']=='bytes=1000-' and headers['If-Range']=='"v1"'
+
+
+def test_startsOverIfTheFileChanged(server,tmp_path):
+    server.routes['/big']=RangeServer(etag='"v2"')
+    path=tmp_path/'big.mp4'
+    (tmp_path/('big.mp4'+PART_EXT)).write_bytes(b'x'*1000)
+    (tmp_path/('big.mp4'+META_EXT)).write_text(json.dumps({
+        'url':server.url('/big'),'validator':'"v1"',
+        'length':len(BODY),'mime':'video/mp4'}))
+    downloadResumable(server.url('/big'),path)
+    assert path.read_bytes()==BODY
+
+
+def test_resumesAfterTheConnectionDrops(server,tmp_path):
+    route=RangeServer()
+    route.dropNext=2
+    server.routes['/big']=route
+    path=tmp_path/'big.mp4'
+    downloadResumable(server.url('/big'),path)
+    assert path.read_bytes()==BODY
+    assert [r[2].get('Range') for r in server.requests]==[
+        None,f'bytes={len(BODY)//2}-',f'bytes={len(BODY)*3//4}-']
+
+
+def test_alreadyComplete(server,tmp_path):
+    server.routes['/big']=RangeServer()
+    path=tmp_path/'big.mp4'
+    (tmp_path/('big.mp4'+PART_EXT)).write_bytes(BODY)
+    (tmp_path/('big.mp4'+META_EXT)).write_text(json.dumps({
+        'url':server.url('/big'),'validator':'"v1"',
+        'length':len(BODY),'mime':'video/mp4'}))
+    _,_,digest=downloadHashed(server.url('/big'),path)
+    assert path.read_bytes()==BODY
+    assert digest==hashlib.sha256(BODY).hexdigest()
+
+
+def test_segmented(server,tmp_path):
+    server.routes['/big']=RangeServer()
+    path=tmp_path/'big.mp4'
+    downloadResumable(server.url('/big'),path,chunkSize=4096,segments=4,
+        minSegmentBytes=10*1024)
+    assert path.read_bytes()==BODY
+    ranges=sorted(r[2]['Range'] for r in server.requests[1:])
+    assert len(ranges)==4
+    assert _leftovers(path)==[]
+
+
+def test_segmentsDoNotSaveAfterEveryChunk(server,tmp_path,monkeypatch):
+    server.routes['/big']=RangeServer()
+    path=tmp_path/'big.mp4'
+    saves=[]
+    save=rangedDownload._PartFile._save
+
+    def countingSave(self):
+        saves.append(json.dumps(self.meta))
+        save(self)
+    monkeypatch.setattr(rangedDownload._PartFile,'_save',countingSave)
+    downloadResumable(server.url('/big'),path,chunkSize=1024,segments=4,
+        minSegmentBytes=10*1024)
+    assert path.read_bytes()==BODY
+    # (100 chunks) the reset, then once as each segment finishes
+    assert len(saves)<=5
+
+
+def test_interruptedSegmentsResume(server,tmp_path):
+    route=RangeServer()
+    server.routes['/big']=route
+    path=tmp_path/'big.mp4'
+    route.dropNext=4
+    with pytest.raises(OSError):
+        downloadResumable(server.url('/big'),path,chunkSize=1024,
+            segments=4,minSegmentBytes=10*1024,retries=0)
+    meta=json.loads((tmp_path/('big.mp4'+META_EXT)).read_text())
+    part=(tmp_path/('big.mp4'+PART_EXT)).read_bytes()
+    for start,_,written in meta['segments']:
+        assert written>0
+        assert part[start:start+written]==BODY[start:start+written]
+    del server.requests[:]
+    downloadResumable(server.url('/big'),path,chunkSize=1024,segments=4,
+        minSegmentBytes=10*1024)
+    assert path.read_bytes()==BODY
+    assert all(int(r[2]['Range'][len('bytes='):].partition('-')[0])%(len(BODY)//4) # noqa: E501 # pylint: disable=line-too-long
+        for r in server.requests)
+
+
+def test_probeIsRetried(server,tmp_path):
+    route=RangeServer()
+    route.hangUpNext=1
+    server.routes['/big']=route
+    path=tmp_path/'big.mp4'
+    downloadResumable(server.url('/big'),path,segments=2,
+        minSegmentBytes=10*1024)
+    assert path.read_bytes()==BODY
+
+
+def test_httpErrorsInSegmentsAreNotRetried(server,tmp_path):
+    route=RangeServer()
+    route.failRanges=True
+    server.routes['/big']=route
+    path=tmp_path/'big.mp4'
+    with pytest.raises(urllib.error.HTTPError):
+        downloadResumable(server.url('/big'),path,segments=2,
+            minSegmentBytes=10*1024,retries=5)
+    # the probe, then one try per segment
+    assert len(server.requests)==3
+
+
+@pytest.mark.parametrize('segments,dropNext',[(1,0),(1,1),(4,0)])
+def test_downloadHashed(server,tmp_path,segments,dropNext):
+    route=RangeServer()
+    route.dropNext=dropNext
+    server.routes['/big']=route
+    path=tmp_path/'big.mp4'
+    _,mime,digest=downloadHashed(server.url('/big'),path,
+        segments=segments,minSegmentBytes=10*1024)
+    assert mime=='video/mp4'
+    assert digest==hashlib.sha256(BODY).hexdigest()
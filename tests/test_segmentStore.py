@@ -0,0 +1,108 @@
+import os
+from pathlib import Path
+import pytest
+from webFetch.segmentStore import SegmentStore
+
+
+def _segments(directory):
+    return sorted(p.name for p in directory.glob('*.seg'))
+
+
+def test_roundTripAndReopen(tmp_path):
+    store=SegmentStore(tmp_path,backgroundCompaction=False)
+    store['a']={'x':1}
+    store['b']=b'bytes'
+    store['a']={'x':2}
+    del store['b']
+    store.close()
+    store=SegmentStore(tmp_path,backgroundCompaction=False)
+    assert dict(store)=={'a':{'x':2}}
+    store.close()
+
+
+def test_reopeningDoesNotLeaveEmptySegments(tmp_path):
+    for i in range(3):
+        store=SegmentStore(tmp_path,backgroundCompaction=False)
+        store[str(i)]=i
+        store.close()
+    assert len(_segments(tmp_path))==1
+    store=SegmentStore(tmp_path,backgroundCompaction=False)
+    assert sorted(store)==['0','1','2']
+    store.close()
+
+
+def test_tornWriteDropped(tmp_path):
+    store=SegmentStore(tmp_path,backgroundCompaction=False)
+    store['a']='first'
+    store['b']='second'
+    store.close()
+    filename=tmp_path/_segments(tmp_path)[-1]
+    with open(filename,'r+b') as f:
+        f.truncate(os.path.getsize(filename)-3)
+    store=SegmentStore(tmp_path,backgroundCompaction=False)
+    assert dict(store)=={'a':'first'}
+    # and appends carry on from a clean record boundary
+    store['c']='third'
+    store.close()
+    store=SegmentStore(tmp_path,backgroundCompaction=False)
+    assert dict(store)=={'a':'first','c':'third'}
+    store.close()
+
+
+def test_compactionReclaimsSpace(tmp_path):
+    store=SegmentStore(tmp_path,maxSegmentBytes=1024,
+        backgroundCompaction=False)
+    for i in range(200):
+        store[str(i%10)]='x'*100+str(i)
+    before=sum(p.stat().st_size for p in tmp_path.glob('*.seg'))
+    store.compact()
+    after=sum(p.stat().st_size for p in tmp_path.glob('*.seg'))
+    assert after<before/5
+    assert store['3']=='x'*100+'193'
+    assert all(p.stat().st_size>0 for p in tmp_path.glob('*.seg')
+        if p.name!=_segments(tmp_path)[-1])
+    store.close()
+    store=SegmentStore(tmp_path,maxSegmentBytes=1024,
+        backgroundCompaction=False)
+    assert {k:store[k] for k in store}=={
+        str(i):'x'*100+str(190+i) for i in range(10)}
+    store.close()
+
+
+def test_compactingTwiceLeavesNoEmptySegments(tmp_path):
+    store=SegmentStore(tmp_path,backgroundCompaction=False)
+    store['a']=1
+    store.compact()
+    store.compact()
+    assert len(_segments(tmp_path))==1
+    assert store['a']==1
+    del store['a']
+    store.compact()
+    store.close()
+    store=SegmentStore(tmp_path,backgroundCompaction=False)
+    assert len(store)==0
+    store.close()
+
+
+def test_crashDuringCompactionKeepsDeletesDeleted(tmp_path,monkeypatch):
+    store=SegmentStore(tmp_path,backgroundCompaction=False)
+    store['a']=1
+    store['b']=2
+    store.compact() # 'a' now lives in a compacted segment with a high id
+    del store['a'] # ..and its delete in a segment with a lower id
+    store['b']=3
+    unlink=Path.unlink
+    calls=[]
+
+    def crashingUnlink(self,*args,**kwargs):
+        calls.append(self.name)
+        if len(calls)>1:
+            raise OSError('simulated crash')
+        unlink(self,*args,**kwargs)
+    monkeypatch.setattr(Path,'unlink',crashingUnlink)
+    with pytest.raises(OSError):
+        store.compact()
+    monkeypatch.undo()
+    store=SegmentStore(tmp_path,backgroundCompaction=False)
+    assert dict(store)=={'b':3}
+    store.close()
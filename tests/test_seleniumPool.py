@@ -0,0 +1,119 @@
+import threading
+import pytest
+from webFetch.seleniumPool import SeleniumSessionPool
+
+
+class FakeSession:
+    """
+    stands in for a selenium session
+    """
+
+    def __init__(self,domain):
+        self.domain=domain
+        self.stopped=False
+        self.healthy=True
+
+    def get_eval(self,script):
+        if not self.healthy:
+            raise ConnectionError('browser went away')
+        return script
+
+    def stop(self):
+        self.stopped=True
+
+
+class Factory:
+    def __init__(self):
+        self.started=[]
+
+    def __call__(self,domain):
+        session=FakeSession(domain)
+        self.started.append(session)
+        return session
+
+
+def test_checkoutAndCheckin():
+    factory=Factory()
+    pool=SeleniumSessionPool(factory,maxSessions=2)
+    sel=pool.checkout('http://a.com')
+    pool.checkin(sel)
+    assert pool.checkout('http://a.com') is sel
+    assert pool.stats()=={'started':1,'reused':1,'recycled':0,
+        'idle':0,'busy':1}
+
+
+def test_perDomain():
+    factory=Factory()
+    pool=SeleniumSessionPool(factory,maxSessions=4)
+    with pool.session('http://a.com') as a:
+        pass
+    with pool.session('http://b.com') as b:
+        assert b is not a and b.domain=='http://b.com'
+    shared=SeleniumSessionPool(Factory(),perDomain=False)
+    with shared.session('http://a.com') as a:
+        pass
+    with shared.session('http://b.com') as b:
+        assert b is a
+
+
+def test_recycledAfterMaxPages():
+    factory=Factory()
+    pool=SeleniumSessionPool(factory,maxPagesPerSession=3)
+    for _ in range(7):
+        with pool.session('http://a.com'):
+            pass
+    assert len(factory.started)==3
+    assert [s.stopped for s in factory.started]==[True,True,False]
+    assert pool.stats()['recycled']==2
+
+
+def test_unhealthySessionsAreDropped():
+    factory=Factory()
+    pool=SeleniumSessionPool(factory)
+    with pool.session('http://a.com') as first:
+        pass
+    first.healthy=False
+    with pool.session('http://a.com') as second:
+        assert second is not first
+    assert first.stopped
+
+
+def test_failedPagesThrowTheSessionAway():
+    factory=Factory()
+    pool=SeleniumSessionPool(factory)
+    with pytest.raises(ValueError):
+        with pool.session('http://a.com'):
+            raise ValueError('page broke')
+    assert factory.started[0].stopped
+    assert pool.stats()['idle']==0
+
+
+def test_maxSessions():
+    factory=Factory()
+    pool=SeleniumSessionPool(factory,maxSessions=2)
+    a=pool.checkout('http://a.com')
+    b=pool.checkout('http://b.com')
+    with pytest.raises(TimeoutError):
+        pool.checkout('http://c.com',timeout=0.05)
+    got=[]
+    waiter=threading.Thread(target=lambda: got.append(
+        pool.checkout('http://c.com',timeout=5)))
+    waiter.start()
+    pool.checkin(a)
+    waiter.join()
+    # the idle session for another domain made way for the new one
+    assert got[0].domain=='http://c.com' and a.stopped
+    assert pool.stats()['busy']==2
+    pool.checkin(b)
+    pool.checkin(got[0])
+    pool.closeAll()
+    assert all(s.stopped for s in factory.started)
+
+
+def test_failedStartFreesTheSlot():
+    def broken(domain):
+        raise OSError('no browser')
+    pool=SeleniumSessionPool(broken,maxSessions=1)
+    for _ in range(2):
+        with pytest.raises(OSError):
+            pool.checkout('http://a.com',timeout=1)
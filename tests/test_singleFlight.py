@@ -0,0 +1,68 @@
+import threading
+import pytest
+from webFetch.singleFlight import SingleFlight
+
+
+def _together(n:int,fn)->list:
+    """
+    call fn from n threads at once
+    """
+    results=[None]*n
+    barrier=threading.Barrier(n)
+
+    def run(i):
+        barrier.wait()
+        try:
+            results[i]=fn()
+        except Exception as e:
+            results[i]=e
+    threads=[threading.Thread(target=run,args=(i,)) for i in range(n)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def test_concurrentCallsShareOneResult():
+    flight=SingleFlight()
+    release=threading.Event()
+    calls=[]
+
+    def work():
+        calls.append(1)
+        release.wait(5)
+        return object()
+
+    def call():
+        if not calls:
+            threading.Timer(0.2,release.set).start()
+        return flight.do('key',work)
+    results=_together(8,call)
+    assert len(calls)==1
+    assert all(r is results[0] for r in results)
+    stats=flight.stats()
+    assert stats['calls']==1 and stats['coalesced']==7
+    assert stats['inFlight']==0
+
+
+def test_concurrentCallsShareOneError():
+    flight=SingleFlight()
+    release=threading.Event()
+    threading.Timer(0.2,release.set).start()
+
+    def work():
+        release.wait(5)
+        raise ValueError('boom')
+    results=_together(4,lambda:flight.do('key',work))
+    assert all(isinstance(r,ValueError) for r in results)
+    assert flight.stats()['calls']==1
+
+
+def test_laterCallsRunAgain():
+    flight=SingleFlight()
+    assert flight.do('key',lambda:1)==1
+    assert flight.do('key',lambda:2)==2
+    with pytest.raises(KeyError):
+        flight.do('key',dict().__getitem__,'x')
+    assert not flight.inFlight('key')
@@ -0,0 +1,300 @@
+import os
+import time
+import threading
+import pytest
+from webFetch import memoryCache
+pytest.importorskip('paths')
+from conftest import reply # noqa: E402
+from webFetch.urlGetter import (UrlGetter, PickleCache, # noqa: E402
+    SegmentCache, MappedCache, SqliteCache, NormalUrlGetter,
+    CoalescingGetter, fetchMany, getDefaultGetter)
+from webFetch.freshness import FreshnessPolicy # noqa: E402
+from webFetch.fetchScheduler import normalizeUrl # noqa: E402
+from webFetch import urlGetter # noqa: E402
+from webFetch.webfetchTypes import WebFetchResponse # noqa: E402
+
+
+class Url:
+    """
+    a url object that, like paths.URL, is not a str
+    """
+
+    def __init__(self,url:str):
+        self.url=url
+        self.protocol=url.split(':',1)[0]
+
+    def __str__(self)->str:
+        return self.url
+
+    def __hash__(self)->int:
+        return hash(self.url)
+
+    def __eq__(self,other)->bool:
+        return str(self)==str(other)
+
+
+class CountingGetter(UrlGetter):
+    """
+    makes up a page for every url, and counts the gets
+    """
+
+    def __init__(self):
+        self.gets=[]
+
+    def get(self,url):
+        self.gets.append(str(url))
+        mime='image/png' if str(url).endswith('.png') else 'text/html'
+        return WebFetchResponse(f'page {url}'.encode('utf-8'),mime)
+
+
+class ExpiringGetter(CountingGetter):
+    """
+    makes up pages that are stale straight away, and holds up gets of
+    new pages until something has been revalidated
+    """
+
+    def __init__(self,cacheControl='max-age=0'):
+        CountingGetter.__init__(self)
+        self.cacheControl=cacheControl
+        self.revalidated=threading.Event()
+        self.revalidatedFirst=[]
+
+    def get(self,url):
+        if str(url).endswith('/new'):
+            self.revalidatedFirst.append(self.revalidated.wait(2))
+        data=CountingGetter.get(self,url)
+        return WebFetchResponse(data[0],data[1],
+            headers={'Cache-Control':self.cacheControl},
+            fetchTime=time.time())
+
+    def revalidate(self,url,cached):
+        self.revalidated.set()
+        return self.get(url)
+
+
+CACHES=[
+    (PickleCache,'page_cache.pkl'),
+    (SegmentCache,'page_cache.segments'),
+    (MappedCache,'page_cache.wfc')]
+ALL_CACHES=CACHES+[(SqliteCache,'page_cache.db')]
+
+
+@pytest.mark.parametrize('cacheClass,filename',CACHES)
+def test_roundTripWithUrlObjects(tmp_path,cacheClass,filename):
+    getter=CountingGetter()
+    cache=cacheClass(getter,str(tmp_path/filename))
+    url=Url('http://a.com/x')
+    assert cache.get(url)[0]==b'page http://a.com/x'
+    assert cache.get(url)[0]==b'page http://a.com/x'
+    assert cache.get(Url('http://a.com/x'))[0]==b'page http://a.com/x'
+    assert getter.gets==['http://a.com/x']
+    cache.flush()
+    del cache
+    cache=cacheClass(getter,str(tmp_path/filename))
+    assert cache.get(Url('http://a.com/x'))[0]==b'page http://a.com/x'
+    assert getter.gets==['http://a.com/x']
+    cache.unCache(Url('http://a.com/x'))
+    cache.get(Url('http://a.com/x'))
+    assert len(getter.gets)==2
+
+
+@pytest.mark.parametrize('cacheClass,filename',CACHES)
+def test_getManyAnswersHitsFromTheCache(tmp_path,cacheClass,filename):
+    getter=CountingGetter()
+    cache=cacheClass(getter,str(tmp_path/filename))
+    cache.get(Url('http://a.com/1'))
+    urls=[Url(f'http://a.com/{i}') for i in range(4)]
+    got=dict((str(url),data) for url,data in cache.getMany(urls))
+    assert sorted(got)==[str(url) for url in urls]
+    assert sorted(getter.gets)==[f'http://a.com/{i}' for i in range(4)]
+
+
+@pytest.mark.parametrize('cacheClass,filename',ALL_CACHES)
+def test_getManyRevalidatesAlongsideTheMisses(tmp_path,cacheClass,filename):
+    getter=ExpiringGetter()
+    cache=cacheClass(getter,str(tmp_path/filename),
+        freshness=FreshnessPolicy())
+    cache.get(Url('http://a.com/old'))
+    got=dict((str(url),data) for url,data in cache.getMany(
+        [Url('http://a.com/new'),Url('http://a.com/old')]))
+    assert sorted(got)==['http://a.com/new','http://a.com/old']
+    assert getter.revalidatedFirst==[True]
+
+
+@pytest.mark.parametrize('cacheClass,filename',ALL_CACHES)
+def test_backgroundRefreshesShareAKey(tmp_path,monkeypatch,
+    cacheClass,filename):
+    #
+    keys=[]
+    monkeypatch.setattr(urlGetter,'refreshInBackground',
+        lambda key,fn:keys.append(key))
+    getter=ExpiringGetter('max-age=0, stale-while-revalidate=60')
+    cache=cacheClass(getter,str(tmp_path/filename),
+        freshness=FreshnessPolicy())
+    url=Url('http://A.com/page')
+    cache.get(url)
+    cache.get(url)
+    list(cache.getMany([url]))
+    assert keys==[(id(cache),normalizeUrl(url))]*2
+
+
+@pytest.mark.parametrize('cacheClass,filename',CACHES)
+def test_softCacheWithUrlObjects(tmp_path,cacheClass,filename):
+    getter=CountingGetter()
+    cache=cacheClass(getter,str(tmp_path/filename))
+    url=Url('http://a.com/soft')
+    cache.get(url,persist=False)
+    cache.get(url,persist=False)
+    assert getter.gets==['http://a.com/soft']
+    assert list(cache.listPages(hardCache=False))
+
+
+def test_sqliteQueries(tmp_path):
+    getter=CountingGetter()
+    cache=SqliteCache(getter,str(tmp_path/'page_cache.db'))
+    for url in ('http://A.com/1','http://a.com/2.png','http://b.com/1'):
+        cache.get(Url(url))
+    assert cache.listPages(host='a.com')==['http://a.com/1','http://a.com/2.png'] # noqa: E501 # pylint: disable=line-too-long
+    assert cache.listPages(mime='image/')==['http://a.com/2.png']
+    assert cache.listPages(pattern='http://b.com/')==['http://b.com/1']
+    assert cache.listPages(since=0,mime='text/html',host='b.com')==['http://b.com/1'] # noqa: E501 # pylint: disable=line-too-long
+    plan=' '.join(str(row) for row in cache._db.execute(
+        "EXPLAIN QUERY PLAN SELECT normalizedUrl FROM pages WHERE mime GLOB 'image/*'")) # noqa: E501 # pylint: disable=line-too-long
+    assert 'pages_mime' in plan
+    other=SqliteCache(getter,str(tmp_path/'other.db'))
+    assert cache.copyTo(other,'http://a.com/')==2
+    assert other.lookup('http://a.com/2.png')[0]==b'page http://a.com/2.png'
+    assert cache.unCachePattern('http://a.com/')==['http://a.com/1','http://a.com/2.png'] # noqa: E501 # pylint: disable=line-too-long
+    assert cache.listPages()==['http://b.com/1']
+    cache.close()
+    other.close()
+
+
+def test_expiredSoftPagesAreFetchedAgain(tmp_path,monkeypatch):
+    now=[1000.0]
+    monkeypatch.setattr(memoryCache.time,'monotonic',lambda:now[0])
+    getter=CountingGetter()
+    cache=PickleCache(getter,str(tmp_path/'page_cache.pkl'),
+        maxSoftBytes=1024*1024,evictionPolicy='ttl',ttlSeconds=10)
+    url=Url('http://a.com/x')
+    cache.get(url,persist=False)
+    now[0]+=11
+    assert cache.get(url,persist=False)[0]==b'page http://a.com/x'
+    now[0]+=11
+    assert list(dict(cache.getMany([url],persist=False)))==[url]
+    assert len(getter.gets)==3
+
+
+def test_replacingAPageReleasesItsBlob(tmp_path):
+    from webFetch.blobStore import BlobStore
+    blobs=BlobStore(str(tmp_path/'blobs'))
+    getter=CountingGetter()
+    cache=SegmentCache(getter,str(tmp_path/'page_cache.segments'),
+        blobStore=blobs,maxHardBytes=1)
+    url=Url('http://a.com/x')
+    cache.get(url)
+    cache.get(url,refetch=True)
+    assert len(getter.gets)==2
+    # (only the lookup, not replacing it, loaded it from disk)
+    assert cache.memoryStats()['hard']['misses']==1
+    assert blobs.stats()['references']==1
+
+
+def test_mappedCacheConvertsAPickleCache(tmp_path):
+    filename=str(tmp_path/'page_cache.pkl')
+    getter=CountingGetter()
+    old=PickleCache(getter,filename)
+    old.get(Url('http://a.com/x'))
+    old.flush()
+    del old
+    cache=MappedCache(getter,filename)
+    assert cache.get(Url('http://a.com/x'))[0]==b'page http://a.com/x'
+    assert getter.gets==['http://a.com/x']
+    assert not os.path.exists(filename+'.bak')
+
+
+def _etagPage(handler):
+    if handler.headers.get('If-None-Match')=='"v1"':
+        reply(handler,status=304,ETag='"v1"',Cache_Control='max-age=60')
+    else:
+        reply(handler,b'<p>v1</p>',ETag='"v1"',Cache_Control='max-age=0')
+
+
+def test_revalidateWith304(server):
+    server.routes['/page']=_etagPage
+    getter=NormalUrlGetter()
+    first=getter.get(server.url('/page'))
+    assert first[0]==b'<p>v1</p>' and first.getheader('ETag')=='"v1"'
+    again=getter.revalidate(server.url('/page'),first)
+    assert again.notModified and again[0]==b'<p>v1</p>'
+    assert again.getheader('Cache-Control')=='max-age=60'
+    assert server.requests[-1][2].get('If-None-Match')=='"v1"'
+
+
+def test_cacheRevalidatesStalePages(tmp_path,server):
+    server.routes['/page']=_etagPage
+    cache=SegmentCache(NormalUrlGetter(),str(tmp_path/'cache'),
+        freshness=FreshnessPolicy())
+    url=Url(server.url('/page'))
+    assert cache.get(url)[0]==b'<p>v1</p>'
+    # max-age=0, so this asks the server, which says 304
+    second=cache.get(url)
+    assert second[0]==b'<p>v1</p>' and second.notModified
+    assert len(server.requests)==2
+    # and the 304 made it fresh for another minute
+    assert cache.get(url)[0]==b'<p>v1</p>'
+    assert len(server.requests)==2
+
+
+def test_fetchManyCoalescesTheSameUrl(server):
+    def slowPage(handler):
+        time.sleep(0.3)
+        reply(handler,b'<p>slow</p>')
+    server.routes['/slow']=slowPage
+    url=server.url('/slow')
+    got=list(fetchMany([url,url,url+'#frag',url]))
+    assert len(got)==4
+    assert all(data[0]==b'<p>slow</p>' for _,data in got)
+    assert len(server.requests)==1
+    assert isinstance(getDefaultGetter(),CoalescingGetter)
+
+
+@pytest.mark.parametrize('cacheClass,filename',CACHES)
+def test_janitorEvictsPersistedPages(tmp_path,cacheClass,filename):
+    cache=cacheClass(CountingGetter(),str(tmp_path/filename),maxEntries=2,
+        diskEvictionPolicy='lfu',janitorInterval=3600)
+    assert cache.janitor is not None
+    assert cache.janitor.maxEntries==2
+    for page in 'abc':
+        cache.get(Url(f'http://a.com/{page}'))
+    cache.get(Url('http://a.com/a'))
+    cache.get(Url('http://a.com/c'))
+    cache.janitor.sweep()
+    cache.janitor.stop()
+    again=cacheClass(CountingGetter(),str(tmp_path/filename))
+    assert sorted(str(p) for p in again.listPages())==[
+        'http://a.com/a','http://a.com/c']
+
+
+def test_pagesAreWrittenWithoutHoldingTheLock(tmp_path):
+    cache=PickleCache(CountingGetter(),str(tmp_path/'page_cache.pkl'))
+    cache.get(Url('http://a.com/a'),autoflush=False)
+    lockFree=[]
+
+    def save(hard):
+        # could another thread get at the cache meanwhile?
+        def tryLock():
+            if cache._lock.acquire(timeout=5):
+                cache._lock.release()
+                lockFree.append(True)
+            else:
+                lockFree.append(False)
+        thread=threading.Thread(target=tryLock)
+        thread.start()
+        thread.join()
+        PickleCache._saveHardCache(cache,hard)
+    cache._saveHardCache=save
+    cache.flush()
+    assert lockFree==[True]
+    cache.flush() # nothing changed since
+    assert lockFree==[True]
@@ -0,0 +1,39 @@
+import pickle
+from webFetch.webfetchTypes import WebFetchResponse
+
+
+def test_isStillA2Tuple():
+    response=WebFetchResponse(b'body','text/html',200,{'ETag':'"1"'},5.0)
+    data,mime=response
+    assert (data,mime)==(b'body','text/html')
+    assert response.getheader('etag')=='"1"'
+    assert response.getheader('nope','default')=='default'
+
+
+def test_pickles():
+    response=WebFetchResponse(b'body','text/html',203,{'ETag':'"1"'},5.0)
+    copy=pickle.loads(pickle.dumps(response))
+    assert copy==response
+    assert (copy.status,copy.headers,copy.fetchTime)==(203,{'ETag':'"1"'},5.0) # noqa: E501 # pylint: disable=line-too-long
+
+
+def test_conditionalHeaders():
+    response=WebFetchResponse(b'body','text/html',200,{
+        'etag':'"abc"','Last-Modified':'Wed, 21 Oct 2015 07:28:00 GMT'})
+    assert response.conditionalHeaders()=={
+        'If-None-Match':'"abc"',
+        'If-Modified-Since':'Wed, 21 Oct 2015 07:28:00 GMT'}
+    assert WebFetchResponse(b'','text/html').conditionalHeaders()=={}
+
+
+def test_refreshedBy304():
+    cached=WebFetchResponse(b'body','text/html',200,
+        {'ETag':'"1"','Content-Length':'4','Cache-Control':'max-age=10'},5.0)
+    notModified=WebFetchResponse(b'',None,304,
+        {'etag':'"1"','Content-Length':'0','Cache-Control':'max-age=60'},9.0)
+    fresh=cached.refreshed(notModified)
+    assert fresh.notModified
+    assert fresh[0]==b'body' and fresh[1]=='text/html'
+    assert fresh.status==200 and fresh.fetchTime==9.0
+    assert fresh.getheader('Cache-Control')=='max-age=60'
+    assert fresh.getheader('Content-Length')=='4'
@@ -6,9 +6,112 @@ import typing
 import pickle
 import os
 import sys
+import time
+import json
+import sqlite3
+import threading
+import queue
+import concurrent.futures
 from paths import URLCompatible, asUrl
 from .WebFetch import WebFetch
-from .webfetchTypes import WebFetchResult, HttpMethod
+from .connectionPool import urlopen
+from .webfetchTypes import WebFetchResult, WebFetchResponse, HttpMethod
+from .fetchScheduler import normalizeUrl, hostOfUrl
+from .singleFlight import SingleFlight
+from .segmentStore import SegmentStore
+from .mappedStore import MappedStore, isMappedStore
+from .blobStore import BlobStore, BlobRef
+from .memoryCache import MemoryBudgetCache, EvictionPolicy, sizeOf
+from .cacheJanitor import CacheJanitor
+from .freshness import (FreshnessPolicy, FRESH, STALE,
+    STALE_WHILE_REVALIDATE, refreshInBackground)
+from .rangedDownload import downloadResumable, PART_EXT, META_EXT
+
+
+def _patternRegex(pattern:str)->typing.Pattern:
+    """
+    compile a command line page pattern, where * matches anything,
+    into a regex (matched against the start of the url)
+    """
+    import re
+    regex=re.escape(pattern)
+    regex=regex.replace('\\*','.*') # return the kleen stars
+    return re.compile(regex)
+
+
+def _patternGlob(pattern:str)->str:
+    """
+    convert a command line page pattern into an sqlite GLOB
+    (matched against the start of the normalized url)
+    """
+    if '://' in pattern:
+        # scheme and host are lowercase in normalized urls
+        scheme,rest=pattern.split('://',1)
+        host,slash,path=rest.partition('/')
+        pattern=scheme.lower()+'://'+host.lower()+slash+path
+    glob=pattern.replace('[','[[]').replace('?','[?]')
+    if not glob.endswith('*'):
+        glob+='*'
+    return glob
+
+
+GetManyResults=typing.Generator[
+    typing.Tuple[URLCompatible,typing.Union[WebFetchResult,Exception]],
+    None,None]
+
+
+def _runConcurrently(
+    fn:typing.Callable[[URLCompatible],WebFetchResult],
+    urls:typing.Iterable[URLCompatible],
+    concurrency:int=8
+    )->GetManyResults:
+    """
+    call fn(url) for each url on a pool of worker threads
+
+    :yield: (url,result) in the order they complete.  If a call fails,
+        the exception is yielded in place of the result.
+    """
+    urls=list(urls)
+    if not urls:
+        return
+    with concurrent.futures.ThreadPoolExecutor(
+        max(1,min(concurrency,len(urls)))) as pool:
+        #
+        futures={pool.submit(fn,url):url for url in urls}
+        for future in concurrent.futures.as_completed(futures):
+            try:
+                yield futures[future],future.result()
+            except Exception as e:
+                yield futures[future],e
+
+
+def _interleave(*results:GetManyResults)->GetManyResults:
+    """
+    run several getMany()s at the same time, each drained by its own
+    thread
+
+    :yield: (url,result) from any of them, in the order they complete
+    """
+    done=object()
+    completed:queue.Queue=queue.Queue()
+
+    def drain(items:GetManyResults)->None:
+        try:
+            for item in items:
+                completed.put(item)
+        finally:
+            completed.put(done)
+    with concurrent.futures.ThreadPoolExecutor(len(results)) as pool:
+        futures=[pool.submit(drain,items) for items in results]
+        remaining=len(futures)
+        while remaining:
+            item=completed.get()
+            if item is done:
+                remaining-=1
+            else:
+                yield item
+        for future in futures:
+            future.result() # if a whole getMany() failed, say so
 
 
 class UrlGetter:
@@ -21,6 +124,48 @@ class UrlGetter:
         """
         Get a url and return the bytes and MimeType of the result
         """
+
+    def revalidate(self,
+        url:URLCompatible,
+        cached:WebFetchResult
+        )->WebFetchResult:
+        """
+        Get a url we already have a copy of.
+
+        Getters that can will ask the server to only send the page if
+        it has changed, and if it has not, return the cached copy
+        refreshed (with notModified=True).  By default this simply
+        gets it again.
+        """
+        _=cached
+        return self.get(url)
+
+    def fetch(self,url:URLCompatible)->WebFetchResult:
+        """
+        Same as get() (so a getter can be the fetcher of a caching.Cache)
+        """
+        return self.get(url)
+
+    def getMany(self,
+        urls:typing.Iterable[URLCompatible],
+        concurrency:int=8
+        )->GetManyResults:
+        """
+        Get a batch of urls at once
+
+        By default this calls get() on a pool of worker threads.
+        Getters that can do better (eg caches answering hits right away)
+        override it.
+
+        :param urls: urls to get
+        :type urls: typing.Iterable[URLCompatible]
+        :param concurrency: how many to get at once, defaults to 8
+        :type concurrency: int, optional
+        :yield: (url,result) in the order they complete.  If a get fails,
+            the exception is yielded in place of the result.
+        :rtype: GetManyResults
+        """
+        return _runConcurrently(self.get,urls,concurrency)
 WebpageGetter=UrlGetter
 
 
@@ -32,7 +177,7 @@ class NormalUrlGetter(UrlGetter):
     def __init__(self,proxy:URLCompatible=None,timeoutSeconds:float=2.0):
         """
         This normal getter can get file:// urls
-        and http:// https:// urls using urllib2
+        and http:// https:// urls using the shared connection pool
         """
         self.proxy=proxy
         self._webfetch=WebFetch()
@@ -41,7 +186,8 @@ class NormalUrlGetter(UrlGetter):
     def get(self,
         url:URLCompatible,
         userAgent:str='Mozilla/5.0 (Windows NT 6.1; Win64; x64; rv:74.0) Gecko/20100101 Firefox/74.0', # noqa: E501 # pylint: disable=line-too-long
-        method:typing.Union[str,HttpMethod]='GET'
+        method:typing.Union[str,HttpMethod]='GET',
+        headers:typing.Optional[typing.Dict[str,str]]=None
         )->WebFetchResult:
         """
         Get a url
@@ -52,12 +198,16 @@ class NormalUrlGetter(UrlGetter):
         :type userAgent: str, optional
         :param method: HTTP method to use, defaults to 'GET'
         :type method: HttpMethod, optional
+        :param headers: any extra request headers, defaults to None.
+            If they make the request conditional, a 304 Not Modified
+            is returned rather than raised.
+        :type headers: typing.Optional[typing.Dict[str,str]], optional
         :return: a web fetch result
         :rtype: WebFetchResult
         """ # noqa: E501 # pylint: disable=line-too-long
         url=asUrl(url)
         if isinstance(method,HttpMethod):
-            method=str(method)
+            method=method.value
         data=None
         try:
             if url.isFile:
@@ -66,61 +216,413 @@ class NormalUrlGetter(UrlGetter):
                 #TODO: Should force this off to someobdy who does it better
                 #data=self._webfetch.fetchNow(
                 #   url,failoverOnGeneratedPages=True)
-                import urllib.request
-                req=urllib.request.Request(url)
+                requestHeaders={}
                 if userAgent is not None:
-                    req.add_header('User-Agent',userAgent)
-                if method is None or method!='GET':
-                    req.method=method
-                f=urllib.request.urlopen(req)
-                if not 200<=f.status<300:
-                    raise Exception('HTTP error: %d %s'%(f.status,f.reason))
-                mime=f.getheader('Content-Type')
-                data=f.read()
-                data=(data,mime)
+                    requestHeaders['User-Agent']=userAgent
+                if headers is not None:
+                    requestHeaders.update(headers)
+                if method is None:
+                    method='GET'
+                conditional=any(k.lower() in ('if-none-match','if-modified-since') # noqa: E501 # pylint: disable=line-too-long
+                    for k in requestHeaders)
+                f=urlopen(str(url),headers=requestHeaders,method=method)
+                try:
+                    if not 200<=f.status<300 \
+                        and not (f.status==304 and conditional):
+                        #
+                        raise Exception('HTTP error: %d %s'%(f.status,f.reason)) # noqa: E501 # pylint: disable=line-too-long
+                    mime=f.getheader('Content-Type')
+                    data=WebFetchResponse(f.read(),mime,f.status,
+                        dict(f.getheaders()),time.time())
+                finally:
+                    f.close()
         except Exception as e:
             print("ERR:",url)
             raise e
         return data
 
+    def revalidate(self,
+        url:URLCompatible,
+        cached:WebFetchResult
+        )->WebFetchResult:
+        """
+        Get a url we already have a copy of, sending If-None-Match /
+        If-Modified-Since from the copy's ETag / Last-Modified.
+
+        :return: the new page, or if the server says 304 Not Modified,
+            the cached copy refreshed (with notModified=True)
+        """
+        conditional={}
+        if isinstance(cached,WebFetchResponse):
+            conditional=cached.conditionalHeaders()
+        if not conditional:
+            return self.get(url)
+        data=self.get(url,headers=conditional)
+        if getattr(data,'status',200)==304:
+            return cached.refreshed(data)
+        return data
+
+    def fetchToFile(self,
+        url:URLCompatible,
+        path:str,
+        chunkSize:int=1024*1024,
+        resume:bool=True,
+        segments:int=1
+        )->WebFetchResult:
+        """
+        Get a url and stream it straight to disk
+
+        If the connection drops, it picks up where it left off with a
+        Range request (also across runs, by way of a .part file).
+
+        :param url: url to get
+        :type url: URLCompatible
+        :param path: where to save it
+        :type path: str
+        :param chunkSize: how much to hold in memory at a time, defaults to 1MB
+        :type chunkSize: int, optional
+        :param resume: if False, start over rather than resuming a
+            previous partial download
+        :type resume: bool, optional
+        :param segments: split large files into this many byte ranges
+            downloaded in parallel (if the server allows it)
+        :type segments: int, optional
+        :return: (path,mimetype)
+        :rtype: WebFetchResult
+        """
+        url=asUrl(url)
+        if not resume:
+            for ext in (PART_EXT,META_EXT):
+                try:
+                    os.remove(str(path)+ext)
+                except FileNotFoundError:
+                    pass
+        _,mime=downloadResumable(str(url),path,chunkSize,segments)
+        return (path,mime)
+
+
+class CoalescingGetter(UrlGetter):
+    """
+    Makes concurrent requests for the same (normalized) url share one
+    fetch.  Everybody waiting gets the same result, or the same error.
+
+    USAGE:
+        getter=PickleCache(CoalescingGetter(NormalUrlGetter()))
+    """
+
+    def __init__(self,urlGetter:UrlGetter):
+        self.urlGetter:UrlGetter=urlGetter
+        self.inFlight:SingleFlight=SingleFlight()
+
+    def _key(self,
+        kind:str,
+        url:URLCompatible,
+        kwargs:typing.Dict[str,typing.Any]
+        )->typing.Hashable:
+        if kwargs:
+            # differing options are different requests
+            return (kind,normalizeUrl(url),repr(sorted(kwargs.items())))
+        return (kind,normalizeUrl(url))
+
+    def get(self,url:URLCompatible,**kwargs)->WebFetchResult:
+        """
+        Get a url (sharing the fetch with anybody else getting it now)
+        """
+        return self.inFlight.do(self._key('get',url,kwargs),
+            self.urlGetter.get,url,**kwargs)
+
+    def revalidate(self,
+        url:URLCompatible,
+        cached:WebFetchResult
+        )->WebFetchResult:
+        """
+        Revalidate a url (sharing the fetch with anybody else
+        revalidating it now)
+        """
+        return self.inFlight.do(self._key('revalidate',url,{}),
+            self.urlGetter.revalidate,url,cached)
+
+    def stats(self)->typing.Dict[str,int]:
+        """
+        how many fetches were made, and how many were saved
+        """
+        return self.inFlight.stats()
+
 
 class PickleCache(UrlGetter):
     """
     Quickly cache the results using python pickle
     """
 
-    def __init__(self,urlGetter:UrlGetter,cacheFilename:str='page_cache.pkl'):
+    def __init__(self,
+        urlGetter:UrlGetter,
+        cacheFilename:str='page_cache.pkl',
+        blobStore:typing.Optional[BlobStore]=None,
+        maxSoftBytes:typing.Optional[int]=None,
+        maxHardBytes:typing.Optional[int]=None,
+        evictionPolicy:typing.Union[str,EvictionPolicy]='lru',
+        ttlSeconds:typing.Optional[float]=None,
+        freshness:typing.Optional[FreshnessPolicy]=None,
+        maxDiskBytes:typing.Optional[int]=None,
+        maxEntries:typing.Optional[int]=None,
+        maxAgeSeconds:typing.Optional[float]=None,
+        diskEvictionPolicy:typing.Union[str,EvictionPolicy]='lru',
+        janitorInterval:float=60.0):
+        """
+        :param blobStore: if given, bodies are kept in this shared
+            content-addressed store and the cache only holds references
+        :param maxSoftBytes: memory budget for non-persisted pages
+            (evicted ones are simply dropped).  None is unlimited.
+        :param maxHardBytes: memory budget for persisted pages held in
+            memory (evicted ones spill back to the hard cache file and
+            are reloaded on demand).  None is unlimited.
+            NOTE: a plain pickle file has to be loaded whole, so this
+            only really saves memory with a disk-backed hard cache
+            like SegmentCache
+        :param evictionPolicy: 'lru', 'lfu', 'ttl', or an EvictionPolicy
+        :param ttlSeconds: how long pages may stay in memory
+            (required for 'ttl')
+        :param freshness: if given, decides from the Cache-Control /
+            Expires headers when a cached page is stale and needs to be
+            fetched again.  If None, cached pages never go stale.
+        :param maxDiskBytes: evict persisted pages once they add up to
+            more than this (None is unlimited)
+        :param maxEntries: evict persisted pages once there are more
+            than this (None is unlimited)
+        :param maxAgeSeconds: evict persisted pages stored longer ago
+            than this (None keeps them forever)
+        :param diskEvictionPolicy: which persisted pages to evict when
+            over the limits.  'lru', 'lfu', 'gdsf' (size-aware), or an
+            EvictionPolicy
+        :param janitorInterval: how often (in seconds) the background
+            thread checks the limits
+        """
         self.urlGetter:UrlGetter=urlGetter
         self.cacheFilename:str=cacheFilename
-        self.__hardCache:typing.Optional[typing.Dict[str,str]]=None
-        self.__softCache:typing.Dict[str,str]={}
+        self.blobStore:typing.Optional[BlobStore]=blobStore
+        self.freshness:typing.Optional[FreshnessPolicy]=freshness
+        self.maxHardBytes:typing.Optional[int]=maxHardBytes
+        self.evictionPolicy:typing.Union[str,EvictionPolicy]=evictionPolicy
+        self.ttlSeconds:typing.Optional[float]=ttlSeconds
+        self.__hardCache:typing.Optional[typing.MutableMapping[str,typing.Any]]=None # noqa: E501 # pylint: disable=line-too-long
+        self.__softCache:typing.MutableMapping[str,typing.Any]={}
+        if maxSoftBytes is not None:
+            self.__softCache=MemoryBudgetCache(
+                maxSoftBytes,evictionPolicy,ttlSeconds)
         self._dirty:bool=False
+        self._lock=threading.RLock()
+        # held while writing to file (which is done without holding _lock)
+        self._saveLock=threading.Lock()
+        self.janitor:typing.Optional[CacheJanitor]=None
+        if maxDiskBytes is not None or maxEntries is not None \
+            or maxAgeSeconds is not None:
+            #
+            self.janitor=CacheJanitor(self,maxDiskBytes,maxEntries,
+                maxAgeSeconds,diskEvictionPolicy,janitorInterval)
+            self.janitor.start()
 
     def _caches(self):
         if self.__hardCache is None:
-            # open the file
-            if os.path.isfile(self.cacheFilename):
-                f=open(self.cacheFilename,'rb')
-                self.__hardCache=pickle.load(f)
-                f.close()
-                if not isinstance(self.__hardCache,typing.Mapping):
-                    self.__hardCache={}
-            else:
-                self.__hardCache={}
+            hard=self._loadHardCache()
+            if self.maxHardBytes is not None:
+                hard=MemoryBudgetCache(self.maxHardBytes,
+                    self.evictionPolicy,self.ttlSeconds,backing=hard)
+            self.__hardCache=hard
         return self.__hardCache,self.__softCache
 
+    def memoryStats(self)->typing.Dict[str,typing.Dict[str,int]]:
+        """
+        get resident bytes and eviction counts for the memory-budgeted
+        caches (keyed by 'soft' and 'hard')
+        """
+        hard,soft=self._caches()
+        stats={}
+        if isinstance(soft,MemoryBudgetCache):
+            stats['soft']=soft.stats()
+        if isinstance(hard,MemoryBudgetCache):
+            stats['hard']=hard.stats()
+        return stats
+
+    def _loadHardCache(self)->typing.MutableMapping[str,typing.Any]:
+        """
+        open the hard cache from file
+        (derived classes can override this to store things differently)
+        """
+        if os.path.isfile(self.cacheFilename):
+            f=open(self.cacheFilename,'rb')
+            hard=pickle.load(f)
+            f.close()
+            if isinstance(hard,typing.Mapping):
+                return hard
+        return {}
+
+    def _saveHardCache(self,hard:typing.MutableMapping[str,typing.Any])->None:
+        """
+        save the hard cache to file
+        (derived classes can override this to store things differently)
+        """
+        f=open(self.cacheFilename,'wb')
+        pickle.dump(hard,f)
+        f.close()
+
+    def _snapshotHardCache(self,
+        hard:typing.MutableMapping[str,typing.Any]
+        )->typing.MutableMapping[str,typing.Any]:
+        """
+        copy the hard cache, so it can be saved without holding the lock
+        (derived classes whose stores save themselves can return it as-is)
+        """
+        return dict(hard)
+
     def __del__(self):
         self.flush()
 
+    def _toEntry(self,data:WebFetchResult)->WebFetchResult:
+        """
+        swap the body for a blob reference (if there is a blob store)
+        """
+        if self.blobStore is None or not isinstance(data,tuple):
+            return data
+        return WebFetchResponse(self.blobStore.put(data[0]),data[1],
+            getattr(data,'status',200),getattr(data,'headers',None),
+            getattr(data,'fetchTime',None))
+
+    def _fromEntry(self,entry:WebFetchResult)->WebFetchResult:
+        """
+        swap a blob reference back for the body
+        """
+        if not isinstance(entry,tuple) or not isinstance(entry[0],BlobRef):
+            return entry
+        return WebFetchResponse(self.blobStore.get(entry[0]),entry[1],
+            getattr(entry,'status',200),getattr(entry,'headers',None),
+            getattr(entry,'fetchTime',None))
+
+    def _release(self,entry:typing.Optional[WebFetchResult])->None:
+        """
+        drop the blob reference an entry held (if any)
+        """
+        if isinstance(entry,tuple) and isinstance(entry[0],BlobRef):
+            self.blobStore.decref(entry[0])
+
+    def _key(self,url:URLCompatible)->typing.Any:
+        """
+        what a url is stored under
+        (derived classes whose stores need str keys override this)
+        """
+        return url
+
+    def _setHard(self,
+        hard:typing.MutableMapping[str,typing.Any],
+        url:URLCompatible,
+        data:WebFetchResult
+        )->None:
+        """
+        put an entry in the hard cache
+        """
+        entry=self._toEntry(data)
+        with self._lock:
+            old=None
+            if self.blobStore is not None and url in hard:
+                # (only needed to let go of its blob)
+                if isinstance(hard,MemoryBudgetCache):
+                    old=hard.peek(url)
+                else:
+                    old=hard[url]
+            hard[url]=entry
+            self._release(old)
+        if self.janitor is not None:
+            self.janitor.add(url,self._entrySize(entry),
+                getattr(entry,'fetchTime',None))
+
+    def _entrySize(self,entry:typing.Any)->int:
+        """
+        roughly how much disk an entry takes up
+        """
+        if isinstance(entry,tuple) and isinstance(entry[0],BlobRef):
+            try:
+                return os.path.getsize(self.blobStore.path(entry[0]))
+            except OSError:
+                return 0
+        return sizeOf(entry)
+
+    def _getHard(self,
+        hard:typing.MutableMapping[str,typing.Any],
+        url:URLCompatible
+        )->WebFetchResult:
+        """
+        get an entry from the hard cache
+        """
+        if self.janitor is not None:
+            self.janitor.touch(url)
+        return self._fromEntry(hard[url])
+
+    def _janitorEntries(self)->typing.Iterable[typing.Tuple[str,int,float]]:
+        """
+        every persisted page, how big it is, and when it was stored
+        (for the janitor)
+        """
+        hard,_=self._caches()
+        store=hard
+        if isinstance(hard,MemoryBudgetCache):
+            # look on disk, so as not to churn the memory tier
+            store=hard.backing
+        now=time.time()
+        for url in list(hard.keys()):
+            try:
+                entry=store[url] if url in store else hard[url]
+            except KeyError:
+                continue # removed while we were looking
+            yield (url,self._entrySize(entry),
+                getattr(entry,'fetchTime',None) or now)
+
+    def _janitorEvict(self,urls:typing.Iterable[str])->None:
+        """
+        remove pages (for the janitor)
+        """
+        with self._lock:
+            for url in urls:
+                self.unCache(url,autoflush=False)
+        self.flush()
+
+    def _freshness(self,cached:WebFetchResult)->str:
+        """
+        whether a cached page is FRESH, STALE_WHILE_REVALIDATE, or STALE
+        """
+        if self.freshness is None:
+            return FRESH
+        return self.freshness.evaluateResponse(cached)
+
+    def _isStorable(self,data:WebFetchResult)->bool:
+        """
+        whether the response allows itself to be cached
+        """
+        headers=getattr(data,'headers',None)
+        if self.freshness is None or headers is None:
+            return True
+        return self.freshness.isStorable(headers)
+
     def flush(self)->None:
         """
         flush the data to file
+
+        (the file is written from a snapshot, without holding the lock,
+        so that gets are not held up while it is written)
         """
-        if self._dirty:
-            f=open(self.cacheFilename,'wb')
-            pickle.dump(self.__hardCache,f)
-            f.close()
-            self._dirty=False
+        with self._saveLock:
+            with self._lock:
+                if not self._dirty:
+                    return
+                hard=self.__hardCache
+                if isinstance(hard,MemoryBudgetCache):
+                    hard.flush()
+                    hard=hard.backing
+                hard=self._snapshotHardCache(hard)
+                self._dirty=False
+            try:
+                self._saveHardCache(hard)
+            except BaseException:
+                self._dirty=True
+                raise
 
     def cache(self,
         url:URLCompatible,
@@ -132,8 +634,9 @@ class PickleCache(UrlGetter):
         add results to the cache
         """
         hard,soft=self._caches()
+        url=self._key(url)
         if hardCache:
-            hard[url]=data
+            self._setHard(hard,url,data)
             self._dirty=True
             if autoflush:
                 self.flush()
@@ -147,22 +650,88 @@ class PickleCache(UrlGetter):
         hard,soft=self._caches()
         if not isinstance(url,str):
             url=url.url
+        url=self._key(url)
         if url in soft:
             del soft[url]
-        if url in hard:
-            del hard[url]
+        with self._lock:
+            if url not in hard:
+                return
+            self._release(hard.pop(url))
             self._dirty=True
-            if autoflush:
-                self.flush()
+            if self.janitor is not None:
+                self.janitor.remove(url)
+        if autoflush:
+            self.flush()
 
-    def listPages(self,hardCache:bool=True)->typing.Iterable[str]:
+    def listPages(self,
+        hardCache:bool=True,
+        pattern:typing.Optional[str]=None
+        )->typing.Iterable[str]:
         """
         list pages from a certain cache
+
+        :param pattern: only list urls starting with this (* matches anything)
         """
         hard,soft=self._caches()
-        if hardCache:
-            return hard.keys()
-        return soft.keys()
+        pages=hard.keys() if hardCache else soft.keys()
+        if pattern is not None:
+            regex=_patternRegex(pattern)
+            pages=[p for p in pages if regex.match(p)]
+        return pages
+
+    def getMany(self,
+        urls:typing.Iterable[URLCompatible],
+        concurrency:int=8,
+        autoflush:bool=True,
+        persist:bool=True
+        )->GetManyResults:
+        """
+        Get a batch of urls at once
+
+        Cache hits are yielded right away, and only the misses are
+        sent on to the next getter (stale pages are revalidated).
+
+        :param concurrency: how many to get at once, defaults to 8
+        :param autoflush: save to file once the batch is done
+        :param persist: cached pages should be persisted to file
+        :yield: (url,result) in the order they complete.  If a get fails,
+            the exception is yielded in place of the result.
+        """
+        hard,soft=self._caches()
+        misses=[]
+        stale={}
+        for url in urls:
+            key=self._key(url)
+            cached=soft.get(key)
+            if cached is None and key in hard:
+                cached=self._getHard(hard,key)
+            if cached is None:
+                misses.append(url)
+                continue
+            state=self._freshness(cached)
+            if state==STALE:
+                stale[url]=cached
+                continue
+            if state==STALE_WHILE_REVALIDATE:
+                refreshInBackground((id(self),normalizeUrl(url)),
+                    lambda url=url: self.get(url,refetch=True,persist=persist))
+            yield url,cached
+        # (revalidating alongside the misses, not after them)
+        results=_interleave(
+            self.urlGetter.getMany(misses,concurrency),
+            _runConcurrently(lambda url: self.urlGetter.revalidate(url,stale[url]), # noqa: E501 # pylint: disable=line-too-long
+                stale,concurrency))
+        try:
+            for url,data in results:
+                if not isinstance(data,Exception) \
+                    and not str(url).startswith('file:') \
+                    and self._isStorable(data):
+                    #
+                    self.cache(url,data,autoflush=False,hardCache=persist)
+                yield url,data
+        finally:
+            if autoflush:
+                self.flush()
 
     def get(self,
         url:URLCompatible,
@@ -175,6 +744,8 @@ class PickleCache(UrlGetter):
         cache - used to turn off caching for an indivitual page
 
         refetch - used to force re-fetch of page
+            (if the cached copy has an ETag or Last-Modified, the server
+            is asked to only send it again if it has changed)
 
         autoflush - save to file immediatly
 
@@ -186,25 +757,534 @@ class PickleCache(UrlGetter):
         """
         if url.protocol=='file':
             cache=False # never cache local files
-        if cache and not refetch:
-            hard,soft=self._caches()
-            if url in soft:
-                return soft[url]
-            if url in hard:
-                return hard[url]
-        data=self.urlGetter.get(url)
+        hard,soft=self._caches()
+        key=self._key(url)
+        cached=None
+        if cache:
+            cached=soft.get(key)
+            if cached is None and key in hard:
+                cached=self._getHard(hard,key)
+            if cached is not None and not refetch:
+                state=self._freshness(cached)
+                if state==STALE_WHILE_REVALIDATE:
+                    refreshInBackground((id(self),normalizeUrl(url)),
+                        lambda: self.get(url,refetch=True,
+                            autoflush=autoflush,persist=persist))
+                if state!=STALE:
+                    return cached
+        if cached is not None:
+            data=self.urlGetter.revalidate(url,cached)
+        else:
+            data=self.urlGetter.get(url)
+        if cache and not self._isStorable(data):
+            cache=False
         if cache:
             # save changes to the appropriate cache
             if persist:
-                hard[url]=data
-                self._dirty=True
+                self._setHard(hard,key,data)
                 self._dirty=True
                 if autoflush:
                     self.flush()
             else:
-                soft[url]=data
+                soft[key]=data
+        return data
+
+
+class SegmentCache(PickleCache):
+    """
+    Same as PickleCache, but the hard cache is an append-only
+    segment log, so caching a page costs O(1) instead of re-pickling
+    the whole cache every time.
+
+    Here cacheFilename is a directory of segment files.
+    """
+
+    def __init__(self,
+        urlGetter:UrlGetter,
+        cacheFilename:str='page_cache.segments',
+        maxSegmentBytes:int=64*1024*1024,
+        blobStore:typing.Optional[BlobStore]=None,
+        maxSoftBytes:typing.Optional[int]=None,
+        maxHardBytes:typing.Optional[int]=None,
+        evictionPolicy:typing.Union[str,EvictionPolicy]='lru',
+        ttlSeconds:typing.Optional[float]=None,
+        freshness:typing.Optional[FreshnessPolicy]=None,
+        maxDiskBytes:typing.Optional[int]=None,
+        maxEntries:typing.Optional[int]=None,
+        maxAgeSeconds:typing.Optional[float]=None,
+        diskEvictionPolicy:typing.Union[str,EvictionPolicy]='lru',
+        janitorInterval:float=60.0):
+        """
+        :param maxSegmentBytes: start a new segment file after this size
+            (the other parameters are the same as PickleCache's)
+        """
+        self.maxSegmentBytes:int=maxSegmentBytes
+        PickleCache.__init__(self,urlGetter,cacheFilename,blobStore,
+            maxSoftBytes,maxHardBytes,evictionPolicy,ttlSeconds,freshness,
+            maxDiskBytes,maxEntries,maxAgeSeconds,diskEvictionPolicy,
+            janitorInterval)
+
+    def _key(self,url:URLCompatible)->str:
+        return str(url)
+
+    def _loadHardCache(self)->SegmentStore:
+        return SegmentStore(self.cacheFilename,self.maxSegmentBytes)
+
+    def _snapshotHardCache(self,hard:SegmentStore)->SegmentStore:
+        return hard
+
+    def _saveHardCache(self,hard:SegmentStore)->None:
+        # entries were already appended as they came in
+        hard.flush()
+
+
+class MappedCache(PickleCache):
+    """
+    Same as PickleCache, but the hard cache file is a small index plus
+    a memory-mapped body region, so opening it only costs as much as
+    reading the index, and each lookup only reads that one page.
+
+    An existing PickleCache file is converted the first time it is saved.
+    """
+
+    def __init__(self,
+        urlGetter:UrlGetter,
+        cacheFilename:str='page_cache.wfc',
+        blobStore:typing.Optional[BlobStore]=None,
+        maxSoftBytes:typing.Optional[int]=None,
+        maxHardBytes:typing.Optional[int]=None,
+        evictionPolicy:typing.Union[str,EvictionPolicy]='lru',
+        ttlSeconds:typing.Optional[float]=None,
+        freshness:typing.Optional[FreshnessPolicy]=None,
+        maxDiskBytes:typing.Optional[int]=None,
+        maxEntries:typing.Optional[int]=None,
+        maxAgeSeconds:typing.Optional[float]=None,
+        diskEvictionPolicy:typing.Union[str,EvictionPolicy]='lru',
+        janitorInterval:float=60.0):
+        """
+        (the parameters are the same as PickleCache's)
+        """
+        PickleCache.__init__(self,urlGetter,cacheFilename,blobStore,
+            maxSoftBytes,maxHardBytes,evictionPolicy,ttlSeconds,freshness,
+            maxDiskBytes,maxEntries,maxAgeSeconds,diskEvictionPolicy,
+            janitorInterval)
+
+    def _key(self,url:URLCompatible)->str:
+        return str(url)
+
+    def _loadHardCache(self)->MappedStore:
+        if os.path.isfile(self.cacheFilename) \
+            and not isMappedStore(self.cacheFilename):
+            #
+            # an old-style pickle cache
+            hard=PickleCache._loadHardCache(self)
+            os.replace(self.cacheFilename,self.cacheFilename+'.bak')
+            store=MappedStore(self.cacheFilename)
+            store.update((str(k),v) for k,v in hard.items())
+            store.save()
+            os.remove(self.cacheFilename+'.bak')
+            return store
+        return MappedStore(self.cacheFilename)
+
+    def _snapshotHardCache(self,hard:MappedStore)->MappedStore:
+        return hard
+
+    def _saveHardCache(self,hard:MappedStore)->None:
+        hard.save()
+
+
+class SqliteCache(UrlGetter):
+    """
+    Cache the results in an sqlite database
+
+    Along with the body, keeps the mimetype, http status, headers,
+    and when it was fetched.  Urls are indexed by normalized url, host,
+    mimetype, and fetch time, so lookups and pattern queries do not need
+    to scan (or even load) the whole cache.
+    """
+
+    def __init__(self,
+        urlGetter:UrlGetter,
+        cacheFilename:str='page_cache.db',
+        freshness:typing.Optional[FreshnessPolicy]=None):
+        """
+        :param freshness: if given, decides from the Cache-Control /
+            Expires headers when a cached page is stale and needs to be
+            fetched again.  If None, cached pages never go stale.
+        """
+        self.urlGetter:UrlGetter=urlGetter
+        self.cacheFilename:str=cacheFilename
+        self.freshness:typing.Optional[FreshnessPolicy]=freshness
+        self._softCache:typing.Dict[str,WebFetchResponse]={}
+        self._dirty:bool=False
+        self._lock=threading.RLock()
+        self._db=sqlite3.connect(cacheFilename,check_same_thread=False)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute("""CREATE TABLE IF NOT EXISTS pages (
+            normalizedUrl TEXT PRIMARY KEY,
+            url TEXT NOT NULL,
+            host TEXT NOT NULL,
+            body BLOB,
+            mime TEXT,
+            status INTEGER,
+            headers TEXT,
+            fetchTime REAL)""")
+        self._db.execute("""CREATE INDEX IF NOT EXISTS pages_host
+            ON pages(host)""")
+        self._db.execute("""CREATE INDEX IF NOT EXISTS pages_fetchTime
+            ON pages(fetchTime)""")
+        self._db.execute("""CREATE INDEX IF NOT EXISTS pages_mime
+            ON pages(mime)""")
+        self._db.commit()
+
+    def __del__(self):
+        self.close()
+
+    def flush(self)->None:
+        """
+        commit everything to file
+        """
+        with self._lock:
+            if self._dirty and self._db is not None:
+                self._db.commit()
+                self._dirty=False
+
+    def close(self)->None:
+        """
+        flush and close the file
+        """
+        with self._lock:
+            if getattr(self,'_db',None) is not None:
+                self.flush()
+                self._db.close()
+                self._db=None
+
+    def _toRow(self,
+        url:URLCompatible,
+        data:WebFetchResult
+        )->typing.Tuple[typing.Any,...]:
+        """
+        turn a result into a database row
+        """
+        status=getattr(data,'status',200)
+        headers=getattr(data,'headers',None) or {}
+        fetchTime=getattr(data,'fetchTime',None)
+        if fetchTime is None:
+            fetchTime=time.time()
+        body,mime=data
+        if isinstance(body,str):
+            body=body.encode('utf-8')
+        return (normalizeUrl(url),str(url),hostOfUrl(url),body,mime,status,
+            json.dumps(headers),fetchTime)
+
+    @staticmethod
+    def _fromRow(row:typing.Tuple[typing.Any,...])->WebFetchResponse:
+        """
+        turn a (body,mime,status,headers,fetchTime) row into a result
+        """
+        body,mime,status,headers,fetchTime=row
+        return WebFetchResponse(body,mime,status,
+            json.loads(headers) if headers else {},fetchTime)
+
+    def cache(self,
+        url:URLCompatible,
+        data:WebFetchResult,
+        autoflush:bool=True,
+        hardCache:bool=True
+        )->None:
+        """
+        add results to the cache
+        """
+        if not hardCache:
+            self._softCache[normalizeUrl(url)]=data
+            return
+        with self._lock:
+            self._db.execute(
+                'INSERT OR REPLACE INTO pages VALUES (?,?,?,?,?,?,?,?)',
+                self._toRow(url,data))
+            self._dirty=True
+            if autoflush:
+                self.flush()
+
+    def unCache(self,url:URLCompatible,autoflush:bool=True)->None:
+        """
+        remove results from the cache
+        """
+        normalized=normalizeUrl(url)
+        self._softCache.pop(normalized,None)
+        with self._lock:
+            self._db.execute('DELETE FROM pages WHERE normalizedUrl=?',
+                (normalized,))
+            self._dirty=True
+            if autoflush:
+                self.flush()
+
+    def unCachePattern(self,pattern:str,autoflush:bool=True)->typing.List[str]:
+        """
+        remove all pages whose url starts with a pattern (* matches anything)
+
+        :return: the urls that were removed
+        """
+        glob=_patternGlob(pattern)
+        with self._lock:
+            urls=[row[0] for row in self._db.execute(
+                '''SELECT normalizedUrl FROM pages WHERE normalizedUrl GLOB ?
+                ORDER BY normalizedUrl''',(glob,))]
+            self._db.execute('DELETE FROM pages WHERE normalizedUrl GLOB ?',
+                (glob,))
+            self._dirty=True
+            if autoflush:
+                self.flush()
+        for url in urls:
+            self._softCache.pop(url,None)
+        return urls
+
+    def listPages(self,
+        hardCache:bool=True,
+        pattern:typing.Optional[str]=None,
+        host:typing.Optional[str]=None,
+        since:typing.Optional[float]=None,
+        mime:typing.Optional[str]=None
+        )->typing.Iterable[str]:
+        """
+        list pages from a certain cache
+
+        :param pattern: only list urls starting with this (* matches anything)
+            Urls are listed in their normalized form.
+        :param host: only list pages from this host
+        :param since: only list pages fetched at or after this time.time()
+        :param mime: only list pages whose mimetype starts with this
+            (eg 'text/html' or 'image/')
+        """
+        if not hardCache:
+            pages=list(self._softCache.keys())
+            if pattern is not None:
+                regex=_patternRegex(pattern)
+                pages=[p for p in pages if regex.match(p)]
+            return pages
+        where=[]
+        params:typing.List[typing.Any]=[]
+        if pattern is not None:
+            where.append('normalizedUrl GLOB ?')
+            params.append(_patternGlob(pattern))
+        if host is not None:
+            where.append('host=?')
+            params.append(host.lower())
+        if since is not None:
+            where.append('fetchTime>=?')
+            params.append(since)
+        if mime is not None:
+            where.append('mime GLOB ?')
+            params.append(mime.replace('[','[[]').replace('?','[?]')+'*')
+        sql='SELECT normalizedUrl FROM pages'
+        if where:
+            sql+=' WHERE '+' AND '.join(where)
+        sql+=' ORDER BY normalizedUrl'
+        with self._lock:
+            return [row[0] for row in self._db.execute(sql,params)]
+
+    def lookup(self,url:URLCompatible)->typing.Optional[WebFetchResponse]:
+        """
+        get a page from the cache only (None if it is not there)
+        """
+        normalized=normalizeUrl(url)
+        data=self._softCache.get(normalized)
+        if data is not None:
+            return data
+        with self._lock:
+            row=self._db.execute(
+                """SELECT body,mime,status,headers,fetchTime FROM pages
+                WHERE normalizedUrl=?""",
+                (normalized,)).fetchone()
+        if row is None:
+            return None
+        return self._fromRow(row)
+
+    def copyTo(self,
+        other:'SqliteCache',
+        pattern:typing.Optional[str]=None
+        )->int:
+        """
+        copy pages into another SqliteCache (without decoding them)
+
+        :param pattern: only copy urls starting with this (* matches anything)
+        :return: how many pages were copied
+        """
+        sql='SELECT * FROM pages'
+        params:typing.Tuple[typing.Any,...]=()
+        if pattern is not None:
+            sql+=' WHERE normalizedUrl GLOB ?'
+            params=(_patternGlob(pattern),)
+        with self._lock:
+            rows=self._db.execute(sql,params).fetchall()
+        with other._lock:
+            other._db.executemany(
+                'INSERT OR REPLACE INTO pages VALUES (?,?,?,?,?,?,?,?)',rows)
+            other._db.commit()
+        return len(rows)
+
+    def get(self,
+        url:URLCompatible,
+        cache:bool=True,
+        refetch:bool=False,
+        autoflush:bool=True,
+        persist:bool=True
+        )->WebFetchResult:
+        """
+        cache - used to turn off caching for an indivitual page
+
+        refetch - used to force re-fetch of page
+            (if the cached copy has an ETag or Last-Modified, the server
+            is asked to only send it again if it has changed)
+
+        autoflush - save to file immediatly
+
+        persist - cached page should be persisted to file
+            (hard=False means the info will be dumped once program exits)
+
+        Returns the html from the cache, last fetch for this object, or
+        will go get it if it has to
+        """
+        if str(url).startswith('file:'):
+            cache=False # never cache local files
+        cached=None
+        if cache:
+            cached=self.lookup(url)
+            if cached is not None and not refetch:
+                state=FRESH
+                if self.freshness is not None:
+                    state=self.freshness.evaluateResponse(cached)
+                if state==STALE_WHILE_REVALIDATE:
+                    refreshInBackground((id(self),normalizeUrl(url)),
+                        lambda: self.get(url,refetch=True,
+                            autoflush=autoflush,persist=persist))
+                if state!=STALE:
+                    return cached
+        if cached is not None:
+            data=self.urlGetter.revalidate(url,cached)
+        else:
+            data=self.urlGetter.get(url)
+        if cache and self.freshness is not None \
+            and not self.freshness.isStorable(getattr(data,'headers',{})):
+            #
+            cache=False
+        if cache:
+            if getattr(data,'notModified',False) and persist \
+                and normalizeUrl(url) not in self._softCache:
+                #
+                self._touch(url,data,autoflush)
+            else:
+                self.cache(url,data,autoflush,persist)
         return data
 
+    def getMany(self,
+        urls:typing.Iterable[URLCompatible],
+        concurrency:int=8,
+        autoflush:bool=True,
+        persist:bool=True
+        )->GetManyResults:
+        """
+        Get a batch of urls at once
+
+        Cache hits are yielded right away, and only the misses are
+        sent on to the next getter (stale pages are revalidated).
+
+        :param concurrency: how many to get at once, defaults to 8
+        :param autoflush: commit to file once the batch is done
+        :param persist: cached pages should be persisted to file
+        :yield: (url,result) in the order they complete.  If a get fails,
+            the exception is yielded in place of the result.
+        """
+        misses=[]
+        stale={}
+        for url in urls:
+            cached=self.lookup(url)
+            if cached is None:
+                misses.append(url)
+                continue
+            state=FRESH
+            if self.freshness is not None:
+                state=self.freshness.evaluateResponse(cached)
+            if state==STALE:
+                stale[url]=cached
+                continue
+            if state==STALE_WHILE_REVALIDATE:
+                refreshInBackground((id(self),normalizeUrl(url)),
+                    lambda url=url: self.get(url,refetch=True,persist=persist))
+            yield url,cached
+        # (revalidating alongside the misses, not after them)
+        results=_interleave(
+            self.urlGetter.getMany(misses,concurrency),
+            _runConcurrently(lambda url: self.urlGetter.revalidate(url,stale[url]), # noqa: E501 # pylint: disable=line-too-long
+                stale,concurrency))
+        try:
+            for url,data in results:
+                storable=not isinstance(data,Exception) \
+                    and not str(url).startswith('file:') \
+                    and (self.freshness is None or
+                        self.freshness.isStorable(getattr(data,'headers',{})))
+                if storable:
+                    if getattr(data,'notModified',False) and persist:
+                        self._touch(url,data,autoflush=False)
+                    else:
+                        self.cache(url,data,autoflush=False,hardCache=persist)
+                yield url,data
+        finally:
+            if autoflush:
+                self.flush()
+
+    def _touch(self,
+        url:URLCompatible,
+        data:WebFetchResponse,
+        autoflush:bool=True
+        )->None:
+        """
+        bump the headers and fetch time of a page without
+        rewriting the body
+        """
+        with self._lock:
+            self._db.execute(
+                'UPDATE pages SET headers=?,fetchTime=? WHERE normalizedUrl=?',
+                (json.dumps(data.headers),data.fetchTime,normalizeUrl(url)))
+            self._dirty=True
+            if autoflush:
+                self.flush()
+
+
+def _openCache(cacheFilename:typing.Optional[str]=None)->UrlGetter:
+    """
+    open a cache file, choosing the kind of cache by file extension
+    """
+    if cacheFilename is None:
+        return PickleCache(UrlGetter())
+    if cacheFilename.endswith(('.db','.sqlite','.sqlite3')):
+        return SqliteCache(UrlGetter(),cacheFilename)
+    if cacheFilename.endswith('.wfc'):
+        return MappedCache(UrlGetter(),cacheFilename)
+    if cacheFilename.endswith('.segments'):
+        return SegmentCache(UrlGetter(),cacheFilename)
+    return PickleCache(UrlGetter(),cacheFilename)
+
+
+_defaultGetter:typing.Optional[UrlGetter]=None
+_defaultGetterLock=threading.Lock()
+
+
+def getDefaultGetter()->UrlGetter:
+    """
+    get the process-wide network getter used by fetch() and fetchMany()
+
+    It coalesces concurrent fetches of the same url, so that (for
+    instance) several threads all missing the cache for a popular page
+    only fetch it once.
+    """
+    global _defaultGetter
+    if _defaultGetter is None:
+        with _defaultGetterLock:
+            if _defaultGetter is None:
+                _defaultGetter=CoalescingGetter(NormalUrlGetter())
+    return _defaultGetter
+
 
 def fetch(
     url:URLCompatible,
@@ -214,7 +1294,7 @@ def fetch(
     """
     awesome shortcut routine to fetch a file from the web
     """
-    getter:UrlGetter=NormalUrlGetter()
+    getter:UrlGetter=getDefaultGetter()
     if cacheLocation is not None:
         getter=PickleCache(getter,cacheFilename=cacheLocation)
     _,_=cookies,userAgent # TODO: figure out how to pass into getters
@@ -222,74 +1302,82 @@ def fetch(
     return data
 
 
+def fetchMany(
+    urls:typing.Iterable[URLCompatible],
+    cacheLocation:str=None,
+    concurrency:int=8)->GetManyResults:
+    """
+    awesome shortcut routine to fetch a bunch of files from the web at once
+
+    :yield: (url,result) in the order they complete.  If a fetch fails,
+        the exception is yielded in place of the result.
+    """
+    getter:UrlGetter=getDefaultGetter()
+    if cacheLocation is not None:
+        getter=PickleCache(getter,cacheFilename=cacheLocation)
+    return getter.getMany(urls,concurrency)
+
+
 def cmdline(args):
     """
     Run the command line
 
     :param args: command line arguments (WITHOUT the filename)
     """
-    import re
+    cacheFilename=None
+    if args and args[0].startswith('--cache='):
+        cacheFilename=args[0].split('=',1)[1]
+        args=args[1:]
     if not args:
-        print('USEAGE:\n    urlGetter cmd')
+        print('USEAGE:\n    urlGetter [--cache=filename] cmd')
         print('CMDs:')
         print('    ls [pattern]')
         print('    get url')
         print('    fork pattern newfile')
         print('    rm pattern')
+        print('(a cache filename ending in .db or .sqlite is an SqliteCache,')
+        print(' and one ending in .wfc is a MappedCache)')
     else:
-        g=PickleCache(UrlGetter())
+        g=_openCache(cacheFilename)
         if args[0]=='ls':
-            pages=g.listPages()
+            pattern=None
             if len(args)>1:
-                regex=re.escape(' '.join(args[1:]))
-                regex=regex.replace('\\*','.*') # return the kleen stars
-                regex=re.compile(regex)
-                p2=[]
-                for p in pages:
-                    if regex.match(p):
-                        p2.append(p)
-                pages=p2
-            pages.sort()
+                pattern=' '.join(args[1:])
+            pages=sorted(g.listPages(pattern=pattern))
             print('\n'.join(pages))
         elif args[0]=='rm':
-            pages=g.listPages()
             if len(args)>1:
-                regex=re.escape(' '.join(args[1:]))
-                regex=regex.replace('\\*','.*') # return the kleen stars
-                regex=re.compile(regex)
-                p2=[]
-                for p in pages:
-                    if regex.match(p):
-                        p2.append(p)
-                pages=p2
-                pages.sort()
+                pattern=' '.join(args[1:])
+                if isinstance(g,SqliteCache):
+                    pages=g.unCachePattern(pattern)
+                else:
+                    pages=sorted(g.listPages(pattern=pattern))
+                    for p in pages:
+                        g.unCache(p,autoflush=False)
+                    g.flush()
                 for p in pages:
                     print('deleted '+p)
-                    g.unCache(p,autoflush=False)
-                g.flush()
             else:
                 print('ERR: Nothing to delete')
         elif args[0]=='get':
             if len(args)>1:
                 url=' '.join(args[1:])
-                print(g.get(url))
+                print(g.get(asUrl(url)))
             else:
                 print('ERR: Nothing to get')
         elif args[0]=='fork':
-            pages=g.listPages()
             if len(args)>2:
-                g2=PickleCache(UrlGetter(),cacheFilename=args[2])
-                regex=re.escape(args[1])
-                regex=regex.replace('\\*','.*') # return the kleen stars
-                regex=re.compile(regex)
-                p2=[]
-                for p in pages:
-                    if regex.match(p):
-                        p2.append(p)
-                pages=p2
-                for k in pages:
-                    g2.cache(k,g.get(k),autoflush=False)
-                g2.flush()
+                g2=_openCache(args[2])
+                if isinstance(g,SqliteCache) and isinstance(g2,SqliteCache):
+                    g.copyTo(g2,args[1])
+                else:
+                    pages=[asUrl(k) for k in g.listPages(pattern=args[1])]
+                    for k,data in g.getMany(pages):
+                        if isinstance(data,Exception):
+                            print('ERR:',k,data)
+                            continue
+                        g2.cache(k,data,autoflush=False)
+                    g2.flush()
             else:
                 print('requires pattern outfile')
         else:
@@ -94,6 +94,8 @@ class WebFetchPlus:
             The new object will be returned.
             if it is an array, just to make it so you don't have to
                 loop externally
+            (they are gotten one after another, since the getters
+            share WebFetch instances that are not thread-safe)
         """
         if isinstance(websites,list):
             results=[]
@@ -2,6 +2,7 @@
 all http method verbs
 """
 import typing
+import time
 from enum import Enum
 
 class HttpMethod(Enum):
@@ -17,3 +18,96 @@ class HttpMethod(Enum):
 MimeType=str
 
 WebFetchResult=typing.Tuple[bytes,MimeType]
+
+
+class WebFetchResponse(tuple):
+    """
+    A WebFetchResult (data,mimetype) that also remembers the http
+    status, response headers, and when it was fetched.
+
+    Since it is still a 2-tuple, anything expecting a WebFetchResult
+    can keep doing data,mime=result
+    """
+
+    def __new__(cls,
+        data:bytes,
+        mime:typing.Optional[MimeType],
+        status:int=200,
+        headers:typing.Optional[typing.Dict[str,str]]=None,
+        fetchTime:typing.Optional[float]=None):
+        """
+        :param fetchTime: the time.time() it was fetched (None if unknown)
+        """
+        self=tuple.__new__(cls,(data,mime))
+        self.status=status
+        self.headers=headers if headers is not None else {}
+        self.fetchTime=fetchTime
+        self.notModified=False
+        return self
+
+    def __getnewargs__(self):
+        return (self[0],self[1],self.status,self.headers,self.fetchTime)
+
+    @property
+    def data(self)->bytes:
+        """
+        the body
+        """
+        return self[0]
+
+    @property
+    def mime(self)->typing.Optional[MimeType]:
+        """
+        the mimetype
+        """
+        return self[1]
+
+    def getheader(self,
+        name:str,
+        default:typing.Optional[str]=None
+        )->typing.Optional[str]:
+        """
+        get a response header (case insensitive)
+        """
+        name=name.lower()
+        for k,v in self.headers.items():
+            if k.lower()==name:
+                return v
+        return default
+
+    def conditionalHeaders(self)->typing.Dict[str,str]:
+        """
+        request headers asking the server to only send the page
+        if it has changed since this copy
+        """
+        headers={}
+        etag=self.getheader('ETag')
+        if etag:
+            headers['If-None-Match']=etag
+        lastModified=self.getheader('Last-Modified')
+        if lastModified:
+            headers['If-Modified-Since']=lastModified
+        return headers
+
+    def refreshed(self,
+        notModified:'WebFetchResponse'
+        )->'WebFetchResponse':
+        """
+        this copy, brought up to date by a 304 Not Modified response
+        (same body, with the newer headers and fetch time)
+        """
+        headers=dict(self.headers)
+        for k,v in notModified.headers.items():
+            if k.lower() in ('content-length','content-encoding',
+                'transfer-encoding'):
+                #
+                continue # these describe the empty 304, not the page
+            for old in [o for o in headers if o.lower()==k.lower()]:
+                del headers[old]
+            headers[k]=v
+        fetchTime=notModified.fetchTime
+        if fetchTime is None:
+            fetchTime=time.time()
+        ret=WebFetchResponse(self[0],self[1],self.status,headers,fetchTime)
+        ret.notModified=True
+        return ret